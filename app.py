@@ -3,6 +3,8 @@
 # Entry point to the entire application. This file contains the
 # main infrastructure of the application.
 
+from util import startup
+
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -10,34 +12,70 @@ from PyQt6.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
+from PyQt6.QtCore import QTimer, pyqtSlot
 
-from util.patient import Patient
-from util.util import decryptData
-from widget_pages.dashboard import DashboardWindow
+from util.patient_cache import PatientCache
+from util.config import REPOSITORY_REPORT
+from util.connections import ConnectionManager
+from util.migrations import checkQueryPlans, migrate
+from util.repository import (
+    MeasurementRepository,
+    OncologistRepository,
+    PatientRepository,
+    repositoryStats,
+)
 from widget_pages.login import LoginWindow
-from widget_pages.patient_information import PatientInformationWindow
-from widget_pages.patient_list import PatientListWindow
-from widget_pages.patient_form import PatientFormWindow
-from widget_pages.oncologist_form import OncologistFormWindow
+from widget_pages.query_executor import QueryExecutor
 from widget_pages.toolbar import ToolBar
 
-import sqlite3
+import logging
+import threading
+
+startup.mark("imports")
+
+# pages other than the login page are built the first time they are shown, or
+# while the login page waits for the user (see warmUp), in this order
+DEFERRED_PAGES = (
+    "patientListWindow",
+    "patientInfoWindow",
+    "dashboardWindow",
+    "patientFormWindow",
+    "oncologistFormWindow",
+)
 
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
 
-        self.db_conn = sqlite3.connect("db.db")
+        # every thread gets its own connection, see getDatabaseConnection
+        self.database = ConnectionManager()
+        migrate(self.getDatabaseConnection())
+        checkQueryPlans(self.getDatabaseConnection())
+        # the pages read and write the database through these, see util/repository.py
+        self.measurementRepository = MeasurementRepository(self.database)
+        self.patientRepository = PatientRepository(
+            self.database, self.measurementRepository
+        )
+        self.oncologistRepository = OncologistRepository(self.database)
+        # queries made while navigating run off the GUI thread, see openPatient
+        self.queries = QueryExecutor(self.database)
 
         self.username = ""
-        self.password = ""
+        # CryptoContext of the logged in user, see LoginWindow.updateUser
+        self.crypto = None
         self.user_full_name = ""
         self.selected_patient = None
+        # decrypted patients of the logged in user, see updateSelectedPatient
+        self.patientCache = PatientCache()
         self.current_page = "Login"
         self.is_admin_user = False
         self.adding_new_patient = True
 
+        self.pages = {}
+        self._simulationJobs = None
+        self.backend = None
+
         pageLayout = QVBoxLayout()
         self.stackLayout = QStackedLayout()
         self.toolBar = ToolBar(self.current_page, self.user_full_name)
@@ -47,139 +85,190 @@ class MainWindow(QMainWindow):
         pageLayout.addLayout(self.stackLayout)
 
         self.loginWindow = LoginWindow()
-        self.patientListWindow = PatientListWindow()
-        self.patientInfoWindow = PatientInformationWindow()
-        self.dashboardWindow = DashboardWindow()
-        self.patientFormWindow = PatientFormWindow()
-        self.oncologistFormWindow = OncologistFormWindow()
         self.stackLayout.addWidget(self.loginWindow)
-        self.stackLayout.addWidget(self.patientListWindow)
-        self.stackLayout.addWidget(self.patientInfoWindow)
-        self.stackLayout.addWidget(self.dashboardWindow)
-        self.stackLayout.addWidget(self.patientFormWindow)
-        self.stackLayout.addWidget(self.oncologistFormWindow)
 
         widget = QWidget()
         widget.setLayout(pageLayout)
         self.setCentralWidget(widget)
         self.showMaximized()
 
+    # simulations run in the background, for several patients at the same time
+    @property
+    def simulationJobs(self):
+        if self._simulationJobs is None:
+            from widget_pages.simulation_jobs import SimulationJobs
+
+            self._simulationJobs = SimulationJobs()
+        return self._simulationJobs
+
+    # the page modules are only imported here, so that the login page is the
+    # only page on the startup path
+    def createPage(self, name):
+        if name == "patientListWindow":
+            from widget_pages.patient_list import PatientListWindow
+
+            page = PatientListWindow()
+            self.simulationJobs.statusChanged.connect(page.updateSimulationStatus)
+        elif name == "patientInfoWindow":
+            from widget_pages.patient_information import PatientInformationWindow
+
+            page = PatientInformationWindow()
+        elif name == "dashboardWindow":
+            from widget_pages.dashboard import DashboardWindow
+
+            page = DashboardWindow()
+            self.simulationJobs.statusChanged.connect(page.jobStatusChanged)
+            self.simulationJobs.progress.connect(page.appendJobProgress)
+        elif name == "patientFormWindow":
+            from widget_pages.patient_form import PatientFormWindow
+
+            page = PatientFormWindow()
+        elif name == "oncologistFormWindow":
+            from widget_pages.oncologist_form import OncologistFormWindow
+
+            page = OncologistFormWindow()
+        else:
+            raise KeyError(name)
+        self.stackLayout.addWidget(page)
+        return page
+
+    def getPage(self, name):
+        if name not in self.pages:
+            self.pages[name] = self.createPage(name)
+        return self.pages[name]
+
+    @property
+    def patientListWindow(self):
+        return self.getPage("patientListWindow")
+
+    @property
+    def patientInfoWindow(self):
+        return self.getPage("patientInfoWindow")
+
+    @property
+    def dashboardWindow(self):
+        return self.getPage("dashboardWindow")
+
+    @property
+    def patientFormWindow(self):
+        return self.getPage("patientFormWindow")
+
+    @property
+    def oncologistFormWindow(self):
+        return self.getPage("oncologistFormWindow")
+
+    def startBackend(self):
+        from simulation.backend import getBackend
+
+        backend = getBackend()
+        backend.start()
+        self.backend = backend
+
+    # builds the remaining pages one per event loop iteration once the login
+    # page is shown, so the user can type while they are built
+    def warmUp(self):
+        startup.mark("login page shown")
+        startup.report()
+        # importing the MATLAB engine takes a while, it is done off the GUI thread
+        threading.Thread(target=self.startBackend, daemon=True).start()
+        self.warmUpNextPage(list(DEFERRED_PAGES))
+
+    def warmUpNextPage(self, names):
+        if not names:
+            startup.mark("pages built")
+            startup.report()
+            return
+        self.getPage(names.pop(0))
+        QTimer.singleShot(0, lambda: self.warmUpNextPage(names))
+
     def updateUsername(self, username):
         self.username = username
-        res = self.db_conn.execute(
-            """
-            SELECT full_name
-            FROM oncologists o
-            WHERE o.username=?
-            """,
-            (username,),
-        )
-        row = res.fetchone()
-        self.user_full_name = ""
-        if row:
-            self.user_full_name = row[0]
+        self.user_full_name = self.oncologistRepository.fullName(username) or ""
         self.updateToolBar()
 
     def updateSelectedPatient(self, patient_id):
-        res = self.db_conn.execute(
-            """SELECT name, weight, height, patient_id, phone_number, birthday, age, 
-                      blood_type, all_type, body_surface_area, time, dosage_measurement, anc_measurement, oncologist_id, sex, user_id
-               FROM measurements m 
-               INNER JOIN patients p ON m.patient_id=p.id 
-                    AND m.patient_id=? ORDER BY time ASC
-            """,
-            (patient_id,),
-        )
-        records = res.fetchall()
-        if len(records) == 0:
-            res = self.db_conn.execute(
-                """SELECT name, weight, height, phone_number, birthday, age, 
-                        blood_type, all_type, body_surface_area, oncologist_id, sex, user_id
-                FROM patients p 
-                WHERE p.id=? 
-                """,
-                (patient_id,),
-            )
-            row = res.fetchone()
-            name = decryptData(row[0], self.password)
-            weight = decryptData(row[1], self.password)
-            height = decryptData(row[2], self.password)
-            phone_number = decryptData(row[3], self.password)
-            birthday = decryptData(row[4], self.password)
-            age = decryptData(row[5], self.password)
-            blood_type = decryptData(row[6], self.password)
-            all_type = decryptData(row[7], self.password)
-            body_surface_area = decryptData(row[8], self.password)
-            oncologist_id = row[9]
-            sex = decryptData(row[10], self.password)
-            user_id = decryptData(row[11], self.password)
-            anc_measurements = []
-            dosage_measurements = []
-            self.selected_patient = Patient(
+        self.simulationJobs.queue.prioritize(patient_id)
+        patient = self.patientCache.get(patient_id)
+        if patient is None:
+            patient = self.patientRepository.get(patient_id, self.crypto)
+            if patient is not None:
+                self.patientCache.put(patient)
+        self.selected_patient = patient
+
+    # shows the information page of a patient. A patient that is not cached is
+    # loaded off the GUI thread, the page shows a loading state until then
+    def openPatient(self, patient_id):
+        self.simulationJobs.queue.prioritize(patient_id)
+        self.selected_patient = self.patientCache.get(patient_id)
+        if self.selected_patient is None:
+            self.queries.submit(
+                "selectedPatient",
+                self.patientLoaded,
+                self.loadPatient,
                 patient_id,
-                user_id,
-                name,
-                weight,
-                height,
-                anc_measurements,
-                birthday,
-                dosage_measurements,
-                phone_number,
-                age,
-                blood_type,
-                all_type,
-                body_surface_area,
-                oncologist_id,
-                sex,
+                self.crypto,
             )
+            self.stackLayout.setCurrentWidget(self.patientInfoWindow)
+            self.current_page = "Patient Information"
+            self.updateToolBar()
+            self.patientInfoWindow.showLoading()
         else:
-            name = decryptData(records[0][0], self.password)
-            weight = decryptData(records[0][1], self.password)
-            height = decryptData(records[0][2], self.password)
-            patient_id = records[0][3]
-            phone_number = decryptData(records[0][4], self.password)
-            birthday = decryptData(records[0][5], self.password)
-            age = decryptData(records[0][6], self.password)
-            blood_type = decryptData(records[0][7], self.password)
-            all_type = decryptData(records[0][8], self.password)
-            body_surface_area = decryptData(records[0][9], self.password)
-            oncologist_id = records[0][13]
-            sex = decryptData(records[0][14], self.password)
-            user_id = decryptData(records[0][15], self.password)
-            anc_measurements = []
-            dosage_measurements = []
-            for row in records:
-                dosage_measurements.append((row[11], row[10]))
-                anc_measurements.append((row[12], row[10]))
-
-            self.selected_patient = Patient(
-                patient_id,
-                user_id,
-                name,
-                weight,
-                height,
-                anc_measurements,
-                birthday,
-                dosage_measurements,
-                phone_number,
-                age,
-                blood_type,
-                all_type,
-                body_surface_area,
-                oncologist_id,
-                sex,
-            )
+            self.queries.cancel("selectedPatient")
+            self.showPatientInformationWindow()
+
+    # runs on the query worker. The record of a patient is decrypted when one of
+    # its fields is first read, which is done here rather than on the GUI thread
+    def loadPatient(self, patient_id, crypto):
+        patient = self.patientRepository.get(patient_id, crypto)
+        if patient is not None:
+            patient.recordFields()
+        return patient
+
+    @pyqtSlot(object, str)
+    def patientLoaded(self, patient, error):
+        if patient is None:
+            logging.error(error or "The patient does not exist anymore")
+            self.showPatientListWindow()
+            return
+        self.patientCache.put(patient)
+        self.selected_patient = patient
+        self.patientInfoWindow.updatePatientInfo()
+
+    # to be called after writing a patient, so that it is loaded again and its
+    # simulation results are not shown for inputs it no longer has
+    def invalidatePatient(self, patient_id):
+        from simulation.cache import getSimulationCache
+
+        self.patientCache.invalidate(patient_id)
+        getSimulationCache().invalidatePatient(patient_id)
 
     def updateToolBar(self):
         self.toolBar.updateToolBar(self.current_page, self.user_full_name)
 
     def showLoginWindow(self):
-        self.stackLayout.setCurrentIndex(0)
+        # results of the previous user must not be shown to the next one
+        self.queries.cancelAll()
+        if self._simulationJobs is not None:
+            self._simulationJobs.queue.cancelAll()
+        if "patientListWindow" in self.pages:
+            self.pages["patientListWindow"].clearPatients()
+        self.patientCache.clear()
+        self.selected_patient = None
+        # the pages drop the patient they show
+        for name in ("patientInfoWindow", "dashboardWindow", "patientFormWindow"):
+            if name in self.pages:
+                self.pages[name].clearPatient()
+        if self.crypto is not None:
+            self.crypto.clear()
+            self.crypto = None
+        self.stackLayout.setCurrentWidget(self.loginWindow)
         self.current_page = "Login"
         self.updateToolBar()
 
     def showPatientListWindow(self):
-        self.stackLayout.setCurrentIndex(1)
+        # the patient that was being opened is not shown anymore
+        self.queries.cancel("selectedPatient")
+        self.stackLayout.setCurrentWidget(self.patientListWindow)
         if self.is_admin_user:
             self.current_page = "Oncologist List"
         else:
@@ -188,37 +277,54 @@ class MainWindow(QMainWindow):
         self.patientListWindow.updatePatientList()
 
     def showPatientInformationWindow(self):
-        self.stackLayout.setCurrentIndex(2)
+        self.stackLayout.setCurrentWidget(self.patientInfoWindow)
         self.current_page = "Patient Information"
         self.updateToolBar()
         self.patientInfoWindow.updatePatientInfo()
 
     def showDashboardWindow(self, calculation_info):
-        self.stackLayout.setCurrentIndex(3)
+        self.stackLayout.setCurrentWidget(self.dashboardWindow)
         self.current_page = "Dashboard"
         self.updateToolBar()
         self.dashboardWindow.updatePatientInfo(calculation_info=calculation_info)
 
     def showPatientFormWindow(self):
-        self.stackLayout.setCurrentIndex(4)
+        self.stackLayout.setCurrentWidget(self.patientFormWindow)
         self.current_page = "Patient Form"
         self.updateToolBar()
         self.patientFormWindow.updatePatientInfo()
 
     def showOncologistFormWindow(self):
-        self.stackLayout.setCurrentIndex(5)
+        self.stackLayout.setCurrentWidget(self.oncologistFormWindow)
         self.current_page = "Oncologist Form"
         self.updateToolBar()
 
+    # the connection of the calling thread
     def getDatabaseConnection(self):
-        return self.db_conn
+        return self.database.connection()
+
 
+# the batch simulation starts worker processes that import this module again,
+# so the application is only started when this file is run directly
+if __name__ == "__main__":
+    app = QApplication([])
+    startup.mark("QApplication")
 
-app = QApplication([])
+    window = MainWindow()
+    window.setWindowTitle("Leukemia Treatment Application")
+    window.show()
+    startup.mark("main window")
 
-window = MainWindow()
-window.setWindowTitle("Leukemia Treatment Application")
-window.show()
+    # runs once the login page is rendered, warms up the simulation backend
+    # (e.g. starts MATLAB) and the other pages while the user is logging in
+    QTimer.singleShot(0, window.warmUp)
 
-app.exec()
-window.db_conn.close()
+    app.exec()
+    if window._simulationJobs is not None:
+        window._simulationJobs.queue.shutdown()
+    window.queries.shutdown()
+    window.database.close()
+    if REPOSITORY_REPORT:
+        logging.info("database calls:\n" + "\n".join(repositoryStats.report()))
+    if window.backend is not None:
+        window.backend.shutdown()
@@ -0,0 +1,35 @@
+# benchmarks/bcrypt_cost.py
+
+# Times bcrypt at several cost factors and recommends the highest one whose
+# hash takes at most the target time on this computer. Set it with
+# LEUKEMIA_BCRYPT_ROUNDS, it applies to the passwords hashed from then on.
+#
+# python -m benchmarks.bcrypt_cost [target milliseconds]
+
+import sys
+import time
+
+import bcrypt
+
+from util.config import BCRYPT_ROUNDS
+from util.util import calibrateBcryptRounds
+
+
+def run(target_seconds):
+    print("rounds  hash time")
+    for rounds in range(10, 15):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        bcrypt.hashpw(b"benchmark password", salt)
+        print("{:6d}  {:6.0f} ms".format(rounds, (time.perf_counter() - start) * 1000))
+
+    rounds = calibrateBcryptRounds(target_seconds)
+    print(
+        "recommended for {:.0f} ms: LEUKEMIA_BCRYPT_ROUNDS={} (current {})".format(
+            target_seconds * 1000, rounds, BCRYPT_ROUNDS
+        )
+    )
+
+
+if __name__ == "__main__":
+    run(float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.25)
@@ -0,0 +1,48 @@
+# benchmarks/crypto_context.py
+
+# Compares decrypting the patient list with a key derived for every field
+# (passing the password to decryptData) and with a CryptoContext created once
+# per session. The patient list decrypts 4 fields per patient.
+#
+# python -m benchmarks.crypto_context [number of patients ...]
+
+import sys
+import time
+
+from util.util import CryptoContext, decryptData, encryptData
+
+FIELDS_PER_PATIENT = 4
+
+
+def timeIt(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes):
+    password = "benchmark password"
+    crypto = CryptoContext(password)
+    print("patients  per field key  session context  per field overhead")
+    for patients in sizes:
+        tokens = [
+            encryptData("field {}".format(i), crypto)
+            for i in range(patients * FIELDS_PER_PATIENT)
+        ]
+        per_field = timeIt(lambda: [decryptData(t, password) for t in tokens])
+        session = timeIt(lambda: [decryptData(t, crypto) for t in tokens])
+        print(
+            "{:8d}  {:10.1f} ms  {:12.1f} ms  {:14.1f} us".format(
+                patients,
+                per_field * 1000,
+                session * 1000,
+                (per_field - session) / len(tokens) * 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    run([int(size) for size in sys.argv[1:]] or [100, 1000, 5000])
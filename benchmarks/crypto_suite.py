@@ -0,0 +1,265 @@
+# benchmarks/crypto_suite.py
+
+# Benchmarks the encryption layer on synthetic databases: encryptData,
+# decryptData and generateFernetKey one call at a time, loading a patient as
+# MainWindow.updateSelectedPatient does (without the cache), and decrypting
+# the whole list as PatientListWindow.displayPatientList does (without the
+# widgets). Reports ops/s, p50/p99 latency and the peak memory allocated by
+# Python, and writes them to a JSON file that can be compared with the one
+# of another version:
+#
+# python -m benchmarks.crypto_suite --sizes 100 1000 10000 100000
+# python -m benchmarks.crypto_suite --compare benchmarks/results/<previous>.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.record_cipher import syntheticPatient
+from util.config import DECRYPT_WORKERS, RECORD_CIPHER
+from util.migrations import migrate
+from util.connections import ConnectionManager
+from util.patient_record import decryptRecordChunks, encryptRecord
+from util.repository import PatientRepository
+from util.util import CryptoContext, decryptData, encryptData, generateFernetKey
+
+PASSWORD = "benchmark password"
+USERNAME = "benchmark"
+MEASUREMENTS_PER_PATIENT = 3
+
+
+def createDatabase(path, patients, crypto):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute(
+        "INSERT INTO oncologists (username, password, full_name) VALUES (?, '', 'Benchmark')",
+        (USERNAME,),
+    )
+    conn.executemany(
+        "INSERT INTO patients (id, record, oncologist_id) VALUES (?, ?, ?)",
+        (
+            (i, encryptRecord(syntheticPatient(i), crypto), USERNAME)
+            for i in range(1, patients + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO measurements (time, anc_measurement, dosage_measurement, patient_id) VALUES (?, ?, ?, ?)",
+        (
+            ("2023010{}".format(m + 1), 2.0 + m, 50.0 + m, i)
+            for i in range(1, patients + 1)
+            for m in range(MEASUREMENTS_PER_PATIENT)
+        ),
+    )
+    conn.commit()
+    return conn
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# calls operation(i) for every i of arguments, timing every call. Calls are
+# timed without tracemalloc, the peak memory is measured in a second pass
+def measure(name, patients, operation, arguments, items_per_call=1):
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        operation(argument)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    for argument in arguments[: max(1, len(arguments) // 10)]:
+        operation(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "benchmark": name,
+        "patients": patients,
+        "calls": len(latencies),
+        "ops_per_second": items_per_call * len(latencies) / sum(latencies),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_memory_bytes": peak,
+    }
+
+
+def runSize(patients, ops, repeat, directory):
+    crypto = CryptoContext(PASSWORD)
+    path = os.path.join(directory, "patients_{}.db".format(patients))
+    createDatabase(path, patients, crypto).close()
+    database = ConnectionManager(path)
+    repository = PatientRepository(database)
+    results = []
+    try:
+        calls = min(ops, patients * 4)
+        plaintexts = ["field value {}".format(i) for i in range(calls)]
+        tokens = [encryptData(text, crypto) for text in plaintexts]
+        ids = [random.randint(1, patients) for _ in range(min(ops, patients))]
+
+        results.append(
+            measure(
+                "encryptData",
+                patients,
+                lambda text: encryptData(text, crypto),
+                plaintexts,
+            )
+        )
+        results.append(
+            measure(
+                "decryptData",
+                patients,
+                lambda token: decryptData(token, crypto),
+                tokens,
+            )
+        )
+        results.append(
+            measure(
+                "generateFernetKey",
+                patients,
+                generateFernetKey,
+                [text.encode("utf-8") for text in plaintexts],
+            )
+        )
+
+        # reading a field decrypts the record, see Patient.recordFields
+        def selectPatient(patient_id):
+            repository.get(patient_id, crypto).name
+
+        results.append(measure("updateSelectedPatient", patients, selectPatient, ids))
+
+        def decryptList(_):
+            rows = repository.listForOncologist(USERNAME)
+            for _ in decryptRecordChunks(rows, crypto):
+                pass
+
+        results.append(
+            measure(
+                "displayPatientList",
+                patients,
+                decryptList,
+                list(range(repeat)),
+                items_per_call=patients,
+            )
+        )
+    finally:
+        database.close()
+    return results
+
+
+def gitVersion():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def printResults(results, previous=None):
+    baseline = {}
+    for result in (previous or {}).get("results", []):
+        baseline[(result["benchmark"], result["patients"])] = result
+
+    print(
+        "{:22s} {:>8s} {:>12s} {:>10s} {:>10s} {:>11s}{}".format(
+            "benchmark",
+            "patients",
+            "ops/s",
+            "p50 ms",
+            "p99 ms",
+            "peak MB",
+            "  vs previous" if previous else "",
+        )
+    )
+    for result in results:
+        line = "{:22s} {:8d} {:12.0f} {:10.3f} {:10.3f} {:11.2f}".format(
+            result["benchmark"],
+            result["patients"],
+            result["ops_per_second"],
+            result["p50_ms"],
+            result["p99_ms"],
+            result["peak_memory_bytes"] / 1e6,
+        )
+        before = baseline.get((result["benchmark"], result["patients"]))
+        if before is not None:
+            line += "  {:+.1f}% ops/s".format(
+                (result["ops_per_second"] / before["ops_per_second"] - 1) * 100
+            )
+        print(line)
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Benchmarks the encryption layer")
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[100, 1000, 10000, 100000],
+        help="numbers of patients of the synthetic databases",
+    )
+    parser.add_argument(
+        "--ops", type=int, default=2000, help="timed calls per benchmark"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="timed decryptions of the whole list per size",
+    )
+    parser.add_argument(
+        "--output",
+        help="JSON file of the results, benchmarks/results/crypto_<date>.json by default",
+    )
+    parser.add_argument("--compare", help="JSON file of previous results")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArguments()
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for patients in args.sizes:
+            results += runSize(patients, args.ops, args.repeat, directory)
+
+    report = {
+        "version": gitVersion(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "RECORD_CIPHER": RECORD_CIPHER,
+            "DECRYPT_WORKERS": DECRYPT_WORKERS,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        "benchmarks", "results", "crypto_{}.json".format(time.strftime("%Y%m%d-%H%M%S"))
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    printResults(results, previous)
+    print("wrote {}".format(output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/record_cipher.py
+
+# Compares the Fernet and AES-GCM patient records (see RECORD_CIPHER in
+# util/config.py) on a synthetic database: time to encrypt and insert the
+# patients, time to read and decrypt them all, and the size of the database.
+#
+# python -m benchmarks.record_cipher [number of patients]
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from util.patient_record import decryptRecord, encryptRecord
+from util.util import CryptoContext
+
+CIPHERS = ("fernet", "aesgcm")
+
+
+def syntheticPatient(i):
+    return {
+        "user_id": "patient{:06d}".format(i),
+        "name": "Patient Number {}".format(i),
+        "phone_number": "416555{:04d}".format(i % 10000),
+        "birthday": "19900101",
+        "age": 33,
+        "blood_type": "AB+",
+        "all_type": "Immunophenotype",
+        "weight": 70.5,
+        "height": 175.0,
+        "body_surface_area": 1.86,
+        "sex": "Female",
+    }
+
+
+def run(patients, directory):
+    crypto = CryptoContext("benchmark password")
+    fields = [syntheticPatient(i) for i in range(patients)]
+    print("{} patients".format(patients))
+    print("cipher   encrypt+insert  read+decrypt  patients/s (read)  database size")
+    for cipher in CIPHERS:
+        path = os.path.join(directory, cipher + ".db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE patients (id INTEGER PRIMARY KEY, record BLOB)")
+
+        start = time.perf_counter()
+        conn.executemany(
+            "INSERT INTO patients (record) VALUES (?)",
+            ((encryptRecord(f, crypto, cipher),) for f in fields),
+        )
+        conn.commit()
+        write = time.perf_counter() - start
+        conn.execute("VACUUM")
+        conn.close()
+
+        conn = sqlite3.connect(path)
+        start = time.perf_counter()
+        for (record,) in conn.execute("SELECT record FROM patients"):
+            decryptRecord(record, crypto)
+        read = time.perf_counter() - start
+        conn.close()
+
+        print(
+            "{:7s}  {:11.2f} s  {:10.2f} s  {:17.0f}  {:10.1f} MB".format(
+                cipher,
+                write,
+                read,
+                patients / read,
+                os.path.getsize(path) / 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000, directory)
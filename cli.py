@@ -0,0 +1,295 @@
+# cli.py
+
+# Command line entry point of the application, to script simulations on a
+# server without a display. It reuses the database access, decryption and
+# simulation code of the application but never imports PyQt6 or pyqtgraph.
+#
+# python cli.py -u <username> patients
+# python cli.py -u <username> simulate 1 2 3 --cycles 3 --output results --format csv
+# python cli.py -u <username> batch --cycles 3
+# python cli.py -u <username> rotate-key
+#
+# The password is read from LEUKEMIA_PASSWORD, or asked for when it is not set.
+# rotate-key reads the new password from LEUKEMIA_NEW_PASSWORD the same way.
+# simulate and batch exit with 1 when a patient was skipped or failed.
+
+import argparse
+import csv
+import getpass
+import itertools
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from simulation.backend import getBackend
+from simulation.cache import OUTPUT_NAMES, cacheKey, getSimulationCache
+from util.config import (
+    BATCH_NUM_CYCLES,
+    BATCH_PROCESSES,
+    DATABASE_PATH,
+    KEY_ROTATION_BATCH_SIZE,
+    REPOSITORY_REPORT,
+    SIMULATION_WORKERS,
+)
+from util.connections import ConnectionManager
+from util.key_rotation import rotateKey
+from util.migrations import migrate
+from util.patient_record import decryptRecord
+from util.repository import OncologistRepository, PatientRepository, repositoryStats
+from util.util import CryptoContext, verifyPassword
+
+
+def listPatients(database, args):
+    print("id,patient_id,name,birthday")
+    rows = PatientRepository(database).listForOncologist(args.username)
+    for patient_id, record in rows:
+        fields = decryptRecord(record, args.crypto)
+        print(
+            "{},{},{},{}".format(
+                patient_id, fields["user_id"], fields["name"], fields["birthday"]
+            )
+        )
+
+
+# runs the model for one patient, decimated results are taken from and written to the cache
+def simulatePatient(patient, num_cycles, full_resolution):
+    backend = getBackend()
+    bsa, num_cycles, dosage, anc = patient.modelInputs(num_cycles)
+    if full_resolution:
+        return backend.simulate(bsa, num_cycles, dosage, anc)
+
+    cache = getSimulationCache()
+    key = cacheKey(backend, bsa, num_cycles, dosage, anc)
+    outputs = cache.get(key)
+    if outputs is None:
+        outputs = backend.run(bsa, num_cycles, dosage, anc)
+        cache.put(key, patient.id, outputs)
+    return outputs
+
+
+def writeCsv(path, outputs):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_NAMES)
+        # outputs that are not sampled like the time vector leave empty cells
+        for row in itertools.zip_longest(*outputs, fillvalue=""):
+            writer.writerow(row)
+
+
+def writeNpz(path, outputs):
+    np.savez_compressed(path, **dict(zip(OUTPUT_NAMES, outputs)))
+
+
+def printSummary(patient, outputs):
+    _, _, reactive_anc, anticipatory_anc, reactive_dosage, anticipatory_dosage = outputs
+    print(
+        "{} ({}): reactive dosage {:.1f} mg, anticipatory dosage {:.1f} mg, "
+        "lowest ANC reactive {:.2f}, anticipatory {:.2f}".format(
+            patient.user_id,
+            patient.id,
+            reactive_dosage[-1],
+            anticipatory_dosage[-1],
+            np.min(reactive_anc),
+            np.min(anticipatory_anc),
+        )
+    )
+
+
+# patients that do not exist or have no measurements are skipped, the exit
+# code is 1 if any was
+def simulate(database, args):
+    patients = PatientRepository(database).getMany(args.patient_ids, args.crypto)
+    found = {
+        patient.id: patient
+        for patient in patients
+        if patient.assignedDoctor == args.username
+    }
+    patients = []
+    for patient_id in args.patient_ids:
+        if patient_id not in found:
+            logging.error("Skipping patient {}: it does not exist".format(patient_id))
+        elif not found[patient_id].hasMeasurements():
+            logging.error(
+                "Skipping patient {}: it has no measurements".format(patient_id)
+            )
+        else:
+            patients.append(found[patient_id])
+    skipped = len(args.patient_ids) - len(patients)
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    getBackend().start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+            results = executor.map(
+                lambda patient: simulatePatient(patient, args.cycles, args.full),
+                patients,
+            )
+            for patient, outputs in zip(patients, results):
+                if args.output:
+                    path = os.path.join(
+                        args.output, "patient_{}.{}".format(patient.id, args.format)
+                    )
+                    if args.format == "csv":
+                        writeCsv(path, outputs)
+                    else:
+                        writeNpz(path, outputs)
+                    print("wrote {}".format(path))
+                else:
+                    printSummary(patient, outputs)
+    finally:
+        getBackend().shutdown()
+    if skipped:
+        print("{} patients skipped".format(skipped))
+        return 1
+    return 0
+
+
+def batch(database, args):
+    # imported here, the process pool is only needed by this command
+    from simulation.batch import batchItems, runBatch
+
+    items = batchItems(
+        PatientRepository(database), args.username, args.crypto, args.cycles
+    )
+
+    def progress(finished, total, patient_id, ok):
+        print(
+            "[{}/{}] patient {} {}".format(
+                finished, total, patient_id, "done" if ok else "failed"
+            )
+        )
+
+    summary = runBatch(items, processes=args.processes, progress=progress)
+    print(
+        "{} patients simulated, {} already up to date, {} failed".format(
+            summary["simulated"], summary["skipped"], summary["failed"]
+        )
+    )
+    return 1 if summary["failed"] else 0
+
+
+def rotate(database, args):
+    new_password = os.environ.get("LEUKEMIA_NEW_PASSWORD")
+    if not new_password:
+        new_password = getpass.getpass("New password: ")
+        if getpass.getpass("Confirm new password: ") != new_password:
+            raise SystemExit("The new passwords do not match")
+
+    def progress(done, total):
+        print("[{}/{}] patients re-encrypted".format(done, total))
+
+    try:
+        rotateKey(
+            database.connection(),
+            args.username,
+            args.password,
+            new_password,
+            batch_size=args.batch_size,
+            progress=progress,
+        )
+    except AssertionError as msg:
+        raise SystemExit(str(msg))
+    print("Password changed")
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(
+        description="Leukemia Treatment Application without the GUI"
+    )
+    parser.add_argument("-u", "--username", required=True, help="oncologist username")
+    parser.add_argument("--db", default=DATABASE_PATH, help="path of the database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    patients_parser = commands.add_parser("patients", help="list the patients")
+    patients_parser.set_defaults(run=listPatients)
+
+    simulate_parser = commands.add_parser(
+        "simulate", help="run the model for one or more patients"
+    )
+    simulate_parser.add_argument(
+        "patient_ids", nargs="+", type=int, help="ids listed by the patients command"
+    )
+    simulate_parser.add_argument(
+        "--cycles", type=int, default=BATCH_NUM_CYCLES, help="# calculation cycles"
+    )
+    simulate_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=SIMULATION_WORKERS,
+        help="number of patients simulated at the same time",
+    )
+    simulate_parser.add_argument(
+        "--output", help="directory the results are written to, printed otherwise"
+    )
+    simulate_parser.add_argument("--format", choices=("csv", "npz"), default="csv")
+    simulate_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="export every sample instead of the decimated results",
+    )
+    simulate_parser.set_defaults(run=simulate)
+
+    batch_parser = commands.add_parser(
+        "batch", help="simulate every patient and cache the results"
+    )
+    batch_parser.add_argument(
+        "--cycles", type=int, default=BATCH_NUM_CYCLES, help="# calculation cycles"
+    )
+    batch_parser.add_argument(
+        "--processes",
+        type=int,
+        default=BATCH_PROCESSES,
+        help="number of worker processes",
+    )
+    batch_parser.set_defaults(run=batch)
+
+    rotate_parser = commands.add_parser(
+        "rotate-key",
+        help="change the password and re-encrypt the patients, resumes an interrupted change",
+    )
+    rotate_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=KEY_ROTATION_BATCH_SIZE,
+        help="patients re-encrypted per transaction",
+    )
+    rotate_parser.set_defaults(run=rotate)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArguments(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    args.password = os.environ.get("LEUKEMIA_PASSWORD") or getpass.getpass()
+    database = ConnectionManager(args.db)
+    oncologists = OncologistRepository(database)
+    try:
+        migrate(database.connection())
+        try:
+            verifyPassword(oncologists.get(args.username), args.password)
+        except AssertionError as msg:
+            raise SystemExit(str(msg))
+        if args.run is not rotate and oncologists.pendingKeyRotation(args.username):
+            raise SystemExit(
+                "The password change of {} is not finished, run rotate-key to finish it".format(
+                    args.username
+                )
+            )
+        args.crypto = CryptoContext(args.password)
+        PatientRepository(database).upgradeRecords(args.username, args.crypto)
+        return args.run(database, args)
+    finally:
+        database.close()
+        if REPOSITORY_REPORT:
+            print("\n".join(repositoryStats.report()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,62 +1,18 @@
 #!/usr/bin/python
 
 # Example script to set-up and create the necessary tables for the database.
-# Also serves as the definition of keys and columns of each table.
+# The keys and columns of each table are defined by the migrations in
+# util/migrations.py, which also upgrade an existing db.db to the latest schema.
 
 import bcrypt
 import sqlite3
 
-conn = sqlite3.connect("db.db")
-
-conn.execute(
-    """
-        CREATE TABLE IF NOT EXISTS oncologists
-            (username TEXT NOT NULL,
-             password TEXT NOT NULL,
-             full_name TEXT NOT NULL,
-             is_admin INTEGER DEFAULT "FALSE" NOT NULL,
-             PRIMARY KEY(username));
-    """
-)
+from util.migrations import migrate
+from util.patient_record import encryptRecord
 
-conn.execute(
-    """
-        CREATE TABLE IF NOT EXISTS patients
-            (id INTEGER NOT NULL,
-             user_id TEXT NOT NULL,
-             name TEXT NOT NULL,
-             phone_number TEXT NOT NULL,
-             birthday TEXT NOT NULL,
-             age TEXT NOT NULL, 
-             blood_type TEXT NOT NULL,
-             all_type TEXT NOT NULL, 
-             weight TEXT NOT NULL,
-             height TEXT NOT NULL,
-             body_surface_area TEXT NOT NULL,
-             oncologist_id TEXT NOT NULL,
-             sex TEXT NOT NULL DEFAULT "Male",
-             PRIMARY KEY(id),
-             FOREIGN KEY(oncologist_id)
-                REFERENCES oncologists(username)
-                ON DELETE CASCADE
-                ON UPDATE NO ACTION);
-    """
-)
+conn = sqlite3.connect("db.db")
 
-conn.execute(
-    """
-        CREATE TABLE IF NOT EXISTS measurements
-            (time TEXT NOT NULL,
-             anc_measurement REAL NOT NULL,
-             dosage_measurement REAL NOT NULL,
-             patient_id INTEGER NOT NULL,
-             PRIMARY KEY(time, patient_id),
-             FOREIGN KEY(patient_id) 
-                REFERENCES patients(id)
-                ON DELETE CASCADE
-                ON UPDATE NO ACTION);
-    """
-)
+migrate(conn)
 
 # INSERT examples are listed below, feel free to uncomment to insert any entries as needed.
 
@@ -74,11 +30,31 @@ hash = bcrypt.hashpw(bytes, salt)
 #     (hash,),
 # )
 
+# the patient information is encrypted with the oncologist's password as a
+# single record, see util/patient_record.py
 # conn.execute(
 #     """
-#       INSERT INTO patients (user_id, name, phone_number, birthday, age, blood_type, all_type, weight, height, body_surface_area, oncologist_id)
-#       VALUES ('smallbob123456', 'Small Bob', '1234567899', '19900506', 38, 'A+', 'Immunophenotype', 1, 1, 250, 'angus');
-#     """
+#       INSERT INTO patients (record, oncologist_id)
+#       VALUES (?, 'angus');
+#     """,
+#     (
+#         encryptRecord(
+#             {
+#                 "user_id": "smallbob123456",
+#                 "name": "Small Bob",
+#                 "phone_number": "1234567899",
+#                 "birthday": "19900506",
+#                 "age": 38,
+#                 "blood_type": "A+",
+#                 "all_type": "Immunophenotype",
+#                 "weight": 1,
+#                 "height": 1,
+#                 "body_surface_area": 250,
+#                 "sex": "Male",
+#             },
+#             password,
+#         ),
+#     ),
 # )
 
 # conn.execute(
@@ -1,4 +1,204 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
 import matlab.engine
+import numpy as np
+
+from simulation.decimation import decimateOutputs
+from util.config import MATLAB_ENGINE_MAX_RUNS, MATLAB_POOL_SIZE, MATLAB_PROJECT_PATH
+
+
+class MatlabEnginePool:
+    """
+    Keeps a number of MATLAB engines started in the background with the
+    Leukemia-Treatment-Project path already added, so that a model run does
+    not pay for the engine startup.
+
+    size - Number of engines kept warm
+    max_runs - Number of runs after which an engine is restarted (0 to never restart)
+
+    Engines are handed out through engine() and are restarted when a run
+    raises, since the engine might be left in an unusable state.
+    """
+
+    def __init__(
+        self,
+        size=MATLAB_POOL_SIZE,
+        max_runs=MATLAB_ENGINE_MAX_RUNS,
+        project_path=MATLAB_PROJECT_PATH,
+    ):
+        self.size = max(1, size)
+        self.max_runs = max_runs
+        self.project_path = project_path
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._started = False
+        self._closed = False
+        self._starting = 0
+        self._busy = 0
+        self._restarted = 0
+        self._failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._spawnEngine()
+
+    def _spawnEngine(self):
+        with self._lock:
+            self._starting += 1
+        threading.Thread(target=self._startEngine, daemon=True).start()
+
+    def _startEngine(self):
+        try:
+            eng = matlab.engine.start_matlab()
+            eng.addpath(eng.genpath(self.project_path), nargout=0)
+        except Exception as e:
+            logging.error("Could not start MATLAB engine: {}".format(e))
+            with self._lock:
+                self._starting -= 1
+                self._failed += 1
+            return
+
+        with self._lock:
+            self._starting -= 1
+            closed = self._closed
+            if not closed:
+                self._runs[id(eng)] = 0
+        if closed:
+            eng.quit()
+        else:
+            self._idle.put(eng)
+
+    def acquire(self, timeout=None):
+        self.start()
+        with self._lock:
+            retry = 0
+            if self._failed and self._starting == 0 and self._idle.empty():
+                # every engine failed to start, try again instead of waiting forever
+                retry, self._failed = self._failed, 0
+        for _ in range(retry):
+            self._spawnEngine()
+        eng = self._idle.get(timeout=timeout)
+        with self._lock:
+            self._busy += 1
+        return eng
+
+    def release(self, eng, broken=False):
+        with self._lock:
+            self._busy -= 1
+            self._runs[id(eng)] = self._runs.get(id(eng), 0) + 1
+            worn_out = self.max_runs > 0 and self._runs[id(eng)] >= self.max_runs
+            closed = self._closed
+
+        if closed:
+            self._quitEngine(eng)
+        elif broken or worn_out:
+            logging.info(
+                "Restarting MATLAB engine ({})".format(
+                    "crashed" if broken else "reached max runs"
+                )
+            )
+            self._quitEngine(eng)
+            with self._lock:
+                self._restarted += 1
+            self._spawnEngine()
+        else:
+            self._idle.put(eng)
+
+    def _quitEngine(self, eng):
+        with self._lock:
+            self._runs.pop(id(eng), None)
+
+        def quit():
+            try:
+                eng.quit()
+            except Exception as e:
+                logging.error("Could not stop MATLAB engine: {}".format(e))
+
+        threading.Thread(target=quit, daemon=True).start()
+
+    # token - optional CancelToken, checked while waiting for an engine to be free
+    @contextmanager
+    def engine(self, timeout=None, token=None):
+        if token is None:
+            eng = self.acquire(timeout=timeout)
+        else:
+            eng = None
+            while eng is None:
+                token.check()
+                try:
+                    eng = self.acquire(timeout=0.1)
+                except queue.Empty:
+                    pass
+        try:
+            yield eng
+        except BaseException:
+            self.release(eng, broken=True)
+            raise
+        else:
+            self.release(eng)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "warm": self._idle.qsize(),
+                "busy": self._busy,
+                "starting": self._starting,
+                "restarted": self._restarted,
+                "failed": self._failed,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                eng = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                eng.quit()
+            except Exception as e:
+                logging.error("Could not stop MATLAB engine: {}".format(e))
+
+
+_engine_pool = None
+_engine_pool_lock = threading.Lock()
+
+
+# returns the pool shared by the whole application, created on first use
+def getEnginePool():
+    global _engine_pool
+    with _engine_pool_lock:
+        if _engine_pool is None:
+            _engine_pool = MatlabEnginePool()
+        return _engine_pool
+
+
+# converts a matlab.double returned by the engine to a flat NumPy array.
+# Since R2022a matlab.double implements the buffer protocol, so the array
+# is a view of the MATLAB data and no element is copied.
+def toNumpy(value):
+    try:
+        array = np.asarray(memoryview(value), dtype=np.float64)
+    except TypeError:
+        # older engines keep the column-major data in an array.array
+        data = getattr(value, "_data", None)
+        if data is not None:
+            array = np.frombuffer(data, dtype=np.float64)
+        else:
+            array = np.asarray(value, dtype=np.float64)
+    return array.reshape(-1)
+
 
 """
 
@@ -8,47 +208,46 @@ bsa - Body Surface Area, float
 numCycles - Number of cycles to run
 dosage - mg
 ANC_measurements - (Absolute Neutrophil Count / Litre) x 1e9
+eng - MATLAB engine to run the model on, one is taken from the engine pool if omitted
+token - optional CancelToken (see util/cancel.py), the MATLAB call is
+        cancelled and SimulationCancelled raised once it is cancelled
 
-Sample Call: 
+Sample Call:
 
-runModel(1.71, 3.0, [50.0, 70.0], [2.1, 2.0, 2.3])
+runController(1.71, 3.0, [50.0, 70.0], [2.1, 2.0, 2.3])
 
 Given 2 previous dosages and ANC measurements and one new measurement (2.3), find the anticipatory dosage.
-runModel will automatically follow the reactive dosage strategy, therefore we do not need 3 dosages.
+runController will automatically follow the reactive dosage strategy, therefore we do not need 3 dosages.
 
-The outputs are all lists of length 21*numCycles*1000
+The outputs are all NumPy arrays of length 21*numCycles*1000
 
 """
 
 
-def runModel(bsa, numCycles, dosage, ANC_measurements):
-
-    eng = matlab.engine.start_matlab()
-    s = eng.genpath("Leukemia-Treatment-Project")
-    eng.addpath(s, nargout=0)
-    (
-        time,
-        nominal_trajectory,
-        reactive_trajectory,
-        anticipatory_trajectory,
-        reactive_dosage,
-        anticipatory_dosage,
-    ) = eng.runController(bsa, numCycles, dosage, ANC_measurements, nargout=6)
-    eng.quit()
-
-    indices = [i for i in range(0, len(time) - len(time) % 100, 100)]
-
-    time = [time[i][0] for i in indices]
-    reactive_trajectory = [reactive_trajectory[i][0] for i in indices]
-    anticipatory_trajectory = [anticipatory_trajectory[i][0] for i in indices]
-    reactive_dosage = [reactive_dosage[i][0] for i in indices]
-    anticipatory_dosage = [anticipatory_dosage[i][0] for i in indices]
-
-    return (
-        time,
-        nominal_trajectory,
-        reactive_trajectory,
-        anticipatory_trajectory,
-        reactive_dosage,
-        anticipatory_dosage,
-    )
+def runController(bsa, numCycles, dosage, ANC_measurements, eng=None, token=None):
+
+    if eng is None:
+        with getEnginePool().engine() as eng:
+            return runController(bsa, numCycles, dosage, ANC_measurements, eng, token)
+
+    if token is None:
+        outputs = eng.runController(bsa, numCycles, dosage, ANC_measurements, nargout=6)
+    else:
+        future = eng.runController(
+            bsa, numCycles, dosage, ANC_measurements, nargout=6, background=True
+        )
+        while not future.done():
+            if token.wait(0.1):
+                future.cancel()
+                token.check()
+        outputs = future.result()
+    return tuple(toNumpy(output) for output in outputs)
+
+
+# same as runController, with the outputs decimated for display
+# (see simulation/decimation.py for the available methods)
+def runModel(
+    bsa, numCycles, dosage, ANC_measurements, eng=None, token=None, **decimation
+):
+    outputs = runController(bsa, numCycles, dosage, ANC_measurements, eng, token)
+    return decimateOutputs(outputs, **decimation)
@@ -0,0 +1,119 @@
+import importlib
+import logging
+import threading
+
+from simulation.decimation import decimateOutputs
+from util.config import DECIMATION_TARGET_POINTS, SIMULATION_BACKEND
+
+"""
+
+Common interface of the simulation backends. Every backend runs the
+neutrophil/6-MP controller model and returns the same six outputs as
+runController.m:
+
+time, nominal_trajectory, reactive_trajectory, anticipatory_trajectory,
+reactive_dosage, anticipatory_dosage
+
+as NumPy arrays. Backends implement simulate(), which returns the full
+resolution outputs, and run() decimates them for display. Backends able to
+produce the results cycle by cycle also implement simulateCycles(), so
+that runCycles() can stream partial results to the dashboard.
+
+The backend used by the application is chosen with the SIMULATION_BACKEND
+setting in util/config.py. Only the backends of BACKENDS run the clinical
+model, the backends of APPROXIMATE_BACKENDS are used when named explicitly
+and their results are labelled as non-clinical.
+
+"""
+
+
+class SimulationBackend:
+    name = ""
+
+    # called when the application launches, used to warm up expensive resources
+    def start(self):
+        pass
+
+    # called when the application exits
+    def shutdown(self):
+        pass
+
+    # identifies the model implementation, cached results of other versions are ignored
+    def version(self):
+        return ""
+
+    """
+
+    bsa - Body Surface Area, float
+    numCycles - Number of cycles to run
+    dosage - list of previous dosages (mg)
+    ANC_measurements - list of previous ANC measurements, (Absolute Neutrophil Count / Litre) x 1e9
+    token - optional CancelToken, SimulationCancelled is raised when it is cancelled
+
+    """
+
+    def simulate(self, bsa, numCycles, dosage, ANC_measurements, token=None):
+        raise NotImplementedError
+
+    # yields (number of cycles, outputs) chunks covering all the cycles in order.
+    # Backends that cannot stream return every cycle in a single chunk.
+    def simulateCycles(self, bsa, numCycles, dosage, ANC_measurements, token=None):
+        yield int(numCycles), self.simulate(
+            bsa, numCycles, dosage, ANC_measurements, token
+        )
+
+    def run(self, bsa, numCycles, dosage, ANC_measurements, token=None):
+        outputs = self.simulate(bsa, numCycles, dosage, ANC_measurements, token)
+        return decimateOutputs(outputs)
+
+    # same as run, yielding the decimated outputs chunk by chunk
+    def runCycles(self, bsa, numCycles, dosage, ANC_measurements, token=None):
+        num_cycles = max(int(numCycles), 1)
+        for cycles, outputs in self.simulateCycles(
+            bsa, numCycles, dosage, ANC_measurements, token
+        ):
+            # each chunk gets its share of the point budget
+            target_points = max(DECIMATION_TARGET_POINTS * cycles // num_cycles, 3)
+            yield decimateOutputs(outputs, target_points=target_points)
+
+
+# backends are imported on first use so that e.g. the numpy backend never
+# imports matlab.engine
+BACKENDS = {
+    "matlab": ("simulation.matlab_backend", "MatlabBackend"),
+}
+
+# backends that are not validated against runController.m, their results must
+# not be used for treatment decisions
+APPROXIMATE_BACKENDS = {
+    "numpy": ("simulation.numpy_backend", "NumpyBackend"),
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def getBackend(name=None):
+    name = name or SIMULATION_BACKEND
+    if name not in BACKENDS and name not in APPROXIMATE_BACKENDS:
+        raise ValueError(
+            "Unknown simulation backend '{}', expected one of {}".format(
+                name, ", ".join(sorted(BACKENDS))
+            )
+        )
+    with _backends_lock:
+        if name not in _backends:
+            module_name, class_name = BACKENDS.get(name) or APPROXIMATE_BACKENDS[name]
+            module = importlib.import_module(module_name)
+            _backends[name] = getattr(module, class_name)()
+            if isApproximate(name):
+                logging.warning(
+                    "The {} simulation backend is a non-clinical approximation of "
+                    "runController.m, its results must not be used for treatment "
+                    "decisions".format(name)
+                )
+        return _backends[name]
+
+
+def isApproximate(name=None):
+    return (name or SIMULATION_BACKEND) in APPROXIMATE_BACKENDS
@@ -0,0 +1,143 @@
+import atexit
+import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from simulation.backend import getBackend
+from simulation.cache import cacheKey, getSimulationCache
+from util.config import BATCH_NUM_CYCLES, BATCH_PROCESSES
+from util.util import getCryptoContext
+
+"""
+
+Batch simulation of every patient of an oncologist, e.g. overnight before clinic.
+
+The patients are loaded and decrypted in this process and only the model
+inputs are sent to a pool of worker processes, each with its own simulation
+backend (and so its own MATLAB engine). Results are written to the
+simulation cache under the key the dashboard uses, so the dashboard opens
+them without running the model.
+
+The result of every patient is cached as soon as it is finished, so a batch
+that is interrupted resumes where it stopped: patients whose results are
+cached are skipped, and a patient whose result was evicted from the cache
+since is simulated again.
+
+"""
+
+
+class BatchItem:
+    def __init__(self, patient_id, inputs, cache_key):
+        self.patient_id = patient_id
+        self.inputs = inputs
+        self.cache_key = cache_key
+
+
+# returns the patients of an oncologist that have measurements to run the model on
+# patients is a PatientRepository
+def batchItems(patients, username, crypto, num_cycles=BATCH_NUM_CYCLES, backend=None):
+    backend = backend or getBackend()
+    crypto = getCryptoContext(crypto)
+    items = []
+    patient_ids = [row[0] for row in patients.listForOncologist(username)]
+    for patient in patients.getMany(patient_ids, crypto):
+        if not patient.hasMeasurements():
+            continue
+        inputs = patient.modelInputs(num_cycles)
+        items.append(BatchItem(patient.id, inputs, cacheKey(backend, *inputs)))
+    return items
+
+
+_worker_backend = None
+
+
+def _initWorker(backend_name):
+    global _worker_backend
+    _worker_backend = getBackend(backend_name)
+    _worker_backend.start()
+    atexit.register(_worker_backend.shutdown)
+
+
+def _simulate(inputs):
+    bsa, num_cycles, dosage, anc = inputs
+    return _worker_backend.run(bsa, num_cycles, dosage, anc)
+
+
+def runBatch(
+    items,
+    processes=BATCH_PROCESSES,
+    progress=None,
+    token=None,
+    backend=None,
+    cache=None,
+):
+    """
+    Simulates every item and writes the results to the simulation cache.
+
+    progress - optional function called with (finished, total, patient_id, ok)
+               after every patient, skipped patients included
+    token - optional CancelToken, the patients not started yet are dropped
+            and SimulationCancelled raised once it is cancelled
+
+    Returns a dictionary with the number of simulated, skipped and failed patients.
+    """
+    backend = backend or getBackend()
+    cache = cache or getSimulationCache()
+    summary = {"total": len(items), "simulated": 0, "skipped": 0, "failed": 0}
+
+    def report(item, ok):
+        if progress is not None:
+            finished = summary["simulated"] + summary["skipped"] + summary["failed"]
+            progress(finished, summary["total"], item.patient_id, ok)
+
+    pending = []
+    for item in items:
+        if cache.contains(item.cache_key):
+            summary["skipped"] += 1
+            report(item, True)
+        else:
+            pending.append(item)
+
+    if pending:
+        # spawned rather than forked: neither Qt nor the MATLAB engine survive a fork
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(processes, len(pending))),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initWorker,
+            initargs=(backend.name,),
+        ) as executor:
+            futures = {
+                executor.submit(_simulate, item.inputs): item for item in pending
+            }
+            not_done = set(futures)
+            cancelled = False
+            while not_done:
+                if not cancelled and token is not None and token.isCancelled():
+                    # the running simulations are still finished and cached
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    not_done = {future for future in not_done if not future.cancelled()}
+                    cancelled = True
+                done, not_done = wait(
+                    not_done, timeout=0.5, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    item = futures[future]
+                    try:
+                        outputs = future.result()
+                    except Exception as e:
+                        logging.error(
+                            "Batch simulation of patient {} failed: {}".format(
+                                item.patient_id, e
+                            )
+                        )
+                        summary["failed"] += 1
+                        report(item, False)
+                        continue
+                    cache.put(item.cache_key, item.patient_id, outputs)
+                    summary["simulated"] += 1
+                    report(item, True)
+
+    if token is not None:
+        token.check()
+    logging.info("batch simulation: {}".format(summary))
+    return summary
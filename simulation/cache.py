@@ -0,0 +1,191 @@
+import hashlib
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from util.config import (
+    DECIMATION_METHOD,
+    DECIMATION_STRIDE,
+    DECIMATION_TARGET_POINTS,
+    SIMULATION_CACHE_MAX_BYTES,
+    SIMULATION_CACHE_PATH,
+)
+
+"""
+
+Persistent cache of simulation results.
+
+Results are keyed by a hash of the normalized model inputs (BSA, number of
+cycles, dosages and ANC measurements) together with the backend name and
+version, so a result computed with a different model is never returned.
+The outputs are cached decimated (see simulation/decimation.py), so the
+decimation settings are part of the key as well.
+The six outputs are stored as one compressed NumPy archive per entry in a
+SQLite file next to db.db. Once the total size exceeds max_bytes, the least
+recently used entries are evicted.
+
+"""
+
+OUTPUT_NAMES = (
+    "time",
+    "nominal_trajectory",
+    "reactive_trajectory",
+    "anticipatory_trajectory",
+    "reactive_dosage",
+    "anticipatory_dosage",
+)
+
+
+def cacheKey(backend, bsa, numCycles, dosage, ANC_measurements):
+    inputs = {
+        "backend": backend.name,
+        "version": backend.version(),
+        "bsa": round(float(bsa), 6),
+        "numCycles": int(numCycles),
+        "dosage": [round(float(d), 6) for d in dosage],
+        "anc": [round(float(a), 6) for a in ANC_measurements],
+        "decimation": [DECIMATION_METHOD, DECIMATION_STRIDE, DECIMATION_TARGET_POINTS],
+    }
+    encoded = json.dumps(inputs, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def encodeOutputs(outputs):
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        **{
+            name: np.asarray(output, dtype=np.float64).reshape(-1)
+            for name, output in zip(OUTPUT_NAMES, outputs)
+        }
+    )
+    return buffer.getvalue()
+
+
+def decodeOutputs(payload):
+    with np.load(io.BytesIO(payload)) as archive:
+        return tuple(archive[name] for name in OUTPUT_NAMES)
+
+
+class SimulationCache:
+    def __init__(
+        self, path=SIMULATION_CACHE_PATH, max_bytes=SIMULATION_CACHE_MAX_BYTES
+    ):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+                CREATE TABLE IF NOT EXISTS results
+                    (key TEXT NOT NULL,
+                     patient_id INTEGER,
+                     payload BLOB NOT NULL,
+                     size INTEGER NOT NULL,
+                     last_access REAL NOT NULL,
+                     PRIMARY KEY(key));
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_patient ON results(patient_id, last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM results WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(key)
+        return decodeOutputs(row[0])
+
+    def contains(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM results WHERE key=?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def put(self, key, patient_id, outputs):
+        payload = encodeOutputs(outputs)
+        with self._lock:
+            try:
+                self._conn.execute(
+                    """
+                        INSERT OR REPLACE INTO results (key, patient_id, payload, size, last_access)
+                        VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (key, patient_id, payload, len(payload), time.time()),
+                )
+                self._evict()
+                self._conn.commit()
+            except sqlite3.Error as er:
+                self._conn.rollback()
+                logging.error("Could not cache the simulation results: {}".format(er))
+
+    # drops every result of a patient, e.g. after a new measurement was saved
+    def invalidatePatient(self, patient_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE patient_id=?", (patient_id,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        return {"entries": entries, "size": size, "max_bytes": self.max_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _touch(self, key):
+        self._conn.execute(
+            "UPDATE results SET last_access=? WHERE key=?", (time.time(), key)
+        )
+        self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM results ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE key=?", evicted)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# returns the cache shared by the whole application, created on first use
+def getSimulationCache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SimulationCache()
+        return _cache
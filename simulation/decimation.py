@@ -0,0 +1,124 @@
+import numpy as np
+
+from util.config import (
+    DECIMATION_METHOD,
+    DECIMATION_STRIDE,
+    DECIMATION_TARGET_POINTS,
+)
+
+"""
+
+Decimation of the model outputs before they are cached and displayed.
+
+The model returns 21*numCycles*1000 samples per output, far more than can
+be drawn. The same sample indices are kept for every output so that the
+trajectories and dosages stay aligned:
+
+stride - keeps every stride-th sample
+minmax - splits the samples in buckets and keeps the minimum and maximum of
+         every trajectory in each bucket, so peaks and nadirs are never lost
+lttb - keeps the points chosen by the largest triangle three buckets
+       algorithm for every trajectory
+
+"""
+
+METHODS = ("stride", "minmax", "lttb")
+
+
+def strideIndices(length, stride):
+    return np.arange(0, length - length % stride, stride)
+
+
+def minMaxIndices(series, buckets):
+    length = len(series)
+    if buckets <= 0 or length <= 2 * buckets:
+        return np.arange(length)
+    bucket_size = -(-length // buckets)
+    padded = np.full(buckets * bucket_size, np.nan)
+    padded[:length] = series
+    padded = padded.reshape(buckets, bucket_size)
+    offsets = np.arange(buckets) * bucket_size
+    # the last bucket can be shorter than bucket_size, but is never empty
+    valid = offsets < length
+    minimum = np.nanargmin(padded[valid], axis=1) + offsets[valid]
+    maximum = np.nanargmax(padded[valid], axis=1) + offsets[valid]
+    return np.concatenate(([0, length - 1], minimum, maximum))
+
+
+def lttbIndices(x, y, target_points):
+    length = len(y)
+    if target_points < 3 or length <= target_points:
+        return np.arange(length)
+
+    # the first and last points are always kept, the rest is split in buckets
+    edges = np.linspace(1, length - 1, target_points - 1).astype(np.int64)
+    indices = np.empty(target_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = length - 1
+
+    selected = 0
+    for bucket in range(target_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        else:
+            next_start, next_end = length - 1, length
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        # area of the triangles formed with the previously selected point and
+        # the average of the next bucket, for every point of the bucket
+        areas = np.abs(
+            (x[selected] - average_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (average_y - y[selected])
+        )
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+    return indices
+
+
+def decimationIndices(
+    time,
+    series,
+    method=DECIMATION_METHOD,
+    stride=DECIMATION_STRIDE,
+    target_points=DECIMATION_TARGET_POINTS,
+):
+    """
+    Returns the sorted indices of the samples to keep.
+
+    time - sample times
+    series - list of trajectories the points are selected on
+    """
+    length = len(time)
+    if method == "stride":
+        return strideIndices(length, stride)
+
+    # the point budget is shared between the trajectories
+    per_series = max(target_points // max(len(series), 1), 3)
+    if method == "minmax":
+        indices = [minMaxIndices(y, per_series // 2) for y in series]
+    elif method == "lttb":
+        x = np.asarray(time, dtype=np.float64)
+        indices = [lttbIndices(x, y, per_series) for y in series]
+    else:
+        raise ValueError(
+            "Unknown decimation method '{}', expected one of {}".format(
+                method, ", ".join(METHODS)
+            )
+        )
+    return np.unique(np.concatenate(indices))
+
+
+def decimateOutputs(outputs, **kwargs):
+    """
+    Decimates the six model outputs with the same indices. Outputs that are
+    not sampled like the time vector (e.g. a scalar) are returned unchanged.
+    """
+    outputs = [np.asarray(output, dtype=np.float64).reshape(-1) for output in outputs]
+    time = outputs[0]
+    series = [output for output in outputs[1:4] if len(output) == len(time)]
+    indices = decimationIndices(time, series, **kwargs)
+    return tuple(
+        output[indices] if len(output) == len(time) else output for output in outputs
+    )
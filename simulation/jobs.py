@@ -0,0 +1,235 @@
+import heapq
+import itertools
+import logging
+import threading
+
+import numpy as np
+
+from simulation.backend import getBackend
+from simulation.cache import getSimulationCache
+from util.cancel import CancelToken, SimulationCancelled
+from util.config import SIMULATION_TIMEOUT_SECONDS, SIMULATION_WORKERS
+
+"""
+
+Queue of simulation jobs, run by a bounded pool of worker threads.
+
+Every patient has at most one active job: submitting a new run for a
+patient cancels the previous one. Jobs of the patient currently on screen
+are run first (see prioritize). Listeners are notified from the worker
+threads through two methods:
+
+jobStatusChanged(job) - the status of a job changed
+jobProgress(job, index, outputs) - the index-th chunk of decimated outputs is available
+
+Finished results are written to the simulation cache.
+
+"""
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+FOREGROUND = 0
+BACKGROUND = 1
+
+
+class SimulationJob:
+    def __init__(
+        self, job_id, patient_id, bsa, num_cycles, dosage, anc, cache_key, priority
+    ):
+        self.id = job_id
+        self.patient_id = patient_id
+        self.bsa = bsa
+        self.num_cycles = num_cycles
+        self.dosage = dosage
+        self.anc = anc
+        self.cache_key = cache_key
+        self.priority = priority
+        # the timeout is started when the job starts running, see SimulationQueue._pop
+        self.token = CancelToken()
+        self.status = QUEUED
+        self.message = ""
+        self.chunks = []
+        self.outputs = None
+
+    def isActive(self):
+        return self.status in (QUEUED, RUNNING)
+
+
+class SimulationQueue:
+    def __init__(
+        self,
+        workers=SIMULATION_WORKERS,
+        backend=None,
+        cache=None,
+        timeout=SIMULATION_TIMEOUT_SECONDS,
+    ):
+        self.workers = max(1, workers)
+        self.backend = backend
+        self.cache = cache
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._sequence = itertools.count()
+        self._threads = []
+        self._closed = False
+        self._listeners = []
+
+    def addListener(self, listener):
+        self._listeners.append(listener)
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._work, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(
+        self,
+        patient_id,
+        bsa,
+        num_cycles,
+        dosage,
+        anc,
+        cache_key=None,
+        priority=BACKGROUND,
+    ):
+        self.start()
+        with self._cond:
+            previous = self._jobs.get(patient_id)
+            job = SimulationJob(
+                next(self._ids),
+                patient_id,
+                bsa,
+                num_cycles,
+                dosage,
+                anc,
+                cache_key,
+                priority,
+            )
+            self._jobs[patient_id] = job
+            self._push(job)
+            self._cond.notify()
+        if previous is not None and previous.isActive():
+            self._stop(previous, "cancelled")
+        self._notifyStatus(job)
+        return job
+
+    # runs the queued job of the patient before the other patients' jobs
+    def prioritize(self, patient_id):
+        with self._cond:
+            for job in self._jobs.values():
+                priority = FOREGROUND if job.patient_id == patient_id else BACKGROUND
+                if job.status == QUEUED and job.priority != priority:
+                    job.priority = priority
+                    self._push(job)
+
+    def getJob(self, patient_id):
+        with self._cond:
+            return self._jobs.get(patient_id)
+
+    def status(self, patient_id):
+        job = self.getJob(patient_id)
+        return job.status if job is not None else None
+
+    def cancel(self, patient_id):
+        job = self.getJob(patient_id)
+        if job is not None and job.isActive():
+            self._stop(job, "cancelled")
+
+    def cancelAll(self):
+        with self._cond:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            if job.isActive():
+                self._stop(job, "cancelled")
+
+    def shutdown(self):
+        self.cancelAll()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _push(self, job):
+        # entries are never removed, stale ones are skipped when popped
+        heapq.heappush(self._heap, (job.priority, next(self._sequence), job))
+
+    def _pop(self):
+        with self._cond:
+            while True:
+                while self._heap:
+                    priority, _, job = heapq.heappop(self._heap)
+                    if job.status == QUEUED and priority == job.priority:
+                        job.status = RUNNING
+                        # the time spent in the queue does not count against the timeout
+                        job.token.startTimeout(self.timeout)
+                        return job
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+    def _stop(self, job, reason):
+        job.token.cancel(reason)
+        with self._cond:
+            if not job.isActive():
+                return
+            job.status = CANCELLED
+            job.message = "Simulation {}".format(reason)
+        self._notifyStatus(job)
+
+    def _work(self):
+        while True:
+            job = self._pop()
+            if job is None:
+                return
+            self._notifyStatus(job)
+            self._run(job)
+
+    def _run(self, job):
+        backend = self.backend or getBackend()
+        try:
+            for outputs in backend.runCycles(
+                job.bsa, job.num_cycles, job.dosage, job.anc, job.token
+            ):
+                if not job.isActive():
+                    return
+                job.chunks.append(outputs)
+                for listener in self._listeners:
+                    listener.jobProgress(job, len(job.chunks) - 1, outputs)
+        except SimulationCancelled as e:
+            self._stop(job, str(e))
+            return
+        except Exception as e:
+            logging.error(
+                "Simulation of patient {} failed: {}".format(job.patient_id, e)
+            )
+            with self._cond:
+                job.status = FAILED
+                job.message = "Simulation failed"
+            self._notifyStatus(job)
+            return
+
+        job.outputs = tuple(np.concatenate(parts) for parts in zip(*job.chunks))
+        if job.cache_key is not None:
+            (self.cache or getSimulationCache()).put(
+                job.cache_key, job.patient_id, job.outputs
+            )
+        with self._cond:
+            if not job.isActive():
+                return
+            job.status = DONE
+        self._notifyStatus(job)
+
+    def _notifyStatus(self, job):
+        for listener in self._listeners:
+            listener.jobStatusChanged(job)
@@ -0,0 +1,47 @@
+import logging
+import subprocess
+
+from matlab_script import getEnginePool, runController
+from simulation.backend import SimulationBackend
+from util.config import MATLAB_PROJECT_PATH
+
+
+# runs runController.m on an engine taken from the MATLAB engine pool
+class MatlabBackend(SimulationBackend):
+    name = "matlab"
+
+    def __init__(self):
+        self._version = None
+
+    def start(self):
+        getEnginePool().start()
+
+    def shutdown(self):
+        getEnginePool().shutdown()
+
+    # the model version is the commit of the Leukemia-Treatment-Project submodule
+    def version(self):
+        if self._version is None:
+            try:
+                res = subprocess.run(
+                    ["git", "-C", MATLAB_PROJECT_PATH, "rev-parse", "HEAD"],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                self._version = res.stdout.strip()
+            except (OSError, subprocess.CalledProcessError) as e:
+                logging.error("Could not read the model version: {}".format(e))
+                self._version = "unknown"
+        return self._version
+
+    # a cancelled run raises inside engine(), so the pool restarts the engine
+    # instead of handing out one that may still be busy
+    def simulate(self, bsa, numCycles, dosage, ANC_measurements, token=None):
+        pool = getEnginePool()
+        with pool.engine(token=token) as eng:
+            outputs = runController(
+                bsa, numCycles, dosage, ANC_measurements, eng, token
+            )
+        logging.info("engine pool: {}".format(pool.stats()))
+        return outputs
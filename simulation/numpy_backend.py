@@ -0,0 +1,219 @@
+import numpy as np
+
+from simulation.backend import SimulationBackend
+
+"""
+
+Non-clinical approximation of the neutrophil/6-MP controller model in NumPy.
+
+This is NOT the model of runController.m. Its structure follows the
+literature but its parameters below are illustrative values that were not
+fitted to patients nor validated against runController.m, so its results
+must not be used for treatment decisions. It is meant for development and
+testing without MATLAB, and is only used when LEUKEMIA_SIMULATION_BACKEND
+is set to "numpy" (see APPROXIMATE_BACKENDS in simulation/backend.py).
+
+The drug is modelled by its active metabolite (6-TGN), which accumulates
+from the daily oral dose and is eliminated with first order kinetics. The
+neutrophils follow the semi-mechanistic myelosuppression model of Friberg
+et al. (2002): a proliferating compartment, three transit compartments and
+the circulating neutrophils, with the drug effect inhibiting proliferation
+and a feedback from the circulating count.
+
+The patient specific baseline is estimated by assuming the last ANC
+measurement was taken at steady state under the last dosage.
+
+Three dosing strategies are simulated, each keeping the dosage constant
+within a 21 day cycle:
+
+nominal - the last dosage is kept for every cycle
+reactive - the dosage is moved up or down one level of the protocol ladder
+           depending on the ANC measured at the start of the cycle
+anticipatory - the dosage minimizing the predicted deviation of the ANC
+               from the target range over the next cycle is chosen
+
+All strategies and every candidate dosage of the anticipatory controller
+are integrated together as one batch, so a cycle costs a single pass of
+the solver.
+
+"""
+
+# bump when the model or its parameters change to invalidate cached results
+MODEL_VERSION = "1"
+
+DAYS_PER_CYCLE = 21
+SAMPLES_PER_DAY = 1000
+
+# integration step (days)
+STEP = 0.1
+
+# illustrative parameters, not fitted to patients
+
+# 6-TGN pharmacokinetics
+K_TGN = np.log(2) / 5.0  # elimination rate (1/day), half-life of 5 days
+EC50 = 500.0  # 6-TGN level (mg/m^2) giving half of the maximal effect
+EMAX = 0.6  # maximal inhibition of proliferation
+
+# myelosuppression model
+MTT = 5.0  # mean transit time (days)
+KTR = 4.0 / MTT  # transit rate (1/day)
+GAMMA = 0.3  # feedback exponent
+
+# target ANC range (x 1e9 / L), matching the boundaries drawn on the dashboard
+ANC_LOWER = 1.0
+ANC_UPPER = 2.0
+ANC_TARGET = (ANC_LOWER + ANC_UPPER) / 2
+ANC_HOLD = 0.5  # below this the reactive strategy stops the drug
+
+# reactive dosage ladder, as a fraction of the protocol (last) dosage
+DOSE_LEVELS = np.array([0.0, 0.5, 0.75, 1.0, 1.25, 1.5])
+
+# candidate dosages of the anticipatory controller, as a fraction of the protocol dosage
+CANDIDATE_DOSES = np.linspace(0.0, 1.5, 31)
+
+
+def drugEffect(tgn):
+    return EMAX * tgn / (EC50 + tgn)
+
+
+def steadyState(bsa, dose, anc):
+    """
+    Returns the model state (6-TGN, proliferating, 3 transit, circulating)
+    at steady state under a constant daily dose, and the baseline
+    neutrophil count that produces the given ANC at that steady state.
+    """
+    tgn = dose / bsa / K_TGN
+    effect = drugEffect(tgn)
+    baseline = anc * (1.0 - effect) ** (-1.0 / GAMMA)
+    return np.array([tgn, anc, anc, anc, anc, anc]), baseline
+
+
+def derivative(state, dose_rate, baseline):
+    tgn, prol, t1, t2, t3, circ = state
+    feedback = (baseline / np.maximum(circ, 1e-6)) ** GAMMA
+    return np.stack(
+        (
+            dose_rate - K_TGN * tgn,
+            KTR * prol * ((1.0 - drugEffect(tgn)) * feedback - 1.0),
+            KTR * (prol - t1),
+            KTR * (t1 - t2),
+            KTR * (t2 - t3),
+            KTR * (t3 - circ),
+        )
+    )
+
+
+def integrateCycle(state, dose_rate, baseline):
+    """
+    Integrates a batch of states over one cycle with a fixed step RK4 solver.
+
+    state - array of shape (6, batch)
+    dose_rate - daily dose per m^2 for each member of the batch, shape (batch,)
+
+    Returns the state at the end of the cycle and the circulating neutrophils
+    at every step, of shape (steps + 1, batch).
+    """
+    steps = int(round(DAYS_PER_CYCLE / STEP))
+    circ = np.empty((steps + 1, state.shape[1]))
+    circ[0] = state[5]
+    for i in range(steps):
+        k1 = derivative(state, dose_rate, baseline)
+        k2 = derivative(state + 0.5 * STEP * k1, dose_rate, baseline)
+        k3 = derivative(state + 0.5 * STEP * k2, dose_rate, baseline)
+        k4 = derivative(state + STEP * k3, dose_rate, baseline)
+        state = state + STEP / 6.0 * (k1 + 2 * k2 + 2 * k3 + k4)
+        circ[i + 1] = state[5]
+    return state, circ
+
+
+def reactiveLevel(level, anc):
+    if anc < ANC_HOLD:
+        return 0
+    if anc < ANC_LOWER:
+        return max(level - 1, 0)
+    if anc > ANC_UPPER:
+        return min(level + 1, len(DOSE_LEVELS) - 1)
+    return level
+
+
+def anticipatoryCost(circ):
+    # squared distance to the target, with values outside of the range weighted more
+    deviation = circ - ANC_TARGET
+    outside = (circ < ANC_LOWER) | (circ > ANC_UPPER)
+    return np.mean(deviation**2 * np.where(outside, 10.0, 1.0), axis=0)
+
+
+def simulateCycles(bsa, numCycles, dosage, ANC_measurements, token=None):
+    """
+    Runs the model one cycle at a time, yielding the six outputs of
+    runController.m for each cycle, sampled SAMPLES_PER_DAY times a day, as
+    NumPy arrays. The optional CancelToken is checked before every cycle.
+    """
+    bsa = float(bsa)
+    num_cycles = int(numCycles)
+    protocol_dose = float(dosage[-1])
+    anc = float(ANC_measurements[-1])
+
+    initial, baseline = steadyState(bsa, protocol_dose, anc)
+    candidates = CANDIDATE_DOSES * protocol_dose
+
+    # batch layout: nominal, reactive, then one column per anticipatory candidate
+    nominal = initial.copy()
+    reactive = initial.copy()
+    anticipatory = initial.copy()
+    reactive_level = int(np.flatnonzero(DOSE_LEVELS == 1.0)[0])
+    reactive_anc = anc
+
+    steps = int(round(DAYS_PER_CYCLE / STEP))
+    step_time = np.linspace(0.0, DAYS_PER_CYCLE, steps + 1)
+    samples = DAYS_PER_CYCLE * SAMPLES_PER_DAY
+    sample_time = np.arange(samples) / SAMPLES_PER_DAY
+
+    for cycle in range(num_cycles):
+        if token is not None:
+            token.check()
+
+        reactive_level = reactiveLevel(reactive_level, reactive_anc)
+        reactive_dose = DOSE_LEVELS[reactive_level] * protocol_dose
+
+        doses = np.concatenate(([protocol_dose, reactive_dose], candidates))
+        state = np.column_stack([nominal, reactive] + [anticipatory] * len(candidates))
+        state, circ = integrateCycle(state, doses / bsa, baseline)
+
+        best = 2 + int(np.argmin(anticipatoryCost(circ[:, 2:])))
+        nominal, reactive, anticipatory = state[:, 0], state[:, 1], state[:, best]
+        reactive_anc = reactive[5]
+
+        trajectories = [
+            np.interp(sample_time, step_time, circ[:, column])
+            for column in (0, 1, best)
+        ]
+        yield (
+            cycle * DAYS_PER_CYCLE + sample_time,
+            trajectories[0],
+            trajectories[1],
+            trajectories[2],
+            np.full(samples, reactive_dose),
+            np.full(samples, doses[best]),
+        )
+
+
+def simulate(bsa, numCycles, dosage, ANC_measurements, token=None):
+    cycles = list(simulateCycles(bsa, numCycles, dosage, ANC_measurements, token))
+    if not cycles:
+        return tuple(np.empty(0) for _ in range(6))
+    return tuple(np.concatenate(outputs) for outputs in zip(*cycles))
+
+
+class NumpyBackend(SimulationBackend):
+    name = "numpy"
+
+    def version(self):
+        return MODEL_VERSION
+
+    def simulate(self, bsa, numCycles, dosage, ANC_measurements, token=None):
+        return simulate(bsa, numCycles, dosage, ANC_measurements, token)
+
+    def simulateCycles(self, bsa, numCycles, dosage, ANC_measurements, token=None):
+        for outputs in simulateCycles(bsa, numCycles, dosage, ANC_measurements, token):
+            yield 1, outputs
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+# the modules of the application are imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# read by util/config.py when it is imported, hashing at the default cost slows the tests down
+os.environ.setdefault("LEUKEMIA_BCRYPT_ROUNDS", "4")
+
+from util.connections import ConnectionManager
+from util.migrations import migrate
+from util.repository import OncologistRepository, PatientRepository
+from util.util import CryptoContext, hashPassword
+
+PASSWORD = "password"
+
+
+def patientFields(i):
+    return {
+        "user_id": "patient{:04d}".format(i),
+        "name": "Patient Number {}".format(i),
+        "phone_number": "416555{:04d}".format(i),
+        "birthday": "19900101",
+        "age": 33,
+        "blood_type": "AB+",
+        "all_type": "Immunophenotype",
+        "weight": 70.5,
+        "height": 175.0,
+        "body_surface_area": 1.86,
+        "sex": "Female",
+    }
+
+
+@pytest.fixture
+def makeFields():
+    return patientFields
+
+
+@pytest.fixture
+def crypto():
+    return CryptoContext(PASSWORD)
+
+
+# a migrated database with the oncologist "doc", whose password is PASSWORD
+@pytest.fixture
+def database(tmp_path):
+    database = ConnectionManager(str(tmp_path / "db.db"))
+    migrate(database.connection())
+    OncologistRepository(database).insert("doc", hashPassword(PASSWORD), "Doc Who")
+    yield database
+    database.close()
+
+
+# adds patients 1..count to "doc", returns their ids
+@pytest.fixture
+def addPatients(database, crypto):
+    def add(count):
+        patients = PatientRepository(database)
+        return [
+            patients.insert("doc", patientFields(i), crypto)
+            for i in range(1, count + 1)
+        ]
+
+    return add
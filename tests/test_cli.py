@@ -0,0 +1,69 @@
+import pytest
+
+import cli
+import simulation.batch
+from simulation.cache import SimulationCache
+from simulation.numpy_backend import NumpyBackend
+from util.repository import MeasurementRepository
+
+
+@pytest.fixture
+def runCli(database, tmp_path, monkeypatch):
+    monkeypatch.setenv("LEUKEMIA_PASSWORD", "password")
+    # the batch worker processes get the backend by name
+    backend = NumpyBackend()
+    cache = SimulationCache(str(tmp_path / "cache.db"))
+    for module in (cli, simulation.batch):
+        monkeypatch.setattr(module, "getBackend", lambda name=None: backend)
+        monkeypatch.setattr(module, "getSimulationCache", lambda: cache)
+
+    def run(*argv):
+        return cli.main(["-u", "doc", "--db", database.path] + list(argv))
+
+    run.cache = cache
+    yield run
+    cache.close()
+
+
+# patients 1 and 2 have measurements (different ones, so their results are
+# cached apart), patient 3 does not
+@pytest.fixture
+def patientIds(database, addPatients):
+    patient_ids = addPatients(3)
+    measurements = MeasurementRepository(database)
+    for patient_id in patient_ids[:2]:
+        measurements.insertMeasurement(patient_id, "20230101", 2 + patient_id, 52.0)
+    return patient_ids
+
+
+def testSimulate(runCli, patientIds, tmp_path, capsys):
+    output = tmp_path / "results"
+    assert runCli("simulate", "1", "2", "--cycles", "1", "--output", str(output)) == 0
+    assert sorted(path.name for path in output.iterdir()) == [
+        "patient_1.csv",
+        "patient_2.csv",
+    ]
+    assert runCli("simulate", "1", "--cycles", "1") == 0
+    assert "patient0001 (1): reactive dosage" in capsys.readouterr().out
+
+
+def testSimulateSkippedPatients(runCli, patientIds, capsys):
+    # 3 has no measurements, 4 does not exist
+    assert runCli("simulate", "1", "3", "4", "--cycles", "1") == 1
+    out = capsys.readouterr().out
+    assert "patient0001 (1)" in out
+    assert "2 patients skipped" in out
+
+
+def testBatch(runCli, patientIds, capsys):
+    assert runCli("batch", "--cycles", "1", "--processes", "1") == 0
+    assert "2 patients simulated, 0 already up to date, 0 failed" in (
+        capsys.readouterr().out
+    )
+    assert runCli.cache.stats()["entries"] == 2
+
+
+def testBatchFailures(runCli, patientIds, monkeypatch):
+    summary = {"total": 2, "simulated": 1, "skipped": 0, "failed": 1}
+    monkeypatch.setattr(simulation.batch, "runBatch", lambda *args, **kwargs: summary)
+    assert runCli("batch") == 1
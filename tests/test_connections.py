@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from util.connections import ConnectionManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ConnectionManager(str(tmp_path / "db.db"))
+    with manager.writer() as conn:
+        conn.execute("CREATE TABLE numbers (value INTEGER)")
+    yield manager
+    manager.close()
+
+
+# runs function in another thread, returns its result
+def inThread(function):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def countNumbers(manager):
+    return manager.connection().execute("SELECT COUNT(*) FROM numbers").fetchone()[0]
+
+
+def testEveryThreadHasItsOwnConnection(manager):
+    conn = manager.connection()
+    assert manager.connection() is conn
+    other = inThread(manager.connection)
+    assert other is not conn
+    for connection in (conn, other):
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert connection.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def testReadersDoNotWaitForTheWriter(manager):
+    with manager.writer() as conn:
+        conn.execute("INSERT INTO numbers VALUES (1)")
+        # the other thread reads the last commit while the write is not committed
+        assert inThread(lambda: countNumbers(manager)) == 0
+    assert inThread(lambda: countNumbers(manager)) == 1
+
+
+def testWritesAreSerialized(manager):
+    entered = threading.Event()
+    events = []
+
+    def write(value):
+        with manager.writer() as conn:
+            events.append(("start", value))
+            entered.set()
+            conn.execute("INSERT INTO numbers VALUES (?)", (value,))
+            time.sleep(0.1)
+            events.append(("end", value))
+        manager.closeThreadConnection()
+
+    first = threading.Thread(target=write, args=(1,))
+    first.start()
+    entered.wait(5)
+    second = threading.Thread(target=write, args=(2,))
+    second.start()
+    first.join()
+    second.join()
+    assert events == [("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+    rows = manager.connection().execute("SELECT value FROM numbers").fetchall()
+    assert rows == [(1,), (2,)]
+
+
+def testFailedWritesAreRolledBack(manager):
+    with pytest.raises(sqlite3.OperationalError):
+        with manager.writer() as conn:
+            conn.execute("INSERT INTO numbers VALUES (1)")
+            conn.execute("INSERT INTO missing VALUES (1)")
+    assert countNumbers(manager) == 0
+
+
+def testCloseThreadConnection(manager):
+    conn = manager.connection()
+    manager.closeThreadConnection()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert manager.connection() is not conn
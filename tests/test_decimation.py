@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from simulation.decimation import decimateOutputs, decimationIndices
+
+LENGTH = 21 * 3 * 1000
+
+
+def modelOutputs():
+    time = np.arange(LENGTH) / 1000
+    trajectories = [
+        1.5 + np.sin(time / 3),
+        1.5 + np.cos(time / 5),
+        1.5 + np.sin(time / 7) * np.exp(-time / 50),
+    ]
+    # a spike the decimation must not smooth away
+    trajectories[0][12345] = 9.0
+    trajectories[1][23456] = -3.0
+    return [time] + trajectories + [np.full(LENGTH, 50.0), np.full(LENGTH, 60.0)]
+
+
+def testStrideKeepsEveryStrideSample():
+    time = modelOutputs()[0]
+    indices = decimationIndices(time, [], method="stride", stride=100)
+    assert indices[0] == 0
+    assert len(indices) == LENGTH // 100
+    assert np.all(np.diff(indices) == 100)
+
+
+@pytest.mark.parametrize("method", ["minmax", "lttb"])
+def testEndpointsAreKept(method):
+    outputs = modelOutputs()
+    indices = decimationIndices(outputs[0], outputs[1:4], method=method)
+    assert indices[0] == 0
+    assert indices[-1] == LENGTH - 1
+
+
+@pytest.mark.parametrize("method", ["minmax", "lttb"])
+@pytest.mark.parametrize("target_points", [30, 300, 2000])
+def testSizesAreWithinBounds(method, target_points):
+    outputs = modelOutputs()
+    indices = decimationIndices(
+        outputs[0], outputs[1:4], method=method, target_points=target_points
+    )
+    # the first and last samples are shared by the trajectories
+    assert len(indices) <= target_points + 2
+    assert len(indices) >= min(target_points // 3, LENGTH)
+    assert np.all(np.diff(indices) > 0)
+
+
+def testShortOutputsAreKept():
+    outputs = modelOutputs()
+    time = outputs[0][:100]
+    indices = decimationIndices(
+        time, [y[:100] for y in outputs[1:4]], method="lttb", target_points=2000
+    )
+    assert np.array_equal(indices, np.arange(100))
+
+
+def testMinMaxKeepsTheExtremes():
+    outputs = modelOutputs()
+    decimated = decimateOutputs(outputs, method="minmax", target_points=60)
+    for full, kept in zip(outputs[1:4], decimated[1:4]):
+        assert kept.max() == full.max()
+        assert kept.min() == full.min()
+
+
+def testOutputsStayAligned():
+    outputs = modelOutputs()
+    decimated = decimateOutputs(outputs, method="lttb", target_points=300)
+    assert len({len(output) for output in decimated}) == 1
+    indices = np.searchsorted(outputs[0], decimated[0])
+    for full, kept in zip(outputs, decimated):
+        assert np.array_equal(full[indices], kept)
+
+
+def testUnknownMethod():
+    outputs = modelOutputs()
+    with pytest.raises(ValueError):
+        decimationIndices(outputs[0], outputs[1:4], method="average")
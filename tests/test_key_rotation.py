@@ -0,0 +1,94 @@
+import pytest
+
+from util.key_rotation import pendingKeyRotation, rotateKey
+from util.patient_record import decryptRecord
+from util.util import CryptoContext, checkLogin
+
+NEW_PASSWORD = "new password"
+
+
+class Interrupted(Exception):
+    pass
+
+
+# interrupts the rotation before the batch number batches
+class InterruptToken:
+    def __init__(self, batches):
+        self.batches = batches
+
+    def check(self):
+        if self.batches == 0:
+            raise Interrupted()
+        self.batches -= 1
+
+
+def records(conn):
+    return conn.execute(
+        "SELECT id, record FROM patients WHERE oncologist_id='doc' ORDER BY id"
+    ).fetchall()
+
+
+def testRotationResumesAfterAnInterruption(database, addPatients, crypto):
+    ids = addPatients(5)
+    conn = database.connection()
+    new_crypto = CryptoContext(NEW_PASSWORD)
+
+    with pytest.raises(Interrupted):
+        rotateKey(
+            conn,
+            "doc",
+            "password",
+            NEW_PASSWORD,
+            batch_size=2,
+            token=InterruptToken(1),
+        )
+    assert pendingKeyRotation(conn, "doc")
+    last_id = conn.execute(
+        "SELECT last_patient_id FROM key_rotations WHERE username='doc'"
+    ).fetchone()[0]
+    assert last_id == ids[1]
+    # the first batch uses the new key, the others the old one
+    for patient_id, record in records(conn):
+        decryptRecord(record, new_crypto if patient_id <= last_id else crypto)
+    # the password is only replaced once every patient is re-encrypted
+    checkLogin(conn, "doc", "password")
+
+    progress = []
+    rotated = rotateKey(
+        conn,
+        "doc",
+        "password",
+        NEW_PASSWORD,
+        batch_size=2,
+        progress=lambda done, total: progress.append((done, total)),
+    )
+    assert rotated == 3
+    assert progress == [(4, 5), (5, 5)]
+    assert not pendingKeyRotation(conn, "doc")
+    checkLogin(conn, "doc", NEW_PASSWORD)
+    for i, (patient_id, record) in enumerate(records(conn), start=1):
+        assert decryptRecord(record, new_crypto)["user_id"] == "patient{:04d}".format(i)
+
+
+def testResumingWithAnotherPasswordFails(database, addPatients):
+    addPatients(3)
+    conn = database.connection()
+    with pytest.raises(Interrupted):
+        rotateKey(
+            conn,
+            "doc",
+            "password",
+            NEW_PASSWORD,
+            batch_size=1,
+            token=InterruptToken(1),
+        )
+    with pytest.raises(AssertionError):
+        rotateKey(conn, "doc", "password", "another password", batch_size=1)
+    assert pendingKeyRotation(conn, "doc")
+
+
+def testWrongOldPassword(database, addPatients):
+    addPatients(1)
+    with pytest.raises(AssertionError):
+        rotateKey(database.connection(), "doc", "wrong", NEW_PASSWORD)
+    assert not pendingKeyRotation(database.connection(), "doc")
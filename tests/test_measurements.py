@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import numpy as np
+
+from util.patient import Patient, measurementArrays
+from util.patient_record import encryptRecord
+
+ROWS = [
+    ("19991231", 50.0, 2.1),
+    ("20000101", 52.5, 1.8),
+    ("20240229", 60.0, 2.4),
+    ("20241001", 47.5, 0.9),
+]
+
+
+def testMeasurementArrays():
+    times, anc, dosage = measurementArrays(ROWS)
+    assert times.dtype == np.dtype("datetime64[D]")
+    expected = [np.datetime64(datetime.strptime(row[0], "%Y%m%d"), "D") for row in ROWS]
+    assert list(times) == expected
+    assert anc.dtype == dosage.dtype == np.float64
+    assert np.array_equal(anc, [2.1, 1.8, 2.4, 0.9])
+    assert np.array_equal(dosage, [50.0, 52.5, 60.0, 47.5])
+
+
+def testNoMeasurements():
+    times, anc, dosage = measurementArrays([])
+    assert times.dtype == np.dtype("datetime64[D]")
+    assert len(times) == len(anc) == len(dosage) == 0
+
+
+def testAddMeasurement(crypto, makeFields):
+    patient = Patient.fromRecord(
+        1,
+        encryptRecord(makeFields(1), crypto),
+        crypto,
+        measurementArrays(ROWS[:2]),
+        "doc",
+    )
+    assert patient.hasMeasurements()
+    patient.addMeasurement("20000102", 2.0, 55.0)
+    assert patient.measurementTimes[-1] == np.datetime64("2000-01-02")
+    assert patient.modelInputs(3) == (1.86, 4.0, [55.0], [2.0])
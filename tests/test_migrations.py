@@ -0,0 +1,42 @@
+import sqlite3
+
+import pytest
+
+from util.migrations import MIGRATIONS, checkQueryPlans, migrate, schemaVersion
+
+
+def testMigrateReachesTheLatestVersion():
+    conn = sqlite3.connect(":memory:")
+    assert migrate(conn) == len(MIGRATIONS)
+    assert schemaVersion(conn) == len(MIGRATIONS) == 5
+    # a database that is up to date is left as it is
+    assert migrate(conn) == 0
+    assert schemaVersion(conn) == 5
+
+
+def testMigrateResumesFromTheSavedVersion():
+    conn = sqlite3.connect(":memory:")
+    MIGRATIONS[0](conn)
+    conn.execute("PRAGMA user_version = 1")
+    assert migrate(conn) == len(MIGRATIONS) - 1
+    assert schemaVersion(conn) == len(MIGRATIONS)
+
+
+def testMigrateRefusesANewerSchema():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("PRAGMA user_version = {:d}".format(len(MIGRATIONS) + 1))
+    with pytest.raises(RuntimeError):
+        migrate(conn)
+
+
+def testQueriesUseTheIndexes():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    assert checkQueryPlans(conn) == []
+
+
+def testQueryPlansWithoutTheIndexes():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.execute("DROP INDEX measurements_patient")
+    assert checkQueryPlans(conn) == ["measurements_patient", "measurements_patient"]
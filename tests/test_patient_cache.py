@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+
+import util.patient_cache
+from util.patient_cache import PatientCache
+
+
+# stands in for the time module of util.patient_cache
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(util.patient_cache, "time", clock)
+    return clock
+
+
+def patient(patient_id):
+    return SimpleNamespace(id=patient_id)
+
+
+def testGetAndInvalidate(clock):
+    cache = PatientCache(max_size=3, ttl_seconds=60)
+    first = patient(1)
+    cache.put(first)
+    assert cache.get(1) is first
+    assert cache.get(2) is None
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    cache.put(patient(2))
+    cache.clear()
+    assert len(cache) == 0
+
+
+def testEntriesExpire(clock):
+    cache = PatientCache(max_size=3, ttl_seconds=60)
+    cache.put(patient(1))
+    clock.now += 30
+    cache.put(patient(2))
+    # reading an entry does not extend its lifetime
+    assert cache.get(1) is not None
+    clock.now += 30
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+    clock.now += 30
+    assert cache.get(2) is None
+    assert len(cache) == 0
+
+
+def testLeastRecentlyUsedEntriesAreEvicted(clock):
+    cache = PatientCache(max_size=2, ttl_seconds=60)
+    cache.put(patient(1))
+    cache.put(patient(2))
+    # 1 becomes the most recently used
+    assert cache.get(1) is not None
+    cache.put(patient(3))
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    assert cache.get(3) is not None
+    assert len(cache) == 2
+
+
+def testDisabled(clock):
+    cache = PatientCache(max_size=0)
+    cache.put(patient(1))
+    assert cache.get(1) is None
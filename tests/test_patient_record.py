@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+from util.patient_record import (
+    PHI_FIELDS,
+    decryptRecord,
+    decryptRecordChunks,
+    encryptRecord,
+)
+from util.util import CryptoContext
+
+
+# the fields are stored as text
+def stored(fields):
+    return {name: str(fields[name]) for name in PHI_FIELDS}
+
+
+@pytest.fixture
+def fields(makeFields):
+    return makeFields
+
+
+@pytest.mark.parametrize("cipher, kind", [("fernet", str), ("aesgcm", bytes)])
+def testRecordRoundTrip(crypto, fields, cipher, kind):
+    record = encryptRecord(fields(1), crypto, cipher=cipher)
+    assert isinstance(record, kind)
+    assert decryptRecord(record, crypto) == stored(fields(1))
+
+
+def testBothCiphersDecryptFromTheDatabase(crypto, fields):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE patients (id INTEGER PRIMARY KEY, record BLOB)")
+    conn.executemany(
+        "INSERT INTO patients (id, record) VALUES (?, ?)",
+        [
+            (i, encryptRecord(fields(i), crypto, cipher=cipher))
+            for i, cipher in enumerate(["fernet", "aesgcm", "fernet", "aesgcm"], 1)
+        ],
+    )
+    rows = conn.execute("SELECT id, record FROM patients ORDER BY id").fetchall()
+    # Fernet tokens come back as TEXT, AES-GCM records as BLOB
+    assert [type(record) for _, record in rows] == [str, bytes, str, bytes]
+    for patient_id, record in rows:
+        assert decryptRecord(record, crypto) == stored(fields(patient_id))
+
+    chunks = decryptRecordChunks(
+        rows, crypto, workers=2, chunk_size=2, first_chunk_size=1
+    )
+    decrypted = [row for chunk in chunks for row in chunk]
+    assert decrypted == [(i, stored(fields(i))) for i in range(1, 5)]
+
+
+@pytest.mark.parametrize("cipher", ["fernet", "aesgcm"])
+def testWrongKeyFails(crypto, fields, cipher):
+    record = encryptRecord(fields(1), crypto, cipher=cipher)
+    with pytest.raises(Exception):
+        decryptRecord(record, CryptoContext("another password"))
+
+
+def testUnknownCipher(crypto, fields):
+    with pytest.raises(ValueError):
+        encryptRecord(fields(1), crypto, cipher="rot13")
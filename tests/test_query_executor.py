@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+from PyQt6.QtCore import QCoreApplication
+
+from util.repository import OncologistRepository
+from widget_pages.query_executor import QueryExecutor
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def executor(app, database):
+    executor = QueryExecutor(database)
+    yield executor
+    executor.shutdown(timeout=5)
+
+
+# the results are delivered by the event loop of the GUI thread
+def waitFor(app, condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        app.processEvents()
+        time.sleep(0.01)
+
+
+# a slot appending the results it receives to results
+def collect(results):
+    return lambda result, error: results.append(result)
+
+
+# a query that runs until release is set, keeping the worker busy
+def blockingQuery(executor):
+    started = threading.Event()
+    release = threading.Event()
+
+    def query():
+        started.set()
+        release.wait(5)
+        return "released"
+
+    executor.submit("blocking", lambda result, error: None, query)
+    started.wait(5)
+    return release
+
+
+def testResultsAreDelivered(app, executor, database):
+    results = []
+    executor.submit(
+        "fullName",
+        lambda result, error: results.append((result, error)),
+        OncologistRepository(database).fullName,
+        "doc",
+    )
+    assert executor.isPending("fullName")
+    waitFor(app, lambda: results)
+    assert results == [("Doc Who", "")]
+    assert not executor.isPending("fullName")
+
+
+def testAQueryReplacesTheOneOfTheSameKey(app, executor):
+    release = blockingQuery(executor)
+    ran = []
+    results = []
+
+    def query(value):
+        ran.append(value)
+        return value
+
+    for value in (1, 2, 3):
+        executor.submit("patient", collect(results), query, value)
+    executor.submit("other", collect(results), query, 4)
+    release.set()
+    waitFor(app, lambda: not executor.isPending("other"))
+    # the replaced queries are not run at all
+    assert ran == [3, 4]
+    assert results == [3, 4]
+
+
+def testReplacedResultsAreDropped(app, executor):
+    results = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slowQuery():
+        started.set()
+        release.wait(5)
+        return "old"
+
+    executor.submit("patient", collect(results), slowQuery)
+    started.wait(5)
+    # replaced while it runs, its result arrives first and is dropped
+    executor.submit("patient", collect(results), str, "new")
+    release.set()
+    waitFor(app, lambda: not executor.isPending("patient"))
+    assert results == ["new"]
+
+
+def testCancel(app, executor):
+    release = blockingQuery(executor)
+    results = []
+    executor.submit("a", collect(results), str, "a")
+    executor.submit("b", collect(results), str, "b")
+    executor.submit("c", collect(results), str, "c")
+    executor.cancel("a")
+    assert not executor.isPending("a")
+    release.set()
+    waitFor(app, lambda: not executor.isPending("c"))
+    assert results == ["b", "c"]
+
+    release = blockingQuery(executor)
+    executor.submit("d", collect(results), str, "d")
+    executor.cancelAll()
+    release.set()
+    executor.submit("e", collect(results), str, "e")
+    waitFor(app, lambda: not executor.isPending("e"))
+    assert results == ["b", "c", "e"]
+
+
+def testErrorsAreDelivered(app, executor):
+    results = []
+
+    def failingQuery():
+        raise RuntimeError("disk I/O error")
+
+    executor.submit(
+        "failing", lambda result, error: results.append((result, error)), failingQuery
+    )
+    waitFor(app, lambda: results)
+    assert results == [(None, "Could not read from the database")]
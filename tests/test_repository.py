@@ -0,0 +1,71 @@
+import numpy as np
+
+from util.repository import MeasurementRepository, PatientRepository
+
+
+# the statements run on the connection of the calling thread
+def traceStatements(database):
+    statements = []
+    database.connection().set_trace_callback(statements.append)
+    return statements
+
+
+def addMeasurements(database, patient_ids):
+    MeasurementRepository(database).insertMeasurements(
+        (patient_id, "2023010{}".format(day), patient_id + day / 10, 50.0 + day)
+        for patient_id in patient_ids
+        # inserted out of order, they are read oldest first
+        for day in (3, 1, 2)
+    )
+
+
+def testGetManyKeepsTheOrder(database, crypto, addPatients):
+    patient_ids = addPatients(5)
+    addMeasurements(database, patient_ids[:3])
+    patients = PatientRepository(database).getMany([4, 99, 2, 1], crypto)
+    # patients that do not exist are left out
+    assert [patient.id for patient in patients] == [4, 2, 1]
+    assert [patient.user_id for patient in patients] == [
+        "patient0004",
+        "patient0002",
+        "patient0001",
+    ]
+    assert all(patient.assignedDoctor == "doc" for patient in patients)
+    assert not patients[0].hasMeasurements()
+    assert np.array_equal(
+        patients[1].measurementTimes,
+        np.array(["2023-01-01", "2023-01-02", "2023-01-03"], dtype="datetime64[D]"),
+    )
+    assert np.allclose(patients[1].ancMeasurement, [2.1, 2.2, 2.3])
+    assert np.allclose(patients[1].dosageMeasurement, [51.0, 52.0, 53.0])
+
+
+def testGetManyMatchesGet(database, crypto, addPatients):
+    patient_ids = addPatients(3)
+    addMeasurements(database, patient_ids)
+    patients = PatientRepository(database)
+    for patient in patients.getMany(patient_ids, crypto):
+        expected = patients.get(patient.id, crypto)
+        assert patient.recordFields() == expected.recordFields()
+        assert np.array_equal(patient.measurementTimes, expected.measurementTimes)
+        assert np.array_equal(patient.ancMeasurement, expected.ancMeasurement)
+        assert np.array_equal(patient.dosageMeasurement, expected.dosageMeasurement)
+
+
+def testGetManyRunsTwoQueries(database, crypto, addPatients):
+    patient_ids = addPatients(30)
+    addMeasurements(database, patient_ids)
+    statements = traceStatements(database)
+    patients = PatientRepository(database).getMany(patient_ids, crypto)
+    assert len(patients) == 30
+    assert len(statements) == 2
+    assert PatientRepository(database).getMany([], crypto) == []
+
+
+def testDeleteRemovesTheMeasurements(database, crypto, addPatients):
+    patient_ids = addPatients(2)
+    addMeasurements(database, patient_ids)
+    PatientRepository(database).delete(patient_ids[0])
+    measurements = MeasurementRepository(database)
+    assert measurements.forPatient(patient_ids[0]) == []
+    assert len(measurements.forPatient(patient_ids[1])) == 3
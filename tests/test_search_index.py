@@ -0,0 +1,61 @@
+import pytest
+
+from util.repository import PatientRepository
+from util.search_index import ngrams, searchPatientRows, searchQuery
+from util.util import CryptoContext
+
+
+def testNgrams():
+    assert ngrams("Ab  CDe") == {"ab ", "b c", " cd", "cde"}
+    assert ngrams("ab") == set()
+
+
+def testSearchQuery():
+    assert searchQuery("ab", "") is None
+    assert searchQuery("  Pat ", "p1") == ("pat", "")
+    assert searchQuery("", "patient0001") == ("", "patient0001")
+
+
+@pytest.fixture
+def conn(database, addPatients):
+    addPatients(25)
+    return database.connection()
+
+
+def matchingIds(conn, crypto, name="", user_id=""):
+    return [row[0] for row in searchPatientRows(conn, "doc", crypto, name, user_id)]
+
+
+def testNameMatchesEveryNgram(conn, crypto):
+    # "Patient Number 2", "Patient Number 20" ... "Patient Number 25"
+    assert matchingIds(conn, crypto, name="number 2") == [2] + list(range(20, 26))
+    assert matchingIds(conn, crypto, name="NUMBER   12") == [12]
+    assert matchingIds(conn, crypto, name="number 99") == []
+
+
+def testUserIdAndNameAreCombined(conn, crypto):
+    assert matchingIds(conn, crypto, user_id="0012") == [12]
+    assert matchingIds(conn, crypto, name="number 2", user_id="0012") == []
+    assert matchingIds(conn, crypto, name="number 1", user_id="0012") == [12]
+
+
+# the n-grams of "t001" are also those of "patient0001", the callers check the
+# decrypted results against the query
+def testNgramsCanMatchWithoutTheSubstring(conn, crypto):
+    assert matchingIds(conn, crypto, user_id="t001") == [1] + list(range(10, 20))
+
+
+def testShortQueriesAreNotFiltered(conn, crypto):
+    assert matchingIds(conn, crypto, name="nu") == list(range(1, 26))
+
+
+def testOtherKeysDoNotMatch(conn):
+    assert matchingIds(conn, CryptoContext("another password"), name="number") == []
+
+
+def testIndexFollowsUpdates(database, conn, crypto):
+    patients = PatientRepository(database)
+    fields = patients.get(3, crypto).recordFields()
+    patients.update(3, dict(fields, name="Renamed Patient"), crypto)
+    assert matchingIds(conn, crypto, name="renamed") == [3]
+    assert 3 not in matchingIds(conn, crypto, name="number 3")
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import simulation.cache
+from simulation.cache import SimulationCache, cacheKey, encodeOutputs
+from simulation.numpy_backend import NumpyBackend
+
+INPUTS = (1.6, 4.0, [52.0], [2.2])
+
+
+class NextVersionBackend(NumpyBackend):
+    def version(self):
+        return "next"
+
+
+def outputs(seed, length=2000):
+    rng = np.random.default_rng(seed)
+    return tuple(rng.random(length) for _ in range(6))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SimulationCache(str(tmp_path / "cache.db"))
+    yield cache
+    cache.close()
+
+
+def testKeyIsStable():
+    backend = NumpyBackend()
+    key = cacheKey(backend, *INPUTS)
+    assert key == cacheKey(backend, *INPUTS)
+    # the same values of other types, or rounded away
+    assert key == cacheKey(backend, np.float64(1.6), 4, np.array([52.0]), [2.2 + 1e-9])
+
+
+def testKeyDependsOnTheInputs():
+    backend = NumpyBackend()
+    key = cacheKey(backend, *INPUTS)
+    assert key != cacheKey(backend, 1.7, 4.0, [52.0], [2.2])
+    assert key != cacheKey(backend, 1.6, 5.0, [52.0], [2.2])
+    assert key != cacheKey(backend, 1.6, 4.0, [53.0], [2.2])
+    assert key != cacheKey(backend, 1.6, 4.0, [52.0], [2.3])
+    assert key != cacheKey(NextVersionBackend(), *INPUTS)
+
+
+def testKeyDependsOnTheDecimation(monkeypatch):
+    backend = NumpyBackend()
+    key = cacheKey(backend, *INPUTS)
+    monkeypatch.setattr(simulation.cache, "DECIMATION_METHOD", "lttb")
+    assert key != cacheKey(backend, *INPUTS)
+    monkeypatch.undo()
+    monkeypatch.setattr(simulation.cache, "DECIMATION_STRIDE", 10)
+    assert key != cacheKey(backend, *INPUTS)
+    monkeypatch.undo()
+    monkeypatch.setattr(simulation.cache, "DECIMATION_TARGET_POINTS", 500)
+    assert key != cacheKey(backend, *INPUTS)
+
+
+def testPutAndGet(cache):
+    expected = outputs(0)
+    assert cache.get("a") is None
+    cache.put("a", 1, expected)
+    assert cache.contains("a")
+    for output, cached in zip(expected, cache.get("a")):
+        assert np.array_equal(output, cached)
+
+
+def testLeastRecentlyUsedEntriesAreEvicted(cache):
+    size = len(encodeOutputs(outputs(0)))
+    cache.max_bytes = int(size * 2.5)
+    cache.put("a", 1, outputs(0))
+    cache.put("b", 2, outputs(1))
+    # "a" becomes the most recently used
+    assert cache.get("a") is not None
+    cache.put("c", 3, outputs(2))
+    assert cache.contains("a")
+    assert not cache.contains("b")
+    assert cache.contains("c")
+    assert cache.stats()["size"] <= cache.max_bytes
+
+
+def testInvalidatePatient(cache):
+    cache.put("a", 1, outputs(0))
+    cache.put("b", 1, outputs(1))
+    cache.put("c", 2, outputs(2))
+    cache.invalidatePatient(1)
+    assert not cache.contains("a")
+    assert not cache.contains("b")
+    assert cache.contains("c")
+    assert cache.stats()["entries"] == 1
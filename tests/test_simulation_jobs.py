@@ -0,0 +1,97 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from simulation.jobs import CANCELLED, DONE, FOREGROUND, SimulationQueue
+
+
+# runs once release is set, records the order the jobs were started in by their bsa
+class BlockingBackend:
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+
+    def runCycles(self, bsa, num_cycles, dosage, anc, token=None):
+        self.started.append(bsa)
+        self.release.wait(5)
+        for cycle in range(num_cycles):
+            token.check()
+            yield tuple(np.arange(3.0) + cycle for _ in range(6))
+
+
+def waitFor(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def backend():
+    return BlockingBackend()
+
+
+@pytest.fixture
+def makeQueue(backend):
+    queues = []
+
+    def make(**kwargs):
+        queue = SimulationQueue(workers=1, backend=backend, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    backend.release.set()
+    for queue in queues:
+        queue.shutdown()
+
+
+def testForegroundJobsRunFirst(backend, makeQueue):
+    queue = makeQueue()
+    jobs = [queue.submit(1, 1, 2, [], [])]
+    waitFor(lambda: backend.started == [1])
+    jobs += [queue.submit(patient_id, patient_id, 2, [], []) for patient_id in (2, 3)]
+    jobs.append(queue.submit(4, 4, 2, [], [], priority=FOREGROUND))
+    jobs.append(queue.submit(5, 5, 2, [], []))
+    queue.prioritize(5)
+    backend.release.set()
+    waitFor(lambda: all(job.status == DONE for job in jobs))
+    # patient 4 lost its priority when patient 5 was put on screen
+    assert backend.started == [1, 5, 2, 3, 4]
+    assert len(jobs[0].outputs[0]) == 6
+
+
+def testCancelledJobsAreNotRun(backend, makeQueue):
+    queue = makeQueue()
+    running = queue.submit(1, 1, 2, [], [])
+    waitFor(lambda: backend.started == [1])
+    queued = queue.submit(2, 2, 2, [], [])
+    replaced = queue.submit(3, 3, 2, [], [])
+    # a new run of the patient cancels the previous one
+    latest = queue.submit(3, 3.5, 2, [], [])
+    queue.cancel(1)
+    queue.cancel(2)
+    assert running.token.isCancelled()
+    backend.release.set()
+    waitFor(lambda: latest.status == DONE)
+    assert backend.started == [1, 3.5]
+    for job in (running, queued, replaced):
+        assert job.status == CANCELLED
+        assert job.message == "Simulation cancelled"
+        assert job.outputs is None
+
+
+def testTimeoutStartsWhenTheJobRuns(backend, makeQueue):
+    queue = makeQueue(timeout=0.2)
+    first = queue.submit(1, 1, 2, [], [])
+    waitFor(lambda: backend.started == [1])
+    second = queue.submit(2, 2, 2, [], [])
+    time.sleep(0.4)
+    backend.release.set()
+    waitFor(lambda: not second.isActive())
+    assert first.status == CANCELLED
+    assert first.message == "Simulation timed out"
+    # waited in the queue for longer than the timeout, but ran within it
+    assert second.status == DONE
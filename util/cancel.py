@@ -0,0 +1,55 @@
+import threading
+import time
+
+"""
+
+Cancellation of long running work done off the GUI thread: model runs,
+batch simulations and password changes.
+
+A CancelToken is shared between the thread requesting the work and the
+thread doing it. The worker calls check() between steps (e.g. between
+cycles, or while waiting for MATLAB), which raises SimulationCancelled once
+cancel() was called or the timeout expired.
+
+"""
+
+
+class SimulationCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    def __init__(self, timeout=None):
+        self._event = threading.Event()
+        self.deadline = None
+        self.reason = None
+        self.startTimeout(timeout)
+
+    # the timeout is counted from now, no timeout when it is None
+    def startTimeout(self, timeout):
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def isCancelled(self):
+        if (
+            not self._event.is_set()
+            and self.deadline is not None
+            and time.monotonic() >= self.deadline
+        ):
+            self.cancel("timed out")
+        return self._event.is_set()
+
+    def check(self):
+        if self.isCancelled():
+            raise SimulationCancelled(self.reason)
+
+    # sleeps for at most seconds, returning early when cancelled
+    def wait(self, seconds):
+        if self.deadline is not None:
+            seconds = max(min(seconds, self.deadline - time.monotonic()), 0)
+        self._event.wait(seconds)
+        return self.isCancelled()
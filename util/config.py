@@ -0,0 +1,96 @@
+import os
+
+# Application wide settings. Every value can be overridden through an
+# environment variable of the same name prefixed with "LEUKEMIA_".
+
+
+def _envValue(name, default, cast=str):
+    value = os.environ.get("LEUKEMIA_" + name)
+    if value is None or value == "":
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+
+# path of the Leukemia-Treatment-Project submodule containing runController.m
+MATLAB_PROJECT_PATH = _envValue("MATLAB_PROJECT_PATH", "Leukemia-Treatment-Project")
+
+# number of MATLAB engines kept warm in the background
+MATLAB_POOL_SIZE = _envValue("MATLAB_POOL_SIZE", 1, int)
+
+# an engine is restarted after this many model runs (0 disables recycling)
+MATLAB_ENGINE_MAX_RUNS = _envValue("MATLAB_ENGINE_MAX_RUNS", 20, int)
+
+# simulation backend used by the dashboard, "matlab" runs the clinical model,
+# "numpy" is a non-clinical approximation for development without MATLAB
+SIMULATION_BACKEND = _envValue("SIMULATION_BACKEND", "matlab")
+
+# simulation results are cached in this SQLite file, next to db.db
+SIMULATION_CACHE_PATH = _envValue("SIMULATION_CACHE_PATH", "simulation_cache.db")
+
+# least recently used results are evicted once the cache grows past this size
+SIMULATION_CACHE_MAX_BYTES = _envValue(
+    "SIMULATION_CACHE_MAX_BYTES", 64 * 1024 * 1024, int
+)
+
+# decimation of the model outputs before they are displayed: "stride" keeps
+# every DECIMATION_STRIDE-th sample, "minmax" keeps the minimum and maximum of
+# each bucket and "lttb" keeps DECIMATION_TARGET_POINTS points chosen with the
+# largest triangle three buckets algorithm
+DECIMATION_METHOD = _envValue("DECIMATION_METHOD", "stride")
+DECIMATION_STRIDE = _envValue("DECIMATION_STRIDE", 100, int)
+DECIMATION_TARGET_POINTS = _envValue("DECIMATION_TARGET_POINTS", 2000, int)
+
+# model runs taking longer than this are cancelled (0 disables the timeout)
+SIMULATION_TIMEOUT_SECONDS = _envValue("SIMULATION_TIMEOUT_SECONDS", 0, float)
+
+# number of simulations run at the same time. With the MATLAB backend every
+# simulation needs its own engine, see MATLAB_POOL_SIZE
+SIMULATION_WORKERS = _envValue("SIMULATION_WORKERS", 2, int)
+
+# batch simulation of every patient of an oncologist (see simulation/batch.py):
+# number of worker processes, each with its own backend (and MATLAB engine),
+# and default number of cycles simulated
+BATCH_PROCESSES = _envValue("BATCH_PROCESSES", 2, int)
+BATCH_NUM_CYCLES = _envValue("BATCH_NUM_CYCLES", 3, int)
+
+# logs how long every startup step took (see util/startup.py)
+STARTUP_REPORT = _envValue("STARTUP_REPORT", 0, int)
+
+# the patient list is decrypted by DECRYPT_WORKERS threads in chunks of
+# DECRYPT_CHUNK_SIZE records, the first chunk (the first screenful) is smaller
+DECRYPT_WORKERS = _envValue("DECRYPT_WORKERS", 4, int)
+DECRYPT_CHUNK_SIZE = _envValue("DECRYPT_CHUNK_SIZE", 200, int)
+DECRYPT_FIRST_CHUNK_SIZE = _envValue("DECRYPT_FIRST_CHUNK_SIZE", 20, int)
+
+# patients re-encrypted per transaction when an oncologist changes their password
+KEY_ROTATION_BATCH_SIZE = _envValue("KEY_ROTATION_BATCH_SIZE", 500, int)
+
+# cipher of the patient records written from now on, "fernet" (base64 text)
+# or "aesgcm" (binary). Records of either kind are read, see util/patient_record.py
+RECORD_CIPHER = _envValue("RECORD_CIPHER", "fernet")
+
+# bcrypt cost of the passwords hashed from now on, existing hashes keep their
+# cost. python -m benchmarks.bcrypt_cost recommends one for this computer
+BCRYPT_ROUNDS = _envValue("BCRYPT_ROUNDS", 12, int)
+
+# decrypted patients kept in memory to reopen recently viewed patients quickly,
+# at most PATIENT_CACHE_SIZE of them for PATIENT_CACHE_TTL_SECONDS each
+PATIENT_CACHE_SIZE = _envValue("PATIENT_CACHE_SIZE", 50, int)
+PATIENT_CACHE_TTL_SECONDS = _envValue("PATIENT_CACHE_TTL_SECONDS", 300, float)
+
+# application database and the pragmas of its connections, see util/connections.py
+DATABASE_PATH = _envValue("DATABASE_PATH", "db.db")
+DATABASE_SYNCHRONOUS = _envValue("DATABASE_SYNCHRONOUS", "NORMAL")
+DATABASE_CACHE_KB = _envValue("DATABASE_CACHE_KB", 16384, int)
+DATABASE_MMAP_BYTES = _envValue("DATABASE_MMAP_BYTES", 64 * 1024 * 1024, int)
+DATABASE_BUSY_TIMEOUT_SECONDS = _envValue("DATABASE_BUSY_TIMEOUT_SECONDS", 10, float)
+# prepared statements kept by every connection, see util/repository.py
+DATABASE_STATEMENT_CACHE = _envValue("DATABASE_STATEMENT_CACHE", 256, int)
+
+# repository calls slower than this are logged as warnings, set
+# LEUKEMIA_REPOSITORY_REPORT=1 to log the time spent in each of them at exit
+REPOSITORY_SLOW_SECONDS = _envValue("REPOSITORY_SLOW_SECONDS", 0.1, float)
+REPOSITORY_REPORT = _envValue("REPOSITORY_REPORT", 0, int)
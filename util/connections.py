@@ -0,0 +1,107 @@
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from util.config import (
+    DATABASE_BUSY_TIMEOUT_SECONDS,
+    DATABASE_CACHE_KB,
+    DATABASE_MMAP_BYTES,
+    DATABASE_PATH,
+    DATABASE_STATEMENT_CACHE,
+    DATABASE_SYNCHRONOUS,
+)
+
+"""
+
+Connections to db.db for every thread of the application.
+
+A sqlite3 connection must not be shared between threads, so the manager
+gives each thread a connection of its own, opened on first use. The
+database is in WAL mode, where readers never wait for the writer and the
+writer does not wait for the readers. SQLite lets a single connection
+write at a time; writer() serializes the writes of the threads of the
+application, and other processes (cli.py) wait up to
+DATABASE_BUSY_TIMEOUT_SECONDS for the write lock instead of failing.
+
+Every connection has foreign keys enforced, so deleting an oncologist or a
+patient always cascades to their patients, measurements and search index.
+
+WAL mode is stored in the database, which also gets db.db-wal and
+db.db-shm files next to it while it is open.
+
+"""
+
+# synchronous=NORMAL is safe in WAL mode, a power loss can only lose the last commits
+_SYNCHRONOUS_VALUES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+class ConnectionManager:
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._connections = []
+
+    # the connection of the calling thread
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _open(self):
+        # closed by close() from the thread that created the manager
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DATABASE_BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False,
+            cached_statements=DATABASE_STATEMENT_CACHE,
+        )
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if mode.lower() != "wal":
+            logging.warning("{} is not in WAL mode: {}".format(self.path, mode))
+        synchronous = DATABASE_SYNCHRONOUS.upper()
+        if synchronous not in _SYNCHRONOUS_VALUES:
+            raise ValueError("Unknown synchronous setting {}".format(synchronous))
+        # PRAGMA does not accept parameters
+        conn.execute("PRAGMA synchronous = {}".format(synchronous))
+        conn.execute("PRAGMA cache_size = {:d}".format(-DATABASE_CACHE_KB))
+        conn.execute("PRAGMA mmap_size = {:d}".format(DATABASE_MMAP_BYTES))
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    # the connection of the calling thread, holding the write lock of the
+    # application. Commits when the block ends, rolls back on an exception
+    @contextmanager
+    def writer(self):
+        conn = self.connection()
+        with self._write_lock:
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    # closes the connection of the calling thread, e.g. at the end of a worker thread
+    def closeThreadConnection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            self._connections.remove(conn)
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
@@ -0,0 +1,154 @@
+import logging
+
+import bcrypt
+
+from util.config import KEY_ROTATION_BATCH_SIZE
+from util.patient_record import decryptRecord, encryptRecord, migrateRecords
+from util.search_index import indexPatient
+from util.util import CryptoContext, checkLogin, hashPassword
+
+"""
+
+Re-encryption of the patients of an oncologist when their password changes.
+
+The records and the search index are keyed with the password, so changing
+it means re-encrypting every patient. rotateKey walks the patients in id
+order, KEY_ROTATION_BATCH_SIZE at a time. Each batch is re-encrypted, its
+search index rebuilt and the id of its last patient saved in key_rotations
+in a single transaction, so only one batch is held in memory and a crash
+loses at most the batch in progress.
+
+An interrupted rotation is resumed by running it again with the same
+passwords, the new one is checked against the hash saved when it started.
+The password of the oncologist is only replaced once the last batch is
+done. Until then they still log in with the old password, but cannot open
+their patients (see pendingKeyRotation) since part of them already use the
+new key.
+
+"""
+
+
+def createKeyRotationTable(conn):
+    conn.execute(
+        """
+            CREATE TABLE IF NOT EXISTS key_rotations
+                (username TEXT NOT NULL,
+                 new_password TEXT NOT NULL,
+                 last_patient_id INTEGER NOT NULL,
+                 PRIMARY KEY(username),
+                 FOREIGN KEY(username)
+                    REFERENCES oncologists(username)
+                    ON DELETE CASCADE
+                    ON UPDATE NO ACTION);
+        """
+    )
+    conn.commit()
+
+
+def pendingKeyRotation(conn, username):
+    res = conn.execute("SELECT 1 FROM key_rotations WHERE username=?", (username,))
+    return res.fetchone() is not None
+
+
+def rotateKey(
+    conn,
+    username,
+    old_password,
+    new_password,
+    batch_size=KEY_ROTATION_BATCH_SIZE,
+    progress=None,
+    token=None,
+):
+    """
+    Re-encrypts the patients of username from old_password to new_password
+    and replaces the password of username, resuming an interrupted rotation.
+
+    progress(done, total) is called after every batch. token.check() is
+    called before every batch, to stop the rotation it raises; the rotation
+    resumes from there the next time. Wrong passwords raise an
+    AssertionError with a message that can be shown to the user. Returns the
+    number of patients re-encrypted by this call.
+    """
+    assert new_password != "", "The new password must not be empty"
+    checkLogin(conn, username, old_password)
+    old_crypto = CryptoContext(old_password)
+    new_crypto = CryptoContext(new_password)
+
+    row = conn.execute(
+        "SELECT new_password, last_patient_id FROM key_rotations WHERE username=?",
+        (username,),
+    ).fetchone()
+    if row is None:
+        # patients of a database created before records were introduced
+        migrateRecords(conn, username, old_crypto)
+        new_hash = hashPassword(new_password)
+        last_id = 0
+        conn.execute(
+            "INSERT INTO key_rotations (username, new_password, last_patient_id) VALUES (?, ?, ?)",
+            (username, new_hash, last_id),
+        )
+        conn.commit()
+    else:
+        new_hash, last_id = row
+        assert bcrypt.checkpw(
+            new_password.encode("utf-8"), new_hash
+        ), "The new password does not match the one of the unfinished password change"
+        logging.info("Resuming the password change of {}".format(username))
+
+    total, done = conn.execute(
+        "SELECT COUNT(*), COUNT(CASE WHEN id<=? THEN 1 END) FROM patients WHERE oncologist_id=?",
+        (last_id, username),
+    ).fetchone()
+    rotated = 0
+    while True:
+        if token is not None:
+            token.check()
+        rows = conn.execute(
+            """
+                SELECT id, record
+                FROM patients
+                WHERE oncologist_id=? AND id>?
+                ORDER BY id
+                LIMIT ?
+            """,
+            (username, last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+
+        try:
+            for patient_id, record in rows:
+                if record is None:
+                    continue
+                fields = decryptRecord(record, old_crypto)
+                conn.execute(
+                    "UPDATE patients SET record=? WHERE id=?",
+                    (encryptRecord(fields, new_crypto), patient_id),
+                )
+                indexPatient(conn, patient_id, fields, new_crypto)
+            last_id = rows[-1][0]
+            conn.execute(
+                "UPDATE key_rotations SET last_patient_id=? WHERE username=?",
+                (last_id, username),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        done += len(rows)
+        rotated += len(rows)
+        if progress is not None:
+            progress(done, total)
+
+    try:
+        conn.execute(
+            "UPDATE oncologists SET password=? WHERE username=?", (new_hash, username)
+        )
+        conn.execute("DELETE FROM key_rotations WHERE username=?", (username,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logging.info("Changed the password of {}".format(username))
+    return rotated
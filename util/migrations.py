@@ -0,0 +1,152 @@
+import logging
+
+from util.key_rotation import createKeyRotationTable
+from util.patient_record import upgradeSchema
+from util.repository import (
+    MEASUREMENTS_BY_PATIENT_QUERY,
+    MEASUREMENTS_QUERY,
+    PATIENT_ROWS_QUERY,
+)
+from util.search_index import createSearchIndex
+
+"""
+
+Versioned schema of db.db.
+
+The version of a database is stored in PRAGMA user_version, the number of
+migrations of MIGRATIONS applied to it. migrate() applies the missing ones
+in order, so a new database is created from scratch and an existing one is
+upgraded in place. Databases created before this module have version 0
+and get every migration, which is why every migration must also work on a
+database that already has its changes (CREATE ... IF NOT EXISTS, checking
+the columns first). That also makes a migration interrupted before its
+version was saved safe to run again.
+
+To change the schema, append a migration, never edit one that was released.
+
+checkQueryPlans() verifies that the frequent queries use the indexes.
+
+"""
+
+
+def createTables(conn):
+    conn.execute(
+        """
+            CREATE TABLE IF NOT EXISTS oncologists
+                (username TEXT NOT NULL,
+                 password TEXT NOT NULL,
+                 full_name TEXT NOT NULL,
+                 is_admin INTEGER DEFAULT "FALSE" NOT NULL,
+                 PRIMARY KEY(username));
+        """
+    )
+    conn.execute(
+        """
+            CREATE TABLE IF NOT EXISTS patients
+                (id INTEGER NOT NULL,
+                 record BLOB,
+                 oncologist_id TEXT NOT NULL,
+                 PRIMARY KEY(id),
+                 FOREIGN KEY(oncologist_id)
+                    REFERENCES oncologists(username)
+                    ON DELETE CASCADE
+                    ON UPDATE NO ACTION);
+        """
+    )
+    conn.execute(
+        """
+            CREATE TABLE IF NOT EXISTS measurements
+                (time TEXT NOT NULL,
+                 anc_measurement REAL NOT NULL,
+                 dosage_measurement REAL NOT NULL,
+                 patient_id INTEGER NOT NULL,
+                 PRIMARY KEY(time, patient_id),
+                 FOREIGN KEY(patient_id)
+                    REFERENCES patients(id)
+                    ON DELETE CASCADE
+                    ON UPDATE NO ACTION);
+        """
+    )
+
+
+# the primary key of measurements starts with time, so it cannot be used to
+# find the measurements of a patient
+def createIndexes(conn):
+    conn.execute(
+        """
+            CREATE INDEX IF NOT EXISTS measurements_patient
+                ON measurements(patient_id, time);
+        """
+    )
+    conn.execute(
+        """
+            CREATE INDEX IF NOT EXISTS patients_oncologist
+                ON patients(oncologist_id);
+        """
+    )
+
+
+# version n of the schema is reached by applying the first n migrations
+MIGRATIONS = (
+    createTables,
+    upgradeSchema,
+    createSearchIndex,
+    createKeyRotationTable,
+    createIndexes,
+)
+
+
+def schemaVersion(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# upgrades the database to the latest version, returns the number of migrations applied
+def migrate(conn):
+    version = schemaVersion(conn)
+    if version > len(MIGRATIONS):
+        raise RuntimeError(
+            "The database has version {} of the schema, this application only knows up to version {}".format(
+                version, len(MIGRATIONS)
+            )
+        )
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logging.info(
+            "Migrating the database to version {} ({})".format(
+                number, migration.__name__
+            )
+        )
+        try:
+            migration(conn)
+            # PRAGMA does not accept parameters
+            conn.execute("PRAGMA user_version = {:d}".format(number))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(MIGRATIONS) - version
+
+
+# query, sample parameters and the index its plan must use
+QUERY_PLAN_CHECKS = (
+    (MEASUREMENTS_QUERY, (0,), "measurements_patient"),
+    (MEASUREMENTS_BY_PATIENT_QUERY, ("[0]",), "measurements_patient"),
+    (PATIENT_ROWS_QUERY, ("",), "patients_oncologist"),
+)
+
+
+# returns the queries that do not use their index, and logs a warning for each
+def checkQueryPlans(conn):
+    missing = []
+    for query, parameters, index in QUERY_PLAN_CHECKS:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + query, parameters).fetchall()
+        if not any(index in row[-1] for row in plan):
+            logging.warning(
+                "Query does not use the index {}: {}\n{}".format(
+                    index,
+                    " ".join(query.split()),
+                    "\n".join(row[-1] for row in plan),
+                )
+            )
+            missing.append(index)
+    return missing
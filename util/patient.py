@@ -1,4 +1,51 @@
+from util.patient_record import decryptRecord
+
+# numpy is imported by the functions that use it, it is kept off the startup
+# path (see util/startup.py)
+
+# attributes of Patient that are stored in the encrypted record, and their key in it
+RECORD_ATTRIBUTES = {
+    "user_id": "user_id",
+    "name": "name",
+    "weight": "weight",
+    "height": "height",
+    "birthday": "birthday",
+    "phoneNumber": "phone_number",
+    "age": "age",
+    "bloodType": "blood_type",
+    "allType": "all_type",
+    "bsa": "body_surface_area",
+    "sex": "sex",
+}
+
+
+# attribute of a Patient read from its record, which is decrypted on first access
+class RecordField:
+    def __set_name__(self, owner, name):
+        self.key = RECORD_ATTRIBUTES[name]
+
+    def __get__(self, patient, owner=None):
+        if patient is None:
+            return self
+        return patient.recordFields()[self.key]
+
+    def __set__(self, patient, value):
+        patient.recordFields()[self.key] = value
+
+
 class Patient:
+    user_id = RecordField()
+    name = RecordField()
+    weight = RecordField()
+    height = RecordField()
+    birthday = RecordField()
+    phoneNumber = RecordField()
+    age = RecordField()
+    bloodType = RecordField()
+    allType = RecordField()
+    bsa = RecordField()
+    sex = RecordField()
+
     def __init__(
         self,
         id,
@@ -16,15 +63,26 @@ class Patient:
         bsa,
         assignedDoctor,
         sex,
+        measurementTimes=None,
     ):
+        import numpy as np
+
         self.id = id
+        self._record = None
+        self._crypto = None
+        self._fields = {}
         self.user_id = user_id
         self.name = name
         self.weight = weight
         self.height = height
-        self.ancMeasurement = ancMeasurement
+        self.measurementTimes = (
+            np.array([], dtype="datetime64[D]")
+            if measurementTimes is None
+            else measurementTimes
+        )
+        self.ancMeasurement = np.asarray(ancMeasurement, dtype=np.float64)
         self.birthday = birthday
-        self.dosageMeasurement = dosageMeasurement
+        self.dosageMeasurement = np.asarray(dosageMeasurement, dtype=np.float64)
         self.phoneNumber = phoneNumber
         self.age = age
         self.bloodType = bloodType
@@ -33,6 +91,31 @@ class Patient:
         self.assignedDoctor = assignedDoctor
         self.sex = sex
 
+    # a patient whose record is only decrypted when one of its fields is read,
+    # measurements are the arrays returned by measurementArrays
+    @classmethod
+    def fromRecord(cls, id, record, crypto, measurements, assignedDoctor):
+        patient = cls.__new__(cls)
+        patient.id = id
+        patient._record = record
+        patient._crypto = crypto
+        patient._fields = None
+        (
+            patient.measurementTimes,
+            patient.ancMeasurement,
+            patient.dosageMeasurement,
+        ) = measurements
+        patient.assignedDoctor = assignedDoctor
+        return patient
+
+    # the decrypted record, the ciphertext and key are dropped once it is decrypted
+    def recordFields(self):
+        if self._fields is None:
+            self._fields = decryptRecord(self._record, self._crypto)
+            self._record = None
+            self._crypto = None
+        return self._fields
+
     def save(
         self,
         user_id,
@@ -64,7 +147,46 @@ class Patient:
         self.phoneNumber = phoneNumber
         self.assignedDoctor = assignedDoctor
         self.sex = sex
-        if dosageEdited:
-            self.dosageMeasurement.append(dosageMeasurement)
-        if ancEdited:
-            self.ancMeasurement.append(ancMeasurement)
+        # both values are saved together, as a row of the measurements table
+        if dosageEdited or ancEdited:
+            self.addMeasurement(
+                dosageMeasurement[1], ancMeasurement[0], dosageMeasurement[0]
+            )
+
+    # appends a measurement, time is a yyyyMMdd string as in the measurements table
+    def addMeasurement(self, time, anc, dosage):
+        import numpy as np
+
+        times, ancs, dosages = measurementArrays([(time, dosage, anc)])
+        self.measurementTimes = np.concatenate((self.measurementTimes, times))
+        self.ancMeasurement = np.concatenate((self.ancMeasurement, ancs))
+        self.dosageMeasurement = np.concatenate((self.dosageMeasurement, dosages))
+
+    def hasMeasurements(self):
+        return len(self.measurementTimes) > 0
+
+    # inputs of the model for the next numCycles cycles, from the latest measurements
+    def modelInputs(self, numCycles):
+        bsa = float(self.bsa)
+        numCycles = float(numCycles + 1)
+        dosage = [float(self.dosageMeasurement[-1])]
+        anc = [float(self.ancMeasurement[-1])]
+        return bsa, numCycles, dosage, anc
+
+
+# the measurements of a patient as arrays from its (time, dosage, anc) rows,
+# oldest first: times (datetime64[D]), ANC and dosage (float64)
+def measurementArrays(rows):
+    import numpy as np
+
+    count = len(rows)
+    # times are yyyyMMdd strings, converted as numbers without parsing dates one by one
+    digits = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    times = (
+        (digits // 10000 - 1970).astype("datetime64[Y]")
+        + (digits // 100 % 100 - 1).astype("timedelta64[M]")
+        + (digits % 100 - 1).astype("timedelta64[D]")
+    )
+    dosage = np.fromiter((row[1] for row in rows), dtype=np.float64, count=count)
+    anc = np.fromiter((row[2] for row in rows), dtype=np.float64, count=count)
+    return times, anc, dosage
@@ -0,0 +1,64 @@
+import time
+from collections import OrderedDict
+
+from util.config import PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL_SECONDS
+
+"""
+
+In memory cache of decrypted patients, keyed by patient id.
+
+Opening a patient decrypts its record and reads its measurements, the
+cache keeps the patients viewed recently so that going back and forth
+between the pages does not do it again. Entries expire ttl_seconds after
+they were loaded, and the least recently used entry is evicted once there
+are more than max_size.
+
+Only decrypted data is cached, nothing is written to disk. The pages that
+write a patient invalidate it, and MainWindow.showLoginWindow clears the
+cache and the pages at logoff so that no patient outlives the session.
+
+Used from the GUI thread only.
+
+"""
+
+
+class PatientCache:
+    def __init__(
+        self, max_size=PATIENT_CACHE_SIZE, ttl_seconds=PATIENT_CACHE_TTL_SECONDS
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # patient id -> (expiry time, patient)
+        self._entries = OrderedDict()
+
+    def get(self, patient_id):
+        self.purgeExpired()
+        entry = self._entries.get(patient_id)
+        if entry is None:
+            return None
+        self._entries.move_to_end(patient_id)
+        return entry[1]
+
+    def put(self, patient):
+        if self.max_size <= 0:
+            return
+        self._entries[patient.id] = (time.monotonic() + self.ttl_seconds, patient)
+        self._entries.move_to_end(patient.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self.purgeExpired()
+
+    def invalidate(self, patient_id):
+        self._entries.pop(patient_id, None)
+
+    def purgeExpired(self):
+        now = time.monotonic()
+        expired = [key for key, (expiry, _) in self._entries.items() if expiry <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
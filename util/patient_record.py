@@ -0,0 +1,196 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from util.config import (
+    DECRYPT_CHUNK_SIZE,
+    DECRYPT_FIRST_CHUNK_SIZE,
+    DECRYPT_WORKERS,
+    RECORD_CIPHER,
+)
+from util.util import decryptData, encryptData, getCryptoContext
+
+"""
+
+Storage of the protected health information (PHI) of the patients.
+
+The PHI fields of a patient are serialized to JSON and stored as a single
+ciphertext in the record column of the patients table, so loading a
+patient costs one decryption instead of one per field.
+
+Records are written with the cipher set by RECORD_CIPHER. "fernet" stores
+a base64 Fernet token as TEXT. "aesgcm" stores the raw version byte, nonce
+and AES-GCM ciphertext as a BLOB, which is about a third smaller and needs
+no base64 decoding (see benchmarks/record_cipher.py). decryptRecord tells them apart by their SQLite type, so
+both kinds can be mixed in a database; changing the password with the same
+old and new password (see util/key_rotation.py) rewrites every record with
+the current cipher.
+
+Databases created before stored every field as its own token in a column
+of the patients table. upgradeSchema moves those columns to the
+legacy_patients table, and migrateRecords re-encrypts the patients of an
+oncologist into records when they log in, since only they have the key.
+legacy_patients is dropped once every patient was migrated.
+
+"""
+
+# keys of the JSON record, named after the legacy columns
+PHI_FIELDS = (
+    "user_id",
+    "name",
+    "phone_number",
+    "birthday",
+    "age",
+    "blood_type",
+    "all_type",
+    "weight",
+    "height",
+    "body_surface_area",
+    "sex",
+)
+
+
+def encryptRecord(fields, crypto, cipher=RECORD_CIPHER):
+    record = {name: str(fields[name]) for name in PHI_FIELDS}
+    text = json.dumps(record, separators=(",", ":"))
+    if cipher == "aesgcm":
+        return getCryptoContext(crypto).encryptBytes(text.encode("utf-8"))
+    if cipher == "fernet":
+        return encryptData(text, crypto)
+    raise ValueError("Unknown record cipher {}".format(cipher))
+
+
+def decryptRecord(record, crypto):
+    if isinstance(record, bytes):
+        return json.loads(getCryptoContext(crypto).decryptBytes(record))
+    return json.loads(decryptData(record, crypto))
+
+
+def decryptRecordChunks(
+    rows,
+    crypto,
+    workers=DECRYPT_WORKERS,
+    chunk_size=DECRYPT_CHUNK_SIZE,
+    first_chunk_size=DECRYPT_FIRST_CHUNK_SIZE,
+):
+    """
+    Decrypts the records of (id, record) rows on a pool of threads.
+
+    Yields lists of (id, fields) in the order of the rows, one list per
+    chunk. The first chunk is smaller so that it is ready quickly. Closing
+    the generator drops the chunks that are not decrypted yet.
+    """
+    chunks = [rows[:first_chunk_size]] + [
+        rows[start : start + chunk_size]
+        for start in range(first_chunk_size, len(rows), chunk_size)
+    ]
+
+    def decryptChunk(chunk):
+        return [(row[0], decryptRecord(row[1], crypto)) for row in chunk]
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = [executor.submit(decryptChunk, chunk) for chunk in chunks if chunk]
+        for future in futures:
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def tableColumns(conn, table):
+    return [row[1] for row in conn.execute("PRAGMA table_info({})".format(table))]
+
+
+# moves the per column tokens of a database created before records to legacy_patients
+def upgradeSchema(conn):
+    columns = tableColumns(conn, "patients")
+    if not columns or "record" in columns:
+        return
+
+    logging.info("Moving the patient columns to legacy_patients")
+    conn.commit()
+    # the measurements reference the patients table while it is rebuilt
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.execute("BEGIN")
+        conn.execute(
+            """
+                CREATE TABLE legacy_patients AS
+                SELECT id, {} FROM patients
+            """.format(
+                ", ".join(PHI_FIELDS)
+            )
+        )
+        conn.execute(
+            """
+                CREATE TABLE patients_new
+                    (id INTEGER NOT NULL,
+                     record BLOB,
+                     oncologist_id TEXT NOT NULL,
+                     PRIMARY KEY(id),
+                     FOREIGN KEY(oncologist_id)
+                        REFERENCES oncologists(username)
+                        ON DELETE CASCADE
+                        ON UPDATE NO ACTION);
+            """
+        )
+        conn.execute(
+            """
+                INSERT INTO patients_new (id, record, oncologist_id)
+                SELECT id, NULL, oncologist_id FROM patients
+            """
+        )
+        conn.execute("DROP TABLE patients")
+        conn.execute("ALTER TABLE patients_new RENAME TO patients")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = {}".format("ON" if foreign_keys else "OFF"))
+
+
+# re-encrypts the legacy patients of an oncologist into records, returns their number
+def migrateRecords(conn, username, crypto):
+    if not tableColumns(conn, "legacy_patients"):
+        return 0
+
+    rows = conn.execute(
+        """
+            SELECT l.id, {}
+            FROM legacy_patients l
+            INNER JOIN patients p ON l.id=p.id
+                AND p.oncologist_id=?
+        """.format(
+            ", ".join("l." + name for name in PHI_FIELDS)
+        ),
+        (username,),
+    ).fetchall()
+
+    try:
+        for row in rows:
+            fields = {
+                name: decryptData(value, crypto)
+                for name, value in zip(PHI_FIELDS, row[1:])
+            }
+            conn.execute(
+                "UPDATE patients SET record=? WHERE id=?",
+                (encryptRecord(fields, crypto), row[0]),
+            )
+            conn.execute("DELETE FROM legacy_patients WHERE id=?", (row[0],))
+        # rows of deleted patients
+        conn.execute(
+            "DELETE FROM legacy_patients WHERE id NOT IN (SELECT id FROM patients)"
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if conn.execute("SELECT COUNT(*) FROM legacy_patients").fetchone()[0] == 0:
+        conn.execute("DROP TABLE legacy_patients")
+        conn.commit()
+    if rows:
+        logging.info("Migrated {} patients to encrypted records".format(len(rows)))
+    return len(rows)
@@ -0,0 +1,306 @@
+import functools
+import json
+import logging
+import threading
+import time
+
+from util.config import REPOSITORY_SLOW_SECONDS
+from util.key_rotation import pendingKeyRotation
+from util.patient import Patient, measurementArrays
+from util.patient_record import encryptRecord, migrateRecords
+from util.search_index import indexPatient, indexPatients, searchPatientRows
+from util.util import getOncologist
+
+"""
+
+Data access of the application.
+
+The pages and cli.py read and write the database through the repositories
+of this module instead of executing SQL of their own, so every query can be
+profiled and optimized here. A repository is given the ConnectionManager
+(see util/connections.py): it reads with the connection of the calling
+thread and writes with ConnectionManager.writer().
+
+The SQL of the repositories are module constants. sqlite3 keeps the
+prepared statement of every SQL string a connection executed (up to
+DATABASE_STATEMENT_CACHE of them), so a query is prepared once per
+connection and reused afterwards. Lists of ids are passed as a JSON array
+to json_each() for the same reason, a query with one placeholder per id
+would be a new statement for every number of ids.
+
+Every public method of a repository is timed, see RepositoryStats.
+
+"""
+
+# queries of the patient pages, their query plans are checked by util/migrations.py
+MEASUREMENTS_QUERY = """SELECT time, dosage_measurement, anc_measurement
+           FROM measurements m
+           WHERE m.patient_id=? ORDER BY time ASC
+        """
+PATIENT_ROWS_QUERY = """SELECT id, record
+        FROM patients p
+        INNER JOIN oncologists o ON p.oncologist_id=o.username
+                AND o.username=?
+        """
+
+PATIENT_QUERY = """SELECT record, oncologist_id
+           FROM patients p
+           WHERE p.id=?
+        """
+PATIENTS_BY_ID_QUERY = """SELECT id, record, oncologist_id
+           FROM patients p
+           WHERE p.id IN (SELECT value FROM json_each(?))
+        """
+MEASUREMENTS_BY_PATIENT_QUERY = """SELECT patient_id, time, dosage_measurement, anc_measurement
+           FROM measurements m
+           WHERE m.patient_id IN (SELECT value FROM json_each(?))
+           ORDER BY patient_id, time ASC
+        """
+INSERT_PATIENT = """INSERT INTO patients (record, oncologist_id)
+           VALUES (?, ?)
+        """
+UPDATE_PATIENT = """UPDATE patients
+           SET record=?
+           WHERE id=?
+        """
+DELETE_PATIENT = """DELETE FROM patients
+           WHERE id=?
+        """
+INSERT_MEASUREMENT = """INSERT INTO measurements (time, anc_measurement, dosage_measurement, patient_id)
+           VALUES (?, ?, ?, ?)
+        """
+ONCOLOGIST_NAME_QUERY = """SELECT full_name
+           FROM oncologists o
+           WHERE o.username=?
+        """
+ONCOLOGISTS_QUERY = """SELECT username, full_name
+           FROM oncologists o
+           WHERE o.is_admin='FALSE'
+        """
+INSERT_ONCOLOGIST = """INSERT INTO oncologists (username, password, full_name, is_admin)
+           VALUES (?, ?, ?, 'FALSE')
+        """
+DELETE_ONCOLOGIST = """DELETE FROM oncologists
+           WHERE username=?
+        """
+
+
+# number of calls and time spent in every repository method, shared by all threads
+class RepositoryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            count, total, slowest = self.calls.get(name, (0, 0.0, 0.0))
+            self.calls[name] = (count + 1, total + seconds, max(slowest, seconds))
+
+    def clear(self):
+        with self._lock:
+            self.calls.clear()
+
+    # one line per method, the most time spent first
+    def report(self):
+        with self._lock:
+            calls = sorted(self.calls.items(), key=lambda item: -item[1][1])
+        return [
+            "{:10.1f} ms {:6d} calls {:8.2f} ms slowest  {}".format(
+                total * 1000, count, slowest * 1000, name
+            )
+            for name, (count, total, slowest) in calls
+        ]
+
+
+repositoryStats = RepositoryStats()
+
+
+def timed(method):
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            repositoryStats.record(name, seconds)
+            if seconds > REPOSITORY_SLOW_SECONDS:
+                logging.warning("{} took {:.0f} ms".format(name, seconds * 1000))
+
+    return wrapper
+
+
+class MeasurementRepository:
+    def __init__(self, database):
+        self.database = database
+
+    # (time, dosage, anc) rows of a patient, oldest first
+    @timed
+    def forPatient(self, patient_id):
+        conn = self.database.connection()
+        return conn.execute(MEASUREMENTS_QUERY, (patient_id,)).fetchall()
+
+    # (time, dosage, anc) rows of every patient of patient_ids, by patient id
+    @timed
+    def forPatients(self, patient_ids):
+        conn = self.database.connection()
+        measurements = {patient_id: [] for patient_id in patient_ids}
+        res = conn.execute(MEASUREMENTS_BY_PATIENT_QUERY, (json.dumps(patient_ids),))
+        for patient_id, time, dosage, anc in res:
+            measurements[patient_id].append((time, dosage, anc))
+        return measurements
+
+    @timed
+    def insertMeasurement(self, patient_id, time, anc, dosage):
+        with self.database.writer() as conn:
+            conn.execute(INSERT_MEASUREMENT, (time, anc, dosage, patient_id))
+
+    # inserts (patient_id, time, anc, dosage) rows in a single transaction
+    @timed
+    def insertMeasurements(self, rows):
+        with self.database.writer() as conn:
+            conn.executemany(
+                INSERT_MEASUREMENT,
+                (
+                    (time, anc, dosage, patient_id)
+                    for patient_id, time, anc, dosage in rows
+                ),
+            )
+
+
+class PatientRepository:
+    def __init__(self, database, measurements=None):
+        self.database = database
+        self.measurements = measurements or MeasurementRepository(database)
+
+    # a patient and its measurements, its record is decrypted with crypto when
+    # one of its fields is first read. None if the patient does not exist
+    @timed
+    def get(self, patient_id, crypto):
+        conn = self.database.connection()
+        row = conn.execute(PATIENT_QUERY, (patient_id,)).fetchone()
+        if row is None:
+            return None
+        return self._patient(
+            patient_id,
+            row[0],
+            row[1],
+            self.measurements.forPatient(patient_id),
+            crypto,
+        )
+
+    # the patients of patient_ids that exist, in the same order, with two queries
+    # whatever their number
+    @timed
+    def getMany(self, patient_ids, crypto):
+        patient_ids = list(patient_ids)
+        conn = self.database.connection()
+        rows = {
+            row[0]: row
+            for row in conn.execute(PATIENTS_BY_ID_QUERY, (json.dumps(patient_ids),))
+        }
+        measurements = self.measurements.forPatients(list(rows))
+        return [
+            self._patient(
+                patient_id,
+                rows[patient_id][1],
+                rows[patient_id][2],
+                measurements[patient_id],
+                crypto,
+            )
+            for patient_id in patient_ids
+            if patient_id in rows
+        ]
+
+    def _patient(self, patient_id, record, oncologist_id, measurements, crypto):
+        return Patient.fromRecord(
+            patient_id,
+            record,
+            crypto,
+            measurementArrays(measurements),
+            oncologist_id,
+        )
+
+    # the (id, record) rows of every patient of an oncologist, the record is
+    # encrypted (see decryptRecord)
+    @timed
+    def listForOncologist(self, username):
+        conn = self.database.connection()
+        return conn.execute(PATIENT_ROWS_QUERY, (username,)).fetchall()
+
+    # (id, record) rows of the patients of an oncologist matching the search index
+    @timed
+    def search(self, username, crypto, name="", user_id=""):
+        return searchPatientRows(
+            self.database.connection(), username, crypto, name, user_id
+        )
+
+    # encrypts and indexes a new patient, returns its id
+    @timed
+    def insert(self, oncologist_id, fields, crypto):
+        with self.database.writer() as conn:
+            res = conn.execute(
+                INSERT_PATIENT, (encryptRecord(fields, crypto), oncologist_id)
+            )
+            indexPatient(conn, res.lastrowid, fields, crypto)
+        return res.lastrowid
+
+    @timed
+    def update(self, patient_id, fields, crypto):
+        with self.database.writer() as conn:
+            conn.execute(UPDATE_PATIENT, (encryptRecord(fields, crypto), patient_id))
+            indexPatient(conn, patient_id, fields, crypto)
+
+    # foreign keys are enforced, deleting cascades to the measurements
+    @timed
+    def delete(self, patient_id):
+        with self.database.writer() as conn:
+            conn.execute(DELETE_PATIENT, (patient_id,))
+
+    # patients saved before records were introduced are re-encrypted, and
+    # patients saved before the search index are added to it
+    @timed
+    def upgradeRecords(self, username, crypto):
+        with self.database.writer() as conn:
+            migrateRecords(conn, username, crypto)
+            indexPatients(conn, username, crypto)
+
+
+class OncologistRepository:
+    def __init__(self, database):
+        self.database = database
+
+    # the row of an oncologist, raises an AssertionError if it does not exist
+    @timed
+    def get(self, username):
+        return getOncologist(self.database.connection(), username)
+
+    # None if the oncologist does not exist
+    @timed
+    def fullName(self, username):
+        conn = self.database.connection()
+        row = conn.execute(ONCOLOGIST_NAME_QUERY, (username,)).fetchone()
+        return row[0] if row else None
+
+    # (username, full_name) rows of the oncologists that are not administrators
+    @timed
+    def listOncologists(self):
+        conn = self.database.connection()
+        return conn.execute(ONCOLOGISTS_QUERY).fetchall()
+
+    @timed
+    def insert(self, username, password, full_name):
+        with self.database.writer() as conn:
+            conn.execute(INSERT_ONCOLOGIST, (username, password, full_name))
+
+    # deletes the oncologist with their patients
+    @timed
+    def delete(self, username):
+        with self.database.writer() as conn:
+            conn.execute(DELETE_ONCOLOGIST, (username,))
+
+    @timed
+    def pendingKeyRotation(self, username):
+        return pendingKeyRotation(self.database.connection(), username)
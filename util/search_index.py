@@ -0,0 +1,141 @@
+import json
+import logging
+
+from util.patient_record import decryptRecord
+
+"""
+
+Blind index to search the encrypted patients by name and patient ID.
+
+The names and patient IDs are split into their normalized n-grams (lower
+case, single spaces), and every n-gram is stored as a keyed hash in the
+patient_search table. The key is derived from the oncologist's password, see
+CryptoContext.blindIndex. A search hashes the n-grams of the query the same
+way and looks up the patients that have all of them, so only the matching
+records are decrypted. The n-grams of a query can match a patient without
+the query being a substring of the name (or two n-grams can hash to the
+same value), so the decrypted results are still checked against the query.
+
+Queries shorter than SEARCH_NGRAM characters are not indexed, they are
+filtered in the decrypted patient list instead.
+
+The index reveals which patients share n-grams, but not the n-grams
+themselves.
+
+"""
+
+SEARCH_NGRAM = 3
+SEARCH_FIELDS = ("name", "user_id")
+
+# patients having every token of both fields, a field without tokens matches
+# every patient. The tokens are passed as JSON arrays to json_each() so that
+# the statement is the same whatever their number (see util/repository.py)
+SEARCH_CONDITION = """
+            AND (? = 0 OR id IN (
+                SELECT patient_id
+                FROM patient_search
+                WHERE field=? AND token IN (SELECT value FROM json_each(?))
+                GROUP BY patient_id
+                HAVING COUNT(*)=?))
+        """
+SEARCH_QUERY = """SELECT id, record
+           FROM patients
+           WHERE oncologist_id=?
+        {}
+           ORDER BY id
+        """.format(
+    SEARCH_CONDITION * len(SEARCH_FIELDS)
+)
+
+
+def createSearchIndex(conn):
+    conn.execute(
+        """
+            CREATE TABLE IF NOT EXISTS patient_search
+                (patient_id INTEGER NOT NULL,
+                 field TEXT NOT NULL,
+                 token TEXT NOT NULL,
+                 PRIMARY KEY(field, token, patient_id),
+                 FOREIGN KEY(patient_id)
+                    REFERENCES patients(id)
+                    ON DELETE CASCADE
+                    ON UPDATE NO ACTION)
+                WITHOUT ROWID;
+        """
+    )
+    conn.execute(
+        """
+            CREATE INDEX IF NOT EXISTS patient_search_patient
+                ON patient_search(patient_id);
+        """
+    )
+    conn.commit()
+
+
+def normalizeSearchText(text):
+    return " ".join(str(text).lower().split())
+
+
+def ngrams(text):
+    text = normalizeSearchText(text)
+    return {text[i : i + SEARCH_NGRAM] for i in range(len(text) - SEARCH_NGRAM + 1)}
+
+
+# hashed n-grams of a field, an empty list for a text shorter than SEARCH_NGRAM
+def searchTokens(field, text, crypto):
+    return sorted(crypto.blindIndex(field + ":" + gram) for gram in ngrams(text))
+
+
+# the query that is looked up in the index, None if both texts are too short
+def searchQuery(name, user_id):
+    texts = [normalizeSearchText(text) for text in (name, user_id)]
+    query = tuple(text if len(text) >= SEARCH_NGRAM else "" for text in texts)
+    return query if any(query) else None
+
+
+# replaces the index entries of a patient, the caller commits
+def indexPatient(conn, patient_id, fields, crypto):
+    conn.execute("DELETE FROM patient_search WHERE patient_id=?", (patient_id,))
+    conn.executemany(
+        "INSERT OR IGNORE INTO patient_search (patient_id, field, token) VALUES (?, ?, ?)",
+        [
+            (patient_id, field, token)
+            for field in SEARCH_FIELDS
+            for token in searchTokens(field, fields[field], crypto)
+        ],
+    )
+
+
+# indexes the patients of an oncologist that are not in the index yet, returns their number
+def indexPatients(conn, username, crypto):
+    rows = conn.execute(
+        """
+            SELECT id, record
+            FROM patients
+            WHERE oncologist_id=?
+                AND record IS NOT NULL
+                AND id NOT IN (SELECT patient_id FROM patient_search)
+        """,
+        (username,),
+    ).fetchall()
+
+    try:
+        for patient_id, record in rows:
+            indexPatient(conn, patient_id, decryptRecord(record, crypto), crypto)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if rows:
+        logging.info("Added {} patients to the search index".format(len(rows)))
+    return len(rows)
+
+
+# (id, record) rows of the patients of an oncologist whose indexed n-grams match the query
+def searchPatientRows(conn, username, crypto, name="", user_id=""):
+    parameters = [username]
+    for field, text in zip(SEARCH_FIELDS, (name, user_id)):
+        tokens = searchTokens(field, text, crypto)
+        parameters += [len(tokens), field, json.dumps(tokens), len(tokens)]
+    return conn.execute(SEARCH_QUERY, parameters).fetchall()
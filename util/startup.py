@@ -0,0 +1,64 @@
+import logging
+import sys
+import time
+
+from util.config import STARTUP_REPORT
+
+"""
+
+Startup timing report.
+
+app.py imports this module first and marks the steps of the startup with
+mark(). report() logs the time of every step since this module was imported
+and warns about the heavy modules that are already imported, since the
+login page should be shown without them (they are imported once the page
+that needs them is built).
+
+Set LEUKEMIA_STARTUP_REPORT=1 to log the report at every startup. For a per
+module breakdown run python -X importtime app.py.
+
+"""
+
+# modules kept off the startup path, see MainWindow.createPage
+DEFERRED_MODULES = (
+    "matlab.engine",
+    "pyqtgraph",
+    "numpy",
+    "widget_pages.dashboard",
+    "widget_pages.patient_information",
+    "widget_pages.patient_form",
+    "widget_pages.patient_list",
+    "widget_pages.oncologist_form",
+)
+
+_start = time.perf_counter()
+_marks = []
+_reported = False
+
+
+def mark(label):
+    _marks.append((label, time.perf_counter()))
+
+
+def report():
+    global _reported
+    lines = []
+    previous = _start
+    for label, timestamp in _marks:
+        lines.append(
+            "{:8.1f} ms (+{:.1f} ms) {}".format(
+                (timestamp - _start) * 1000, (timestamp - previous) * 1000, label
+            )
+        )
+        previous = timestamp
+
+    # the deferred modules are only checked up to the first report, the login page
+    loaded = [] if _reported else [m for m in DEFERRED_MODULES if m in sys.modules]
+    _reported = True
+    if STARTUP_REPORT:
+        logging.info("startup timing:\n" + "\n".join(lines))
+    if loaded:
+        logging.warning(
+            "imported before the login page was shown: {}".format(", ".join(loaded))
+        )
+    return lines, loaded
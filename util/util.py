@@ -1,5 +1,9 @@
 from cryptography.fernet import Fernet
-import base64, hashlib
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import base64, hashlib, hmac, os, time
+import bcrypt
+
+from util.config import BCRYPT_ROUNDS
 
 # sets used to help validate user input
 valid_blood_types = {"A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"}
@@ -10,12 +14,71 @@ valid_all_types = {
 }
 valid_sex_types = {"Male", "Female"}
 
+# first byte of the binary ciphertexts, so that other formats can be added later
+AESGCM_VERSION = b"\x01"
+AESGCM_NONCE_SIZE = 12
+
 # helper function to display the oncologist's name in the ToolBar
 def getLastNameFromFullName(full_name):
     split = full_name.split()
     return split[-1].capitalize()
 
 
+# checks the credentials of an oncologist, returns its row in the oncologists
+# table or raises an AssertionError with a message that can be shown to the user
+def checkLogin(db_conn, username, password):
+    row = getOncologist(db_conn, username)
+    verifyPassword(row, password)
+    return row
+
+
+def getOncologist(db_conn, username):
+    res = db_conn.execute(
+        """SELECT * 
+           FROM oncologists 
+           WHERE username=?
+        """,
+        (username,),
+    )
+
+    row = res.fetchone()
+
+    assert row is not None and username == row[0], "User {} does not exist".format(
+        username
+    )
+    return row
+
+
+# takes hundreds of milliseconds by design, the GUI runs it in a BcryptTask
+def verifyPassword(row, password):
+    assert bcrypt.checkpw(password.encode("utf-8"), row[1]), "Password is incorrect"
+    return row
+
+
+def hashPassword(password, rounds=BCRYPT_ROUNDS):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
+
+
+# highest bcrypt cost whose hash takes at most target_seconds on this computer.
+# Every round doubles the time, so only one cost is timed besides the result
+def calibrateBcryptRounds(target_seconds=0.25, min_rounds=10, max_rounds=16):
+    def timeHash(rounds):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration password", salt)
+        return time.perf_counter() - start
+
+    base = timeHash(min_rounds)
+    rounds = min_rounds
+    while (
+        rounds < max_rounds and base * 2 ** (rounds + 1 - min_rounds) <= target_seconds
+    ):
+        rounds += 1
+    while rounds > min_rounds and timeHash(rounds) > target_seconds:
+        rounds -= 1
+    return rounds
+
+
 # helper function to delete all elements in a layout recursively
 def clearLayout(layout):
     if layout is not None:
@@ -36,15 +99,62 @@ def generateFernetKey(passcode: bytes) -> bytes:
     return base64.urlsafe_b64encode(hlib.hexdigest().encode("utf-8"))
 
 
-# takes a plain text and the key in String format, returns encryptedText in String format
-def encryptData(plainText, keyString):
-    key = generateFernetKey(keyString.encode("utf-8"))
-    fernet = Fernet(key)
-    return fernet.encrypt(plainText.encode("utf-8")).decode("utf-8")
+# holds the Fernet cipher derived from the user's password for a session, so
+# that the key is derived once at login instead of once per field
+class CryptoContext:
+    def __init__(self, keyString):
+        key = generateFernetKey(keyString.encode("utf-8"))
+        self._fernet = Fernet(key)
+        # separate key of the search index, see util/search_index.py
+        self._index_key = hmac.new(key, b"patient search index", "sha256").digest()
+        self._aesgcm = AESGCM(
+            hmac.new(key, b"patient record aes-gcm", "sha256").digest()
+        )
+
+    def encrypt(self, plainText):
+        return self._fernet.encrypt(plainText.encode("utf-8")).decode("utf-8")
+
+    def decrypt(self, encryptedText):
+        return self._fernet.decrypt(encryptedText.encode("utf-8")).decode("utf-8")
+
+    # binary ciphertext: version byte, nonce, AES-GCM ciphertext and tag
+    def encryptBytes(self, data):
+        nonce = os.urandom(AESGCM_NONCE_SIZE)
+        return (
+            AESGCM_VERSION + nonce + self._aesgcm.encrypt(nonce, data, AESGCM_VERSION)
+        )
+
+    def decryptBytes(self, blob):
+        version = blob[:1]
+        if version != AESGCM_VERSION:
+            raise ValueError("Unknown ciphertext version {!r}".format(version))
+        nonce = blob[1 : 1 + AESGCM_NONCE_SIZE]
+        return self._aesgcm.decrypt(nonce, blob[1 + AESGCM_NONCE_SIZE :], version)
+
+    # keyed hash of a search token, equal tokens give equal hashes
+    def blindIndex(self, token):
+        digest = hmac.new(self._index_key, token.encode("utf-8"), "sha256")
+        return digest.hexdigest()[:16]
+
+    # drops the keys, e.g. on logoff. Using the context afterwards raises
+    def clear(self):
+        self._fernet = None
+        self._index_key = None
+        self._aesgcm = None
+
+
+# returns key if it is a CryptoContext, or a new context for a key in String format
+def getCryptoContext(key):
+    if isinstance(key, CryptoContext):
+        return key
+    return CryptoContext(key)
+
+
+# takes a plain text and a CryptoContext (or the key in String format), returns encryptedText in String format
+def encryptData(plainText, key):
+    return getCryptoContext(key).encrypt(plainText)
 
 
-# takes encrypted text and the key in String format, returns plain text in String format
-def decryptData(encryptedText, keyString):
-    key = generateFernetKey(keyString.encode("utf-8"))
-    fernet = Fernet(key)
-    return fernet.decrypt(encryptedText.encode("utf-8")).decode("utf-8")
+# takes encrypted text and a CryptoContext (or the key in String format), returns plain text in String format
+def decryptData(encryptedText, key):
+    return getCryptoContext(key).decrypt(encryptedText)
@@ -0,0 +1,95 @@
+from PyQt6.QtWidgets import QMessageBox, QProgressDialog
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QFont
+
+from simulation.batch import batchItems, runBatch
+from util.cancel import CancelToken, SimulationCancelled
+
+
+# loads the patients and runs a batch simulation outside of the GUI thread
+class BatchTask(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(str)
+
+    # patients is a PatientRepository
+    def __init__(self, patients, username, crypto, num_cycles, token):
+        super().__init__()
+        self.patients = patients
+        self.username = username
+        self.crypto = crypto
+        self.num_cycles = num_cycles
+        self.token = token
+
+    def run(self):
+        try:
+            items = batchItems(
+                self.patients, self.username, self.crypto, self.num_cycles
+            )
+            self.token.check()
+            self.progress.emit(0, len(items))
+            summary = runBatch(
+                items,
+                progress=lambda finished, total, patient_id, ok: self.progress.emit(
+                    finished, total
+                ),
+                token=self.token,
+            )
+        except SimulationCancelled:
+            message = "Batch simulation cancelled. It resumes where it stopped the next time it is started."
+        except Exception as e:
+            message = "Batch simulation failed: {}".format(e)
+        else:
+            message = "{} patients simulated, {} already up to date".format(
+                summary["simulated"], summary["skipped"]
+            )
+            if summary["failed"]:
+                message += ", {} failed".format(summary["failed"])
+        finally:
+            self.patients.database.closeThreadConnection()
+        self.finished.emit(message)
+
+
+# progress dialog of a batch simulation, the batch is cancelled with the dialog
+class BatchSimulationDialog(QProgressDialog):
+    def __init__(self, patients, username, crypto, num_cycles, parent=None):
+        # busy until the number of patients is known
+        super().__init__("Loading patients...", "Cancel", 0, 0, parent)
+        self.setWindowTitle("Simulate All Patients")
+        self.setFont(QFont("Avenir", 15))
+        self.setWindowModality(Qt.WindowModality.WindowModal)
+        self.setAutoClose(False)
+        self.setAutoReset(False)
+        self.setMinimumDuration(0)
+
+        self.token = CancelToken()
+        self.canceled.connect(self.cancelBatch)
+
+        self.thread = QThread()
+        self.task = BatchTask(patients, username, crypto, num_cycles, self.token)
+        self.task.moveToThread(self.thread)
+        self.thread.started.connect(self.task.run)
+        self.task.progress.connect(self.updateProgress)
+        self.task.finished.connect(self.batchFinished)
+        self.task.finished.connect(self.thread.quit)
+        self.task.finished.connect(self.task.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.start()
+
+    def cancelBatch(self):
+        self.setLabelText("Cancelling, waiting for the running simulations...")
+        self.token.cancel()
+
+    @pyqtSlot(int, int)
+    def updateProgress(self, finished, total):
+        self.setMaximum(total)
+        self.setValue(finished)
+        self.setLabelText("Simulated {} of {} patients".format(finished, total))
+
+    @pyqtSlot(str)
+    def batchFinished(self, message):
+        self.close()
+        dlg = QMessageBox(self.parent())
+        dlg.setWindowTitle("Simulate All Patients")
+        dlg.setText(message)
+        dlg.setFont(QFont("Avenir", 15))
+        dlg.exec()
@@ -0,0 +1,42 @@
+import logging
+
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+
+# runs a password check or hash outside of the GUI thread, bcrypt takes
+# hundreds of milliseconds by design
+class BcryptTask(QObject):
+    # result, error message that can be shown to the user ("" on success)
+    finished = pyqtSignal(object, str)
+
+    def __init__(self, function, *args):
+        super().__init__()
+        self.function = function
+        self.args = args
+
+    def run(self):
+        try:
+            result = self.function(*self.args)
+        except AssertionError as msg:
+            self.finished.emit(None, str(msg))
+        except Exception as e:
+            logging.error("Password check failed: {}".format(e))
+            self.finished.emit(None, "Something went wrong, please try again")
+        else:
+            self.finished.emit(result, "")
+
+
+# starts function(*args) in a BcryptTask, slot receives its finished signal on the GUI thread
+def startBcryptTask(parent, slot, function, *args):
+    thread = QThread(parent)
+    task = BcryptTask(function, *args)
+    # the thread keeps the task alive until it is done
+    thread.task = task
+    task.moveToThread(thread)
+    thread.started.connect(task.run)
+    task.finished.connect(slot)
+    task.finished.connect(thread.quit)
+    task.finished.connect(task.deleteLater)
+    thread.finished.connect(thread.deleteLater)
+    thread.start()
+    return thread
@@ -0,0 +1,202 @@
+from PyQt6.QtWidgets import (
+    QDialog,
+    QDialogButtonBox,
+    QLabel,
+    QLineEdit,
+    QMessageBox,
+    QProgressDialog,
+    QPushButton,
+    QVBoxLayout,
+)
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QFont
+
+from util.cancel import CancelToken, SimulationCancelled
+from util.key_rotation import rotateKey
+from util.util import verifyPassword
+from widget_pages.bcrypt_task import startBcryptTask
+
+
+# re-encrypts the patients outside of the GUI thread, with a connection of its own
+class KeyRotationTask(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, database, username, old_password, new_password, token):
+        super().__init__()
+        self.database = database
+        self.username = username
+        self.old_password = old_password
+        self.new_password = new_password
+        self.token = token
+
+    def run(self):
+        ok = False
+        conn = self.database.connection()
+        try:
+            rotateKey(
+                conn,
+                self.username,
+                self.old_password,
+                self.new_password,
+                progress=self.progress.emit,
+                token=self.token,
+            )
+        except SimulationCancelled:
+            message = "Password change stopped. Change the password again with the same passwords to finish it."
+        except AssertionError as e:
+            message = str(e)
+        except Exception as e:
+            message = "Password change failed: {}. Change the password again with the same passwords to finish it.".format(
+                e
+            )
+        else:
+            ok = True
+            message = "Password changed"
+        finally:
+            self.database.closeThreadConnection()
+        self.finished.emit(ok, message)
+
+
+# progress dialog of a password change, cancelling stops after the current batch
+class KeyRotationDialog(QProgressDialog):
+    def __init__(self, database, username, old_password, new_password, parent=None):
+        super().__init__("Re-encrypting patients...", "Cancel", 0, 0, parent)
+        self.setWindowTitle("Change Password")
+        self.setFont(QFont("Avenir", 15))
+        self.setWindowModality(Qt.WindowModality.WindowModal)
+        self.setAutoClose(False)
+        self.setAutoReset(False)
+        self.setMinimumDuration(0)
+
+        self.token = CancelToken()
+        self.canceled.connect(self.cancelRotation)
+
+        self.thread = QThread()
+        self.task = KeyRotationTask(
+            database, username, old_password, new_password, self.token
+        )
+        self.task.moveToThread(self.thread)
+        self.thread.started.connect(self.task.run)
+        self.task.progress.connect(self.updateProgress)
+        self.task.finished.connect(self.rotationFinished)
+        self.task.finished.connect(self.thread.quit)
+        self.task.finished.connect(self.task.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.start()
+
+    def cancelRotation(self):
+        self.setLabelText("Stopping after the current patients...")
+        self.token.cancel()
+
+    @pyqtSlot(int, int)
+    def updateProgress(self, done, total):
+        self.setMaximum(total)
+        self.setValue(done)
+        self.setLabelText("Re-encrypted {} of {} patients".format(done, total))
+
+    @pyqtSlot(bool, str)
+    def rotationFinished(self, ok, message):
+        self.close()
+        dlg = QMessageBox(self.parent())
+        dlg.setWindowTitle("Change Password")
+        dlg.setText(message)
+        dlg.setFont(QFont("Avenir", 15))
+        dlg.exec()
+
+
+# asks for the current and new password of an oncologist
+class ChangePasswordDialog(QDialog):
+    def __init__(self, database, oncologists, username="", parent=None):
+        super().__init__(parent)
+        self.database = database
+        self.oncologists = oncologists
+        self.checkThread = None
+        # (username, old password, new password) validated by accept, see passwordChecked
+        self.pendingChange = None
+        self.setWindowTitle("Change Password")
+        self.setFont(QFont("Avenir", 15))
+        self.setMinimumWidth(400)
+        layout = QVBoxLayout(self)
+
+        self.usernameEdit = QLineEdit(username)
+        self.usernameEdit.setPlaceholderText("Username")
+        layout.addWidget(self.usernameEdit)
+
+        self.oldPasswordEdit = self.passwordEdit("Current Password")
+        layout.addWidget(self.oldPasswordEdit)
+        self.newPasswordEdit = self.passwordEdit("New Password")
+        layout.addWidget(self.newPasswordEdit)
+        self.confirmPasswordEdit = self.passwordEdit("Confirm New Password")
+        layout.addWidget(self.confirmPasswordEdit)
+
+        self.errorLabel = QLabel()
+        self.errorLabel.setStyleSheet("color:red")
+        self.errorLabel.setWordWrap(True)
+        layout.addWidget(self.errorLabel)
+
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        )
+        for button in buttons.findChildren(QPushButton):
+            button.setCursor(Qt.CursorShape.PointingHandCursor)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        if username and oncologists.pendingKeyRotation(username):
+            self.errorLabel.setText(
+                "Your last password change is not finished. Enter the same passwords to finish it."
+            )
+
+    def passwordEdit(self, placeholder):
+        edit = QLineEdit()
+        edit.setPlaceholderText(placeholder)
+        edit.setEchoMode(QLineEdit.EchoMode.Password)
+        return edit
+
+    # the current password is checked by a BcryptTask, see passwordChecked
+    def accept(self):
+        if self.checkThread is not None:
+            return
+        username = self.usernameEdit.text()
+        new_password = self.newPasswordEdit.text()
+        try:
+            row = self.oncologists.get(username)
+            assert new_password != "", "The new password must not be empty"
+            assert (
+                new_password == self.confirmPasswordEdit.text()
+            ), "The new passwords do not match"
+        except AssertionError as msg:
+            self.errorLabel.setText(str(msg))
+            return
+
+        # the passwords typed while the check runs are not the ones that were validated
+        self.pendingChange = (username, self.oldPasswordEdit.text(), new_password)
+        self.errorLabel.setText("Checking the current password...")
+        self.checkThread = startBcryptTask(
+            self, self.passwordChecked, verifyPassword, row, self.pendingChange[1]
+        )
+
+    # the result of a check still running is ignored by passwordChecked, the
+    # task may already be deleted so it is not disconnected
+    def reject(self):
+        self.checkThread = None
+        self.pendingChange = None
+        super().reject()
+
+    @pyqtSlot(object, str)
+    def passwordChecked(self, row, error):
+        self.checkThread = None
+        change, self.pendingChange = self.pendingChange, None
+        if change is None or not self.isVisible():
+            return
+        if error:
+            self.errorLabel.setText(error)
+            return
+
+        super().accept()
+        username, old_password, new_password = change
+        KeyRotationDialog(
+            self.database, username, old_password, new_password, self.parent()
+        ).show()
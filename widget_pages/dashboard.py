@@ -15,16 +15,29 @@ from PyQt6.QtWidgets import (
     QMainWindow,
 )
 from PyQt6.QtGui import QColor, QFont, QMovie
-from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtCore import Qt, pyqtSlot
 from pyqtgraph import plot
+import logging
+import numpy as np
 import pyqtgraph as pg
 
 from widget_pages.toolbar import ToolBar
-from matlab_script import runModel
+from simulation.backend import getBackend, isApproximate
+from simulation.cache import cacheKey, getSimulationCache
+from simulation.jobs import BACKGROUND, FOREGROUND
+from util.config import BATCH_NUM_CYCLES
 from util.util import clearLayout
+from widget_pages.simulation_jobs import STATUS_TEXT
 from widget_pages.sidebar import SideBar
 
 
+# runs on the query worker: getting the backend may import the MATLAB engine
+# and its version is read from git, neither is done on the GUI thread
+def loadCachedResults(patient_id, inputs):
+    cache_key = cacheKey(getBackend(), *inputs)
+    return patient_id, inputs, cache_key, getSimulationCache().get(cache_key)
+
+
 class TabShowGraph(QWidget):
     def __init__(self):
         super().__init__()
@@ -61,6 +74,24 @@ class TabShowGraph(QWidget):
         self.loadingWidget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.loadingWidget.setVisible(False)
 
+        self.simulationStatusWidget = QWidget(self)
+        self.simulationStatusLayout = QHBoxLayout(self.simulationStatusWidget)
+        self.simulationStatusLayout.setContentsMargins(0, 0, 0, 0)
+
+        self.simulationStatusLabel = QLabel(self)
+        self.simulationStatusLabel.setFont(QFont("Avenir", 15))
+        self.simulationStatusLayout.addWidget(self.simulationStatusLabel)
+        self.simulationStatusLayout.addStretch()
+
+        self.cancelButton = QPushButton("Cancel Simulation")
+        self.cancelButton.setFont(QFont("Avenir", 15))
+        self.cancelButton.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.cancelButton.setStyleSheet(
+            "background-color: #aaaaee; border-radius: 5px; padding: 10px"
+        )
+        self.simulationStatusLayout.addWidget(self.cancelButton)
+        self.simulationStatusWidget.setVisible(False)
+
         self.dosageTableWidget = QWidget()
         self.dosageTableLayout = QVBoxLayout()
         self.dosageTableWidget.setLayout(self.dosageTableLayout)
@@ -109,14 +140,24 @@ class TabShowGraph(QWidget):
 
         self.plotANCGraph()
 
+        # results of an approximate backend are labelled, see simulation/backend.py
+        if isApproximate():
+            self.approximationLabel = QLabel(
+                "Non-clinical approximation, not for treatment decisions", self
+            )
+            self.approximationLabel.setFont(QFont("Avenir", 15))
+            self.approximationLabel.setStyleSheet("color:red")
+            self.graphContainerLayout.addWidget(self.approximationLabel)
+
         self.graphContainerLayout.addWidget(self.graphWidget)
 
+        self.graphLayout.addWidget(self.simulationStatusWidget)
         self.graphLayout.addWidget(self.loadingWidget)
         self.graphLayout.addWidget(self.noResultsWidget)
         self.graphLayout.addWidget(self.graphContainer)
         self.graphLayout.addWidget(self.dosageTableWidget)
 
-        self.setGraphTableData(None, None, None, None)
+        self.setGraphTableData(None, None, None, None, None)
 
         self.anticipatory_dosage_title.setVisible(False)
         self.anticipatory_dosage_table.setVisible(False)
@@ -173,8 +214,8 @@ class TabShowGraph(QWidget):
             self.pos_plot.setData(self.day, self.boundary_positive)
         if self.neg_plot:
             self.neg_plot.setData(self.day, self.boundary_negative)
-        if self.day:
-            self.graphWidget.setXRange(0, len(self.day), padding=0)
+        if len(self.day):
+            self.graphWidget.setXRange(self.day[0], self.day[-1], padding=0)
 
     def updateDosageTable(self):
         clearLayout(self.dosageTableLayout)
@@ -183,14 +224,14 @@ class TabShowGraph(QWidget):
         self.anticipatory_dosage_title.setFont(QFont("Avenir", 15))
         self.anticipatory_dosage_title.setMargin(5)
         self.anticipatory_dosage_table = self.createTable(
-            2, len(self.anticipatory_dosage) + 1, self.anticipatory_dosage
+            2, len(self.anticipatory_dosage) + 1, self.day, self.anticipatory_dosage
         )
 
         self.reactive_dosage_title = QLabel("Reactive dosages")
         self.reactive_dosage_title.setFont(QFont("Avenir", 15))
         self.reactive_dosage_title.setMargin(5)
         self.reactive_dosage_table = self.createTable(
-            2, len(self.reactive_dosage) + 1, self.reactive_dosage
+            2, len(self.reactive_dosage) + 1, self.day, self.reactive_dosage
         )
 
         self.dosageTableLayout.addWidget(self.anticipatory_dosage_title)
@@ -198,7 +239,7 @@ class TabShowGraph(QWidget):
         self.dosageTableLayout.addWidget(self.reactive_dosage_title)
         self.dosageTableLayout.addWidget(self.reactive_dosage_table)
 
-    def createTable(self, row, column, dosages_list):
+    def createTable(self, row, column, days, dosages_list):
         self.tableWidget = QTableWidget()
 
         self.tableWidget.setStyleSheet(
@@ -227,23 +268,8 @@ class TabShowGraph(QWidget):
 
         self.tableWidget.setColumnWidth(0, 125)
 
-        for i in range(row):
-            for j in range(1, column):
-                self.tableWidget.setColumnWidth(j, 125)
-
-                if i == 0:
-                    item = QTableWidgetItem(str(j))
-                    item.setFlags(Qt.ItemFlag.ItemIsEnabled)
-                    item.setFont(QFont("Avenir", 18))
-                    item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                    item.setBackground(QColor("#bfd8d2"))
-                    self.tableWidget.setItem(i, j, item)
-                elif i == 1:
-                    item = QTableWidgetItem("{:.2f}".format(dosages_list[j - 1]))
-                    item.setFlags(Qt.ItemFlag.ItemIsEnabled)
-                    item.setFont(QFont("Avenir", 18))
-                    item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                    self.tableWidget.setItem(i, j, item)
+        for j in range(1, column):
+            self.setTableColumn(self.tableWidget, j, days[j - 1], dosages_list[j - 1])
 
         self.tableWidget.verticalHeader().setVisible(False)
         self.tableWidget.horizontalHeader().setVisible(False)
@@ -254,19 +280,69 @@ class TabShowGraph(QWidget):
         )
         return self.tableWidget
 
+    # day is the model time of the dosage, in days
+    def setTableColumn(self, table, column, day, dosage):
+        table.setColumnWidth(column, 125)
+
+        item = QTableWidgetItem("{:g}".format(day))
+        item.setFlags(Qt.ItemFlag.ItemIsEnabled)
+        item.setFont(QFont("Avenir", 18))
+        item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+        item.setBackground(QColor("#bfd8d2"))
+        table.setItem(0, column, item)
+
+        item = QTableWidgetItem("{:.2f}".format(dosage))
+        item.setFlags(Qt.ItemFlag.ItemIsEnabled)
+        item.setFont(QFont("Avenir", 18))
+        item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+        table.setItem(1, column, item)
+
+    def appendTableColumns(self, table, days, dosages_list):
+        start = table.columnCount()
+        table.setColumnCount(start + len(dosages_list))
+        for j in range(start, start + len(dosages_list)):
+            self.setTableColumn(table, j, days[j - start], dosages_list[j - start])
+
+    # appends the results of the next cycles to the graph and the dosage tables
+    def appendGraphTableData(
+        self, time, reactive_anc, anticipatory_anc, reactive_dosage, anticipatory_dosage
+    ):
+        self.day = np.concatenate((self.day, time))
+        self.reactive_anc = np.concatenate((self.reactive_anc, reactive_anc))
+        self.anticipatory_anc = np.concatenate(
+            (self.anticipatory_anc, anticipatory_anc)
+        )
+        self.reactive_dosage = np.concatenate((self.reactive_dosage, reactive_dosage))
+        self.anticipatory_dosage = np.concatenate(
+            (self.anticipatory_dosage, anticipatory_dosage)
+        )
+        self.boundary_positive = np.full(len(self.day), 2)
+        self.boundary_negative = np.full(len(self.day), 1)
+
+        self.updateANCGraph()
+        self.appendTableColumns(
+            self.anticipatory_dosage_table, time, anticipatory_dosage
+        )
+        self.appendTableColumns(self.reactive_dosage_table, time, reactive_dosage)
+
     def setGraphTableData(
-        self, reactive_anc, anticipatory_anc, reactive_dosage, anticipatory_dosage
+        self, time, reactive_anc, anticipatory_anc, reactive_dosage, anticipatory_dosage
     ):
-        # set graph and table parameters
-        if (
-            reactive_anc
-            and anticipatory_anc
-            and reactive_dosage
-            and anticipatory_dosage
+        # set graph and table parameters, the model outputs are NumPy arrays and
+        # are drawn against the time output of the model (days)
+        if all(
+            values is not None and len(values)
+            for values in (
+                time,
+                reactive_anc,
+                anticipatory_anc,
+                reactive_dosage,
+                anticipatory_dosage,
+            )
         ):
-            self.day = [i + 1 for i in range(len(reactive_anc))]
-            self.boundary_positive = [2 for _ in range(len(self.day))]
-            self.boundary_negative = [1 for _ in range(len(self.day))]
+            self.day = time
+            self.boundary_positive = np.full(len(self.day), 2)
+            self.boundary_negative = np.full(len(self.day), 1)
             self.anticipatory_anc = anticipatory_anc
             self.reactive_anc = reactive_anc
             self.anticipatory_dosage = anticipatory_dosage
@@ -291,6 +367,12 @@ class TabShowGraph(QWidget):
         self.reactive_dosage_title.setVisible(show)
         self.reactive_dosage_table.setVisible(show)
 
+    # shows a status line above the results, with a cancel button while a simulation runs
+    def showSimulationStatus(self, text, cancellable=False):
+        self.simulationStatusLabel.setText(text)
+        self.cancelButton.setVisible(cancellable)
+        self.simulationStatusWidget.setVisible(bool(text) or cancellable)
+
     def showLoadingScreen(self, show):
         self.noResultsWidget.setVisible(False)
 
@@ -314,27 +396,6 @@ class TabShowGraph(QWidget):
             self.reactive_dosage_table.setVisible(not show)
 
 
-class ModelTask(QObject):
-    returned = pyqtSignal(list)
-    finished = pyqtSignal()
-
-    def __init__(self, bsa, num_cycles, dosage, anc):
-        super().__init__()
-        self.bsa = bsa
-        self.num_cycles = num_cycles
-        self.dosage = dosage
-        self.anc = anc
-
-    def run(self):
-        print("running model for {} cycles...".format(self.num_cycles))
-        _, _, ra, aa, rd, ad = runModel(
-            self.bsa, self.num_cycles, self.dosage, self.anc
-        )
-        print("finished running model")
-        self.returned.emit([ra, aa, rd, ad])
-        self.finished.emit()
-
-
 class DashboardWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -342,9 +403,11 @@ class DashboardWindow(QWidget):
         self.patient = None
         self.displayed_patient = None
 
-        self.model_thread = None
-        self.model_task = None
-        self.simulating_patient = None
+        # simulation job shown on the graphs and how many of its chunks are displayed
+        self.displayed_job_id = None
+        self.displayed_chunks = 0
+        # patient id -> number of cycles of the last calculation of the patient
+        self.calculated_cycles = {}
 
         self.sideBarLayout = QHBoxLayout()
         self.sideBarLayout.setContentsMargins(10, 0, 10, 0)
@@ -353,6 +416,7 @@ class DashboardWindow(QWidget):
         self.sideBarLayout.addWidget(self.sideBar, 1)
 
         self.graphs = TabShowGraph()
+        self.graphs.cancelButton.clicked.connect(self.cancelSimulation)
         self.sideBarLayout.addWidget(self.graphs, 19)
 
         self.setLayout(self.sideBarLayout)
@@ -369,64 +433,185 @@ class DashboardWindow(QWidget):
     def showPatientInformationWindow(self):
         self.parent().parent().showPatientInformationWindow()
 
+    def getSimulationQueue(self):
+        return self.parent().parent().simulationJobs.queue
+
+    def getQueries(self):
+        return self.parent().parent().queries
+
     def updatePatientInfo(self, calculation_info):
         self.patient = self.parent().parent().selected_patient
+        self.getSimulationQueue().prioritize(self.patient.id)
 
-        if (
-            self.simulating_patient
-            and self.simulating_patient.user_id == self.patient.user_id
-        ):
-            self.graphs.showLoadingScreen(True)
-        else:
-            self.graphs.showLoadingScreen(False)
-            if calculation_info[0]:
-                self.graphs.toggleResults(True)
-                self.runMatLabModel(calculation_info[1])
-                self.displayed_patient = self.patient
-            elif (
-                self.displayed_patient
-                and self.displayed_patient.user_id == self.patient.user_id
-                and self.simulating_patient == None
+        self.graphs.showLoadingScreen(False)
+        self.graphs.showSimulationStatus("")
+        if calculation_info[0]:
+            self.graphs.toggleResults(True)
+            self.runMatLabModel(calculation_info[1])
+            self.displayed_patient = self.patient
+            return
+
+        job = self.getSimulationQueue().getJob(self.patient.id)
+        if job is not None:
+            if (
+                job.id != self.displayed_job_id
+                or len(job.chunks) != self.displayed_chunks
             ):
-                self.graphs.toggleResults(True)
+                self.showJob(job)
             else:
-                self.graphs.toggleResults(False)
+                self.updateJobStatus(job)
+            self.displayed_patient = self.patient
+        elif (
+            self.displayed_patient
+            and self.displayed_patient.user_id == self.patient.user_id
+        ):
+            self.graphs.toggleResults(True)
+        else:
+            self.graphs.toggleResults(False)
+            self.showCachedResults()
+
+    # called at logoff, so that the patient and its results are not kept in memory
+    def clearPatient(self):
+        self.patient = None
+        self.displayed_patient = None
+        self.displayed_job_id = None
+        self.displayed_chunks = 0
+        self.calculated_cycles.clear()
+        self.graphs.setGraphTableData(None, None, None, None, None)
+        self.graphs.showLoadingScreen(False)
+        self.graphs.showSimulationStatus("")
+        self.graphs.toggleResults(False)
+
+    # shows the cached results of the current inputs of the patient, for the
+    # number of cycles last calculated (or of the batch simulation), once they
+    # are looked up on the query worker
+    def showCachedResults(self):
+        if not self.patient.hasMeasurements():
+            return
+        num_cycles = self.calculated_cycles.get(self.patient.id, BATCH_NUM_CYCLES)
+        self.getQueries().submit(
+            "cachedResults",
+            self.cachedResultsLoaded,
+            loadCachedResults,
+            self.patient.id,
+            self.patient.modelInputs(num_cycles),
+        )
+
+    @pyqtSlot(object, str)
+    def cachedResultsLoaded(self, result, error):
+        if result is None:
+            return
+        patient_id, _, _, outputs = result
+        if outputs is None or self.patient is None or self.patient.id != patient_id:
+            return
+        t, _, ra, aa, rd, ad = outputs
+        self.graphs.setGraphTableData(t, ra, aa, rd, ad)
+        self.displayed_patient = self.patient
+        self.displayed_job_id = None
+        self.graphs.toggleResults(True)
 
     @pyqtSlot(list)
     def displayGraphTable(self, info_list):
-        self.simulating_patient = None
         self.graphs.setGraphTableData(
-            info_list[0], info_list[1], info_list[2], info_list[3]
+            info_list[0], info_list[1], info_list[2], info_list[3], info_list[4]
         )
         self.graphs.showLoadingScreen(False)
-        self.sideBar.lockButtons(False)
-        self.parent().parent().toolBar.lockLogoutButton(False)
+        self.displayed_job_id = None
+
+    # shows every chunk a job produced so far, later chunks are appended as they arrive
+    def showJob(self, job):
+        chunks = list(job.chunks)
+        if chunks:
+            t, _, ra, aa, rd, ad = (np.concatenate(parts) for parts in zip(*chunks))
+            self.graphs.setGraphTableData(t, ra, aa, rd, ad)
+        else:
+            self.graphs.setGraphTableData(None, None, None, None, None)
+        self.displayed_job_id = job.id
+        self.displayed_chunks = len(chunks)
+        self.updateJobStatus(job)
+
+    def updateJobStatus(self, job):
+        has_results = len(self.graphs.day) > 0
+        if job.isActive():
+            self.graphs.showLoadingScreen(not has_results)
+            if has_results:
+                self.graphs.toggleResults(True)
+            self.graphs.showSimulationStatus(STATUS_TEXT[job.status], cancellable=True)
+        else:
+            self.graphs.showLoadingScreen(False)
+            self.graphs.toggleResults(has_results)
+            message = job.message
+            if message and has_results:
+                message += ", showing the completed cycles"
+            self.graphs.showSimulationStatus(message)
+
+    @pyqtSlot(int, int, int)
+    def appendJobProgress(self, patient_id, job_id, index):
+        # chunks of jobs that are not displayed are picked up by showJob later
+        if job_id != self.displayed_job_id or index < self.displayed_chunks:
+            return
+        job = self.getSimulationQueue().getJob(patient_id)
+        if job is None or job.id != job_id:
+            return
+        for chunk in job.chunks[self.displayed_chunks : index + 1]:
+            t, _, ra, aa, rd, ad = chunk
+            self.graphs.appendGraphTableData(t, ra, aa, rd, ad)
+        self.displayed_chunks = index + 1
+        self.updateJobStatus(job)
+
+    @pyqtSlot(int, int, str, str)
+    def jobStatusChanged(self, patient_id, job_id, status, message):
+        if job_id != self.displayed_job_id:
+            return
+        job = self.getSimulationQueue().getJob(patient_id)
+        if job is not None and job.id == job_id:
+            self.updateJobStatus(job)
+
+    def cancelSimulation(self):
+        if self.patient is not None:
+            self.getSimulationQueue().cancel(self.patient.id)
 
     def runMatLabModel(self, num_cycles):
-        bsa = float(self.patient.bsa)
-        num_cycles = float(num_cycles + 1)
-        dosage = [float(self.patient.dosageMeasurement[-1][0])]
-        anc = [float(self.patient.ancMeasurement[-1][0])]
+        self.calculated_cycles[self.patient.id] = num_cycles
+        bsa, num_cycles, dosage, anc = self.patient.modelInputs(num_cycles)
 
         print(bsa, num_cycles, dosage, anc)
 
-        self.model_thread = QThread()
-        self.model_task = ModelTask(bsa, num_cycles, dosage, anc)
-        self.model_task.moveToThread(self.model_thread)
-
-        self.model_thread.started.connect(self.model_task.run)
-        self.model_task.returned.connect(self.displayGraphTable)
-        self.model_task.finished.connect(self.model_thread.quit)
-        self.model_task.finished.connect(self.model_task.deleteLater)
-        self.model_thread.finished.connect(self.model_thread.deleteLater)
-
-        self.model_thread.start()
-
-        self.simulating_patient = self.patient
-
+        # the model is run once its results are known not to be cached
         self.graphs.showLoadingScreen(True)
-        self.sideBar.lockButtons(True)
-        self.parent().parent().toolBar.lockLogoutButton(True)
+        self.getQueries().submit(
+            "runModel{}".format(self.patient.id),
+            self.runModel,
+            loadCachedResults,
+            self.patient.id,
+            (bsa, num_cycles, dosage, anc),
+        )
+
+    @pyqtSlot(object, str)
+    def runModel(self, result, error):
+        if result is None:
+            if self.patient is not None:
+                self.graphs.showLoadingScreen(False)
+                self.graphs.showSimulationStatus("Simulation failed")
+            return
+        patient_id, inputs, cache_key, outputs = result
+        # the user may have moved on to another patient in the meantime
+        displayed = self.patient is not None and self.patient.id == patient_id
+        if outputs is not None:
+            logging.info("using cached model results")
+            if displayed:
+                t, _, ra, aa, rd, ad = outputs
+                self.displayGraphTable([t, ra, aa, rd, ad])
+            return
+
+        job = self.getSimulationQueue().submit(
+            patient_id,
+            *inputs,
+            cache_key,
+            priority=FOREGROUND if displayed else BACKGROUND,
+        )
+        if displayed:
+            self.showJob(job)
 
     def backButtonClicked(self):
         self.showPatientListWindow()
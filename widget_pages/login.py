@@ -1,6 +1,3 @@
-import bcrypt
-import sys
-import json
 import logging
 from PyQt6.QtWidgets import (
     QLabel,
@@ -17,10 +14,11 @@ from PyQt6.QtWidgets import (
     QSizePolicy,
     QToolBar,
 )
-from PyQt6 import uic
-from PyQt6.QtCore import Qt, QSize
-from PyQt6.QtGui import QFont, QIcon
-import qtawesome as qta
+from PyQt6.QtCore import Qt, QSize, pyqtSlot
+from PyQt6.QtGui import QFont, QIcon, QMovie
+
+from util.util import CryptoContext, verifyPassword
+from widget_pages.bcrypt_task import startBcryptTask
 
 logging.getLogger().setLevel(logging.INFO)
 
@@ -181,6 +179,18 @@ class LoginWindow(QWidget):
         self.errorLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.middleLayout.addWidget(self.errorLabel)
 
+        # shown while the password is checked
+        self.loadingMovieWidget = QLabel()
+        movie = QMovie("icons/loading.gif")
+        movie.setScaledSize(QSize(40, 40))
+        self.loadingMovieWidget.setMovie(movie)
+        self.loadingMovieWidget.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.loadingMovieWidget.setVisible(False)
+        movie.start()
+        self.middleLayout.addWidget(self.loadingMovieWidget)
+        self.loginThread = None
+        self.loginCredentials = None
+
         self.loginPushButton = QPushButton("Login ")
         self.loginPushButton.setIcon(QIcon("icons/login.png"))
         self.loginPushButton.setIconSize(QSize(20, 20))
@@ -199,6 +209,16 @@ class LoginWindow(QWidget):
         self.middleLayout.addWidget(
             self.loginPushButton, alignment=Qt.AlignmentFlag.AlignCenter
         )
+
+        self.changePasswordButton = QPushButton("Change Password")
+        self.changePasswordButton.clicked.connect(self.showChangePasswordDialog)
+        self.changePasswordButton.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.changePasswordButton.setFont(QFont("Avenir", 13))
+        self.changePasswordButton.setFlat(True)
+        self.changePasswordButton.setStyleSheet("color: #5a5a5a; padding: 5px")
+        self.middleLayout.addWidget(
+            self.changePasswordButton, alignment=Qt.AlignmentFlag.AlignCenter
+        )
         self.middleLayout.addSpacerItem(self.spacer)
         self.layout.addSpacerItem(self.spacer)
 
@@ -215,31 +235,47 @@ class LoginWindow(QWidget):
             self.copyRightLabel, alignment=Qt.AlignmentFlag.AlignCenter
         )
 
+    # the password is checked by a BcryptTask, see passwordChecked
     def loginPushed(self):
+        if self.loginThread is not None:
+            return
+        username = self.usernameLineEdit.text()
+        password = self.passwordLineEdit.text()
         try:
-            username = self.usernameLineEdit.text()
-            password = self.passwordLineEdit.text()
-            passwordBytes = password.encode("utf-8")
-
-            db_conn = self.parent().parent().getDatabaseConnection()
-            res = db_conn.execute(
-                """SELECT * 
-                   FROM oncologists 
-                   WHERE username=?
-                """,
-                (username,),
-            )
-
-            row = res.fetchone()
-
-            assert (
-                row is not None and username == row[0]
-            ), "User {} does not exist".format(username)
-            assert bcrypt.checkpw(passwordBytes, row[1]), "Password is incorrect"
+            row = self.parent().parent().oncologistRepository.get(username)
         except AssertionError as msg:
-            self.errorLabel.setText(str(msg))
-            self.errorLabel.setStyleSheet("color:red")
-            logging.error(msg)
+            self.showLoginError(str(msg))
+            return
+
+        self.setLoggingIn(True)
+        self.loginCredentials = (username, password)
+        self.loginThread = startBcryptTask(
+            self, self.passwordChecked, verifyPassword, row, password
+        )
+
+    def setLoggingIn(self, loggingIn):
+        self.loginPushButton.setEnabled(not loggingIn)
+        self.loadingMovieWidget.setVisible(loggingIn)
+        if loggingIn:
+            self.errorLabel.setText("")
+
+    def showLoginError(self, msg):
+        self.errorLabel.setText(msg)
+        self.errorLabel.setStyleSheet("color:red")
+        logging.error(msg)
+
+    @pyqtSlot(object, str)
+    def passwordChecked(self, row, error):
+        username, password = self.loginCredentials
+        self.loginCredentials = None
+        self.loginThread = None
+        self.setLoggingIn(False)
+
+        oncologists = self.parent().parent().oncologistRepository
+        if not error and oncologists.pendingKeyRotation(username):
+            error = "Your password change is not finished, press Change Password to finish it"
+        if error:
+            self.showLoginError(error)
         else:
             self.errorLabel.setText("")
             self.usernameLineEdit.setFocus()
@@ -251,9 +287,23 @@ class LoginWindow(QWidget):
                 self.parent().parent().is_admin_user = False
             self.showPatientListWindow()
 
+    def showChangePasswordDialog(self):
+        # imported here, the dialog is rarely used
+        from widget_pages.change_password import ChangePasswordDialog
+
+        ChangePasswordDialog(
+            self.parent().parent().database,
+            self.parent().parent().oncologistRepository,
+            self.usernameLineEdit.text(),
+            self,
+        ).exec()
+
     def updateUser(self, username, password):
         self.parent().parent().updateUsername(username)
-        self.parent().parent().password = password
+        crypto = CryptoContext(password)
+        self.parent().parent().crypto = crypto
+        # patients saved before records or the search index are upgraded at login
+        self.parent().parent().patientRepository.upgradeRecords(username, crypto)
 
     def showPatientListWindow(self):
         self.parent().parent().showPatientListWindow()
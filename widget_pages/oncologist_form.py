@@ -1,8 +1,7 @@
-import bcrypt
 import logging
 import sqlite3
 
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QSize, pyqtSlot
 from PyQt6.QtWidgets import (
     QWidget,
     QLabel,
@@ -15,7 +14,10 @@ from PyQt6.QtWidgets import (
     QSizePolicy,
     QScrollArea,
 )
-from PyQt6.QtGui import QFont
+from PyQt6.QtGui import QFont, QMovie
+
+from util.util import hashPassword
+from widget_pages.bcrypt_task import startBcryptTask
 
 logging.getLogger().setLevel(logging.INFO)
 
@@ -180,6 +182,17 @@ class OncologistFormWindow(QWidget):
             self.errorLabel, 8, alignment=Qt.AlignmentFlag.AlignLeft
         )
 
+        # shown while the password is hashed
+        self.loadingMovieWidget = QLabel()
+        movie = QMovie("icons/loading.gif")
+        movie.setScaledSize(QSize(40, 40))
+        self.loadingMovieWidget.setMovie(movie)
+        self.loadingMovieWidget.setVisible(False)
+        movie.start()
+        self.bottomLayout.addWidget(self.loadingMovieWidget)
+        self.saveThread = None
+        self.pendingOncologist = None
+
         self.cancelButton = QPushButton("Cancel")
         self.cancelButton.clicked.connect(self.showPatientListWindow)
         self.cancelButton.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -222,26 +235,46 @@ class OncologistFormWindow(QWidget):
             self.errorLabel.setStyleSheet("color:green")
             logging.info(msg)
 
+    # the password is hashed by a BcryptTask, see passwordHashed
     def savePatientInformation(self):
-        try:
-            username = self.usernameLineEdit.text()
-            assert username != ""
-            password = self.encryptPassword(self.passwordEdit.text())
-            fullName = (
-                self.oncologistFirstNameLineEdit.text()
-                + " "
-                + self.oncologistLastNameLineEdit.text()
-            )
+        if self.saveThread is not None:
+            return
+        username = self.usernameLineEdit.text()
+        if username == "":
+            msg = "Input fields must not be empty!"
+            self.errorLabel.setText(msg)
+            self.errorLabel.setStyleSheet("color:red")
+            logging.error(msg)
+            return
+        fullName = (
+            self.oncologistFirstNameLineEdit.text()
+            + " "
+            + self.oncologistLastNameLineEdit.text()
+        )
+
+        self.setSaving(True)
+        self.pendingOncologist = (username, fullName)
+        self.saveThread = startBcryptTask(
+            self, self.passwordHashed, hashPassword, self.passwordEdit.text()
+        )
+
+    def setSaving(self, saving):
+        self.saveButton.setEnabled(not saving)
+        self.cancelButton.setEnabled(not saving)
+        self.loadingMovieWidget.setVisible(saving)
 
-            conn = self.parent().parent().getDatabaseConnection()
-            conn.execute(
-                """
-                INSERT INTO oncologists (username, password, full_name, is_admin)
-                VALUES (?, ?, ?, 'FALSE')
-                """,
-                (username, password, fullName),
+    @pyqtSlot(object, str)
+    def passwordHashed(self, password, error):
+        username, fullName = self.pendingOncologist
+        self.pendingOncologist = None
+        self.saveThread = None
+        self.setSaving(False)
+
+        try:
+            assert not error, error
+            self.parent().parent().oncologistRepository.insert(
+                username, password, fullName
             )
-            conn.commit()
 
         except sqlite3.Error as er:
             msg = "Username is taken!"
@@ -263,11 +296,6 @@ class OncologistFormWindow(QWidget):
             logging.info(msg)
             self.showPatientListWindow()
 
-    def encryptPassword(self, password):
-        bytes = password.encode("utf-8")
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(bytes, salt)
-
     def showPatientListWindow(self):
         self.errorLabel.clear()
         self.clearForm()
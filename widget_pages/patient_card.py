@@ -245,8 +245,34 @@ class PatientCard(QWidget):
         self.patient = patient
         self.displayPatientInfo()
 
+    # shown while the patient is loaded, see PatientInformationWindow.showLoading
+    def showLoading(self):
+        self.clearPatientInfo()
+        self.patientName.setText("Loading patient...")
+
+    def clearPatientInfo(self):
+        self.patient = None
+        self.patientSex = ""
+        for label in (
+            self.patientAgeV,
+            self.patientHeightV,
+            self.patientWeightV,
+            self.patientBloodV,
+            self.patientIDV,
+            self.birthdayV,
+            self.phoneNumberV,
+            self.allTypeV,
+            self.assignedDoctorV,
+            self.bodySurfaceAreaV,
+        ):
+            label.clear()
+        self.patientAvatar.setText("")
+        self.patientName.clear()
+        self.editButton.setEnabled(False)
+
     def displayPatientInfo(self):
         self.patientName.clear()
+        self.editButton.setEnabled(self.patient is not None)
 
         if self.patient is not None:
             self.patientName.setText(self.patient.name)
@@ -259,9 +285,7 @@ class PatientCard(QWidget):
             self.patientIDV.setText(str(self.patient.user_id))
             self.phoneNumberFormatter()
             self.allTypeV.setText(self.patient.allType)
-            self.assignedDoctorV.setText(
-                self.getAssignedDoctorFullName(self.patient.assignedDoctor)
-            )
+            self.showAssignedDoctorFullName(self.patient.assignedDoctor)
             self.bodySurfaceAreaV.setText(str(self.patient.bsa))
             self.birthdayV.setText(
                 datetime.strptime(self.patient.birthday, "%Y%m%d").strftime("%Y-%m-%d")
@@ -269,23 +293,24 @@ class PatientCard(QWidget):
 
             self.setSexIcon()
 
-    def getAssignedDoctorFullName(self, doctorID):
-        conn = self.parent().parent().parent().parent().db_conn
+    # the patients of the list belong to the logged in oncologist, whose name is
+    # known. Other names are read off the GUI thread, the username is shown until then
+    def showAssignedDoctorFullName(self, doctorID):
+        mainWindow = self.parent().parent().parent().parent()
+        if doctorID == mainWindow.username and mainWindow.user_full_name:
+            self.assignedDoctorV.setText(mainWindow.user_full_name)
+            return
 
-        res = conn.execute(
-            """SELECT full_name
-            FROM oncologists o
-            WHERE o.username=?
-            """,
-            (doctorID,),
+        self.assignedDoctorV.setText(doctorID)
+        mainWindow.queries.submit(
+            "assignedDoctor",
+            lambda full_name, error: self.assignedDoctorV.setText(
+                full_name or doctorID
+            ),
+            mainWindow.oncologistRepository.fullName,
+            doctorID,
         )
 
-        row = res.fetchone()
-        if row:
-            return row[0]
-        else:
-            return doctorID
-
     def calculateBodySurfaceArea(self):
         weight = self.patientWeightV.text()
         height = self.patientHeightV.text()
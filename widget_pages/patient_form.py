@@ -3,7 +3,7 @@ import math
 import sqlite3
 import numpy as np
 
-from util.util import encryptData, valid_blood_types, valid_all_types, valid_sex_types
+from util.util import valid_blood_types, valid_all_types, valid_sex_types
 
 from PyQt6.QtCore import QDate, Qt
 from PyQt6.QtWidgets import (
@@ -485,63 +485,32 @@ class PatientFormWindow(QWidget):
             assert sex in valid_sex_types
             user_id = self.createUserID(name)
 
-            conn = self.parent().parent().getDatabaseConnection()
-            patient_id = self.patient.id if self.patient else -1
-
             if not self.consentCheckBox.isChecked():
                 raise Exception("Patient must provide consent to store data")
 
+            fields = {
+                "user_id": user_id if self.patient is None else self.patient.user_id,
+                "name": name,
+                "phone_number": phoneNumber,
+                "birthday": birthday,
+                "age": age,
+                "blood_type": bloodType,
+                "all_type": allType,
+                "weight": weight,
+                "height": height,
+                "body_surface_area": bsa,
+                "sex": sex,
+            }
+            patients = self.parent().parent().patientRepository
+            crypto = self.parent().parent().crypto
             if self.patient is None:
-                password = self.parent().parent().password
-                conn.execute(
-                    """
-                        INSERT INTO patients (user_id, name, weight, height, phone_number, birthday, age, 
-                      blood_type, all_type, body_surface_area, oncologist_id, sex)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        encryptData(user_id, password),
-                        encryptData(name, password),
-                        encryptData(weight, password),
-                        encryptData(height, password),
-                        encryptData(phoneNumber, password),
-                        encryptData(birthday, password),
-                        encryptData(age, password),
-                        encryptData(bloodType, password),
-                        encryptData(allType, password),
-                        encryptData(bsa, password),
-                        self.parent().parent().username,
-                        encryptData(sex, password),
-                    ),
+                patient_id = patients.insert(
+                    self.parent().parent().username, fields, crypto
                 )
-
-                res = conn.execute("SELECT last_insert_rowid()")
-                patient_id = res.fetchone()[0]
-
             else:
-                password = self.parent().parent().password
-                conn.execute(
-                    """
-                        UPDATE patients 
-                        SET name=?, weight=?, height=?, phone_number=?, birthday=?, age=?, blood_type=?, all_type=?, body_surface_area=?, sex=? 
-                        WHERE id=?
-                    """,
-                    (
-                        encryptData(name, password),
-                        encryptData(weight, password),
-                        encryptData(height, password),
-                        encryptData(phoneNumber, password),
-                        encryptData(birthday, password),
-                        encryptData(age, password),
-                        encryptData(bloodType, password),
-                        encryptData(allType, password),
-                        encryptData(bsa, password),
-                        encryptData(sex, password),
-                        self.patient.id,
-                    ),
-                )
-
-            conn.commit()
+                patient_id = self.patient.id
+                patients.update(patient_id, fields, crypto)
+            self.parent().parent().invalidatePatient(patient_id)
 
             self.parent().parent().updateSelectedPatient(patient_id)
             self.patient = self.parent().parent().selected_patient
@@ -594,3 +563,9 @@ class PatientFormWindow(QWidget):
     def updatePatientInfo(self):
         self.patient = self.parent().parent().selected_patient
         self.displayParameters()
+
+    # called at logoff, so that the patient is not kept in memory
+    def clearPatient(self):
+        self.patient = None
+        self.nameTuple = None
+        self.displayParameters()
@@ -29,6 +29,14 @@ from widget_pages.sidebar import SideBar
 logging.getLogger().setLevel(logging.INFO)
 
 
+# local midnight of every datetime64 date, as the date axes of the graphs show local time
+def localTimestamps(dates):
+    return [
+        datetime.combine(date, datetime.min.time()).timestamp()
+        for date in dates.tolist()
+    ]
+
+
 class Label(QLabel):
     def __init__(self, text, width=400):
         super().__init__()
@@ -324,19 +332,16 @@ class PatientInformationWindow(QWidget):
         self.ancLegend.clear()
 
         if self.patient is not None:
-            self.ancMeasurementDate = [
-                datetime.strptime(str(item[1]), "%Y%m%d")
-                for item in self.patient.ancMeasurement
-            ]
-            self.ancMeasurement = [item[0] for item in self.patient.ancMeasurement]
+            self.ancMeasurementDate = localTimestamps(self.patient.measurementTimes)
+            self.ancMeasurement = self.patient.ancMeasurement.tolist()
 
             # Add legend
             if len(self.ancMeasurement) == 1:
                 pen = None
                 self.ancLine = self.graphWidgetANC.plot(
                     x=[
-                        self.ancMeasurementDate[0].timestamp(),
-                        self.ancMeasurementDate[0].timestamp() + 2628288 * 6,
+                        self.ancMeasurementDate[0],
+                        self.ancMeasurementDate[0] + 2628288 * 6,
                     ],
                     y=[self.ancMeasurement[0], self.ancMeasurement[0] + 1],
                     name="ANC Measurement",
@@ -347,7 +352,7 @@ class PatientInformationWindow(QWidget):
                 )
                 self.graphWidgetANC.clear()
                 self.ancLine = self.graphWidgetANC.plot(
-                    x=[self.ancMeasurementDate[0].timestamp()],
+                    x=[self.ancMeasurementDate[0]],
                     y=[self.ancMeasurement[0]],
                     name="ANC Measurement",
                     pen=pen,
@@ -358,7 +363,7 @@ class PatientInformationWindow(QWidget):
             else:
                 pen = pg.mkPen(color="#aaaaee", width=5)
                 self.ancLine = self.graphWidgetANC.plot(
-                    x=[x.timestamp() for x in self.ancMeasurementDate],
+                    x=self.ancMeasurementDate,
                     y=self.ancMeasurement,
                     name="ANC Measurement",
                     pen=pen,
@@ -367,19 +372,16 @@ class PatientInformationWindow(QWidget):
                     symbolBrush=("#aaaaee"),
                 )
 
-            self.dosagePrescribedDate = [
-                datetime.strptime(str(item[1]), "%Y%m%d")
-                for item in self.patient.dosageMeasurement
-            ]
-            self.dosageAmount = [item[0] for item in self.patient.dosageMeasurement]
+            self.dosagePrescribedDate = list(self.ancMeasurementDate)
+            self.dosageAmount = self.patient.dosageMeasurement.tolist()
 
             # Add legend
             if len(self.ancMeasurement) == 1:
                 pen = None
                 self.dosageLine = self.graphWidgetDosages.plot(
                     x=[
-                        self.dosagePrescribedDate[0].timestamp(),
-                        self.dosagePrescribedDate[0].timestamp() + 2628288 * 6,
+                        self.dosagePrescribedDate[0],
+                        self.dosagePrescribedDate[0] + 2628288 * 6,
                     ],
                     y=[self.dosageAmount[0], self.dosageAmount[0] + 1],
                     name="Dosage Amount Prescribed",
@@ -390,7 +392,7 @@ class PatientInformationWindow(QWidget):
                 )
                 self.graphWidgetDosages.clear()
                 self.dosageLine = self.graphWidgetDosages.plot(
-                    x=[x.timestamp() for x in self.dosagePrescribedDate],
+                    x=self.dosagePrescribedDate,
                     y=self.dosageAmount,
                     name="Dosage Amount Prescribed",
                     pen=pen,
@@ -401,7 +403,7 @@ class PatientInformationWindow(QWidget):
             else:
                 pen = pg.mkPen(color="#aaaaee", width=5)
                 self.dosageLine = self.graphWidgetDosages.plot(
-                    x=[x.timestamp() for x in self.dosagePrescribedDate],
+                    x=self.dosagePrescribedDate,
                     y=self.dosageAmount,
                     name="Dosage Amount Prescribed",
                     pen=pen,
@@ -418,17 +420,12 @@ class PatientInformationWindow(QWidget):
             ancMeasurement = float(self.ancMeasurementEdit.text())
             dosageMeasurement = float(self.dosageEdit.text())
 
-            conn = self.parent().parent().getDatabaseConnection()
             patient_id = self.patient.id if self.patient else -1
 
-            conn.execute(
-                """
-                    INSERT INTO measurements (time, anc_measurement, dosage_measurement, patient_id)
-                    VALUES (?, ?, ?, ?)
-                """,
-                (date, ancMeasurement, dosageMeasurement, patient_id),
+            self.parent().parent().measurementRepository.insertMeasurement(
+                patient_id, date, ancMeasurement, dosageMeasurement
             )
-            conn.commit()
+            self.parent().parent().invalidatePatient(patient_id)
 
             self.parent().parent().updateSelectedPatient(patient_id)
             self.patient = self.parent().parent().selected_patient
@@ -499,3 +496,27 @@ class PatientInformationWindow(QWidget):
         self.patient = self.parent().parent().selected_patient
         self.displayParameters()
         self.patientCard.getPatientInfo(self.patient)
+        self.setLoading(False)
+
+    # shown while the selected patient is loaded, see MainWindow.openPatient
+    def showLoading(self):
+        self.graphWidgetANC.clear()
+        self.graphWidgetDosages.clear()
+        self.errorLabel.clear()
+        self.patient = None
+        self.displayParameters()
+        self.patientCard.showLoading()
+        self.setLoading(True)
+
+    # called at logoff, so that the patient is not kept in memory
+    def clearPatient(self):
+        self.graphWidgetANC.clear()
+        self.graphWidgetDosages.clear()
+        self.errorLabel.clear()
+        self.patient = None
+        self.displayParameters()
+        self.patientCard.clearPatientInfo()
+
+    def setLoading(self, loading):
+        self.patientInput.setEnabled(not loading)
+        self.sideBar.dashboardButton.setEnabled(not loading)
@@ -1,5 +1,7 @@
 import logging
 import sqlite3
+import threading
+import time
 from PyQt6.QtWidgets import (
     QLabel,
     QPushButton,
@@ -14,16 +16,37 @@ from PyQt6.QtWidgets import (
     QComboBox,
     QMessageBox,
     QDialogButtonBox,
+    QInputDialog,
+)
+from PyQt6.QtCore import (
+    Qt,
+    QObject,
+    QSize,
+    QPropertyAnimation,
+    QAbstractAnimation,
+    QTimer,
+    pyqtSignal,
+    pyqtSlot,
 )
-from PyQt6.QtCore import Qt, QSize, QPropertyAnimation, QAbstractAnimation
 from PyQt6.QtGui import QFont, QIcon, QPixmap
 
+from collections import deque
 from datetime import datetime
 from enum import Enum
-from util.util import decryptData
+from util.patient_record import decryptRecordChunks
+from util.search_index import searchQuery
+from util.config import BATCH_NUM_CYCLES
+from widget_pages.batch_simulation import BatchSimulationDialog
+from widget_pages.simulation_jobs import STATUS_TEXT
 
 logging.getLogger().setLevel(logging.INFO)
 
+# time spent adding patients to the list per event loop iteration while it loads
+PATIENT_LIST_SECONDS_PER_ITERATION = 0.03
+PATIENT_LIST_GROUP_SIZE = 20
+# time after the last key press before the search index is queried
+PATIENT_SEARCH_DELAY_MS = 150
+
 
 class SearchMode(Enum):
     DEFAULT = 0
@@ -129,6 +152,11 @@ class PatientListItem(QPushButton):
         else:
             self.phone_number_label = QLabel()
 
+        self.simulation_status_label = QLabel()
+        self.simulation_status_label.setFont(QFont("Avenir", 13, italic=True))
+        self.simulation_status_label.setStyleSheet("color: #505050;")
+        self.simulation_status_label.setContentsMargins(0, 10, 5, 0)
+
         self.delete_button = QPushButton()
         self.delete_button.setIcon(QIcon("icons/delete.png"))
         self.delete_button.setIconSize(QSize(40, 40))
@@ -172,6 +200,7 @@ class PatientListItem(QPushButton):
         self.layout.addWidget(self.name_label, 0, 3, 1, 1)
         self.layout.addWidget(self.user_id_label, 1, 3, 1, 1)
         self.layout.addItem(name_spacer, 0, 4, 2, 1)
+        self.layout.addWidget(self.simulation_status_label, 0, 5, 1, 3)
         self.layout.addWidget(self.birthday_label, 1, 5, 1, 1)
         self.layout.addItem(birthday_spacer, 0, 6, 2, 1)
         self.layout.addWidget(self.phone_number_label, 1, 7, 1, 1)
@@ -194,16 +223,21 @@ class PatientListItem(QPushButton):
         self.animation.setEndValue(QSize(40, 40))
         self.animation.start()
 
+    def setSimulationStatus(self, status):
+        self.simulation_status_label.setText(STATUS_TEXT.get(status, ""))
+
     def show(self):
         self.setVisible(True)
 
     def hide(self):
         self.setVisible(False)
 
+    # the item is in a group of the list, see PatientListWindow.addToListGroup
+    def getPatientListWindow(self):
+        return self.parent().parent().parent().parent().parent()
+
     def showPatientInfo(self):
-        self.parent().parent().parent().parent().showPatientInformationWindow(
-            self.patient_id
-        )
+        self.getPatientListWindow().showPatientInformationWindow(self.patient_id)
 
     def deletePatient(self):
 
@@ -222,35 +256,57 @@ class PatientListItem(QPushButton):
         if button == QMessageBox.StandardButton.No:
             return
 
-        conn = self.parent().parent().parent().parent().getDatabaseConnection()
-
         try:
-            conn.execute(
-                "PRAGMA foreign_keys = ON"
-            )  # enable foreign key cascade on delete for the measurements table
-
             if self.is_admin:
-                conn.execute(
-                    """
-                    DELETE FROM oncologists 
-                    WHERE username=? 
-                    """,
-                    (self.user_id,),
+                self.getPatientListWindow().getOncologistRepository().delete(
+                    self.user_id
                 )
             else:
-                conn.execute(
-                    """
-                    DELETE FROM patients 
-                    WHERE id=? 
-                    """,
-                    (self.patient_id,),
+                self.getPatientListWindow().getPatientRepository().delete(
+                    self.patient_id
                 )
-            conn.commit()
+                self.getPatientListWindow().invalidatePatient(self.patient_id)
+                self.getPatientListWindow().cancelSimulation(self.patient_id)
 
         except sqlite3.Error as er:
             logging.error("Something went wrong while deleting the patient", er)
 
-        self.parent().parent().parent().parent().updatePatientList()
+        self.getPatientListWindow().updatePatientList()
+
+
+# decrypts the patient list off the GUI thread, the patients are sent back
+# chunk by chunk so that the first ones are shown right away
+class PatientListLoader(QObject):
+    # generation, [(patient id, fields)]
+    chunkReady = pyqtSignal(int, list)
+
+    def __init__(self):
+        super().__init__()
+        self.generation = 0
+
+    def load(self, rows, crypto):
+        self.generation += 1
+        generation = self.generation
+        threading.Thread(
+            target=self.decrypt, args=(rows, crypto, generation), daemon=True
+        ).start()
+        return generation
+
+    # stops sending the chunks of the current load, e.g. on logoff
+    def stop(self):
+        self.generation += 1
+
+    def decrypt(self, rows, crypto, generation):
+        chunks = decryptRecordChunks(rows, crypto)
+        try:
+            for chunk in chunks:
+                if generation != self.generation:
+                    break
+                self.chunkReady.emit(generation, chunk)
+        except Exception as e:
+            logging.error("Could not decrypt the patient list: {}".format(e))
+        finally:
+            chunks.close()
 
 
 class PatientListWindow(QWidget):
@@ -265,6 +321,19 @@ class PatientListWindow(QWidget):
         self.patients = []
         self.patient_widgets = []
 
+        self.loader = PatientListLoader()
+        self.loader.chunkReady.connect(self.appendPatients)
+        self.loading_generation = 0
+        self.pending_patients = deque()
+        self.list_group = None
+
+        # query of the patients shown, None when the whole list is shown
+        self.displayed_query = None
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(PATIENT_SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.searchPatients)
+
         self.main_box_layout = QVBoxLayout()
         self.search_bar_layout = QHBoxLayout()
 
@@ -356,6 +425,35 @@ class PatientListWindow(QWidget):
         self.search_mode_button.clicked.connect(self.setSearchMode)
         self.search_bar_layout.addWidget(self.search_mode_button)
 
+        search_bar_spacer4 = QWidget()
+        search_bar_spacer4.setFixedWidth(10)
+        self.search_bar_layout.addWidget(search_bar_spacer4)
+
+        self.simulate_all_button = QPushButton("Simulate All")
+        self.simulate_all_button.setFont(QFont("Avenir", 13))
+        self.simulate_all_button.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.simulate_all_button.setToolTip(
+            "Simulate every patient with their latest measurements"
+        )
+        self.simulate_all_button.setStyleSheet(
+            """
+            QPushButton
+            {
+                background-color: #fafafa;
+                border: 1px solid #aaaaaa;
+                border-radius: 5px;
+                padding: 10px
+            }
+
+            QPushButton:hover
+            {
+                background-color: #f0f0f0;
+            }
+            """
+        )
+        self.simulate_all_button.clicked.connect(self.simulateAllPatients)
+        self.search_bar_layout.addWidget(self.simulate_all_button)
+
         self.scroll_area = QScrollArea()
         self.scroll_area.setStyleSheet(
             """
@@ -414,15 +512,56 @@ class PatientListWindow(QWidget):
 
     def filterPatients(self):
         for widget in self.patient_widgets:
+            self.filterPatient(widget)
+        if not self.parent().parent().is_admin_user:
+            self.search_timer.start()
+
+    # shows the patients matching the search index instead of filtering the
+    # whole list, which is only complete once every patient was decrypted
+    def searchPatients(self):
+        query = searchQuery(self.filter_name, self.filter_id)
+        if query == self.displayed_query:
+            return
+        if (
+            query is not None
+            and self.displayed_query is not None
+            and all(shown in text for text, shown in zip(query, self.displayed_query))
+        ):
+            # the patients shown already include the matches of a narrower query
+            return
+
+        if query is None:
+            self.getQueryExecutor().cancel("patientSearch")
+            self.showSearchResults(query, self.patients, "")
+        else:
+            self.getQueryExecutor().submit(
+                "patientSearch",
+                lambda rows, error: self.showSearchResults(query, rows, error),
+                self.getPatientRepository().search,
+                self.parent().parent().username,
+                self.parent().parent().crypto,
+                *query
+            )
+
+    def showSearchResults(self, query, rows, error):
+        if error:
+            logging.error(error)
+            return
+        self.displayed_query = query
+        self.stopLoading()
+        self.patient_widgets.clear()
+        self.displayPatientList(rows)
+
+    def filterPatient(self, widget):
+        if (
+            self.filter_name
+            and self.filter_name.lower() not in widget.patient_name.lower()
+        ):
+            widget.hide()
+        elif self.filter_id and self.filter_id.lower() not in widget.user_id.lower():
+            widget.hide()
+        else:
             widget.show()
-        for widget in self.patient_widgets:
-            if (
-                self.filter_name
-                and self.filter_name.lower() not in widget.patient_name.lower()
-            ):
-                widget.hide()
-            if self.filter_id and self.filter_id.lower() not in widget.user_id.lower():
-                widget.hide()
 
     def showPatientFormWindow(self):
         self.parent().parent().selected_patient = None
@@ -433,84 +572,190 @@ class PatientListWindow(QWidget):
             self.parent().parent().showPatientFormWindow()
 
     def showPatientInformationWindow(self, patient_id=-1):
-        self.parent().parent().updateSelectedPatient(patient_id)
-        self.parent().parent().showPatientInformationWindow()
+        self.parent().parent().openPatient(patient_id)
+
+    def getPatientRepository(self):
+        return self.parent().parent().patientRepository
 
-    def getDatabaseConnection(self):
-        return self.parent().parent().getDatabaseConnection()
+    def getOncologistRepository(self):
+        return self.parent().parent().oncologistRepository
+
+    def getQueryExecutor(self):
+        return self.parent().parent().queries
+
+    def invalidatePatient(self, patient_id):
+        self.parent().parent().invalidatePatient(patient_id)
+
+    # precomputes the results of every patient, e.g. before clinic
+    def simulateAllPatients(self):
+        num_cycles, ok = QInputDialog.getInt(
+            self,
+            "Simulate All Patients",
+            "# calculation cycles",
+            BATCH_NUM_CYCLES,
+            1,
+            100,
+        )
+        if not ok:
+            return
+        # the patients are loaded and decrypted by the batch, off the GUI thread
+        BatchSimulationDialog(
+            self.getPatientRepository(),
+            self.parent().parent().username,
+            self.parent().parent().crypto,
+            num_cycles,
+            self,
+        ).show()
+
+    def cancelSimulation(self, patient_id):
+        self.parent().parent().simulationJobs.queue.cancel(patient_id)
+
+    # shows the progress of the background simulations next to the patients
+    def updateSimulationStatus(self, patient_id, job_id, status, message):
+        for widget in self.patient_widgets:
+            if not widget.is_admin and widget.patient_id == patient_id:
+                widget.setSimulationStatus(status)
 
     def clearStates(self):
         self.id_search_bar.clear()
         self.search_mode_button.setChecked(False)
         self.setSearchMode()
 
-    def displayPatientList(self):
+    def displayPatientList(self, rows=None):
         self.list = QWidget()
         self.list.setObjectName("PatientList")
         self.list.setStyleSheet("QWidget#PatientList { background-color: #ffffff; }")
         self.list_layout = QVBoxLayout()
+        self.list_group = None
+
+        bottom_spacer = QSpacerItem(
+            1, 1, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding
+        )
+        self.list_layout.addItem(bottom_spacer)
 
+        self.simulate_all_button.setVisible(not self.parent().parent().is_admin_user)
         if self.parent().parent().is_admin_user:
             self.name_search_bar.setPlaceholderText("Search Oncologists")
             self.id_search_bar.setPlaceholderText("Oncologist Username")
             for username, full_name in self.patients:
                 widget = PatientListItem(full_name, "", username, "", "", True)
                 self.patient_widgets.append(widget)
-                self.list_layout.addWidget(widget)
+                self.addToListGroup(widget)
         else:
             self.name_search_bar.setPlaceholderText("Search Patients")
             self.id_search_bar.setPlaceholderText("Patient ID")
-            for (
-                patient_name,
-                patient_id,
-                user_id,
-                birthday,
-                phoneNumber,
-            ) in self.patients:
-                widget = PatientListItem(
-                    decryptData(patient_name, self.parent().parent().password),
-                    patient_id,
-                    decryptData(user_id, self.parent().parent().password),
-                    decryptData(birthday, self.parent().parent().password),
-                    decryptData(phoneNumber, self.parent().parent().password),
-                )
-                self.patient_widgets.append(widget)
-                self.list_layout.addWidget(widget)
-
-        bottom_spacer = QSpacerItem(
-            1, 1, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding
-        )
-        self.list_layout.addItem(bottom_spacer)
+            # the patients are added by appendPatients as they are decrypted
+            self.pending_patients.clear()
+            self.loading_generation = self.loader.load(
+                self.patients if rows is None else rows, self.parent().parent().crypto
+            )
 
         self.list.setLayout(self.list_layout)
         self.scroll_area.setWidget(self.list)
         self.scroll_area.setWidgetResizable(True)
 
+    @pyqtSlot(int, list)
+    def appendPatients(self, generation, chunk):
+        if generation != self.loading_generation:
+            return
+        if not self.pending_patients:
+            QTimer.singleShot(0, self.addPendingPatients)
+        self.pending_patients.extend(chunk)
+
+    # building the list items is what takes time on the GUI thread, so only a
+    # few are added per event loop iteration to keep the window responsive
+    def addPendingPatients(self):
+        queue = self.parent().parent().simulationJobs.queue
+        deadline = time.perf_counter() + PATIENT_LIST_SECONDS_PER_ITERATION
+        while self.pending_patients and time.perf_counter() < deadline:
+            patient_id, fields = self.pending_patients.popleft()
+            widget = PatientListItem(
+                fields["name"],
+                patient_id,
+                fields["user_id"],
+                fields["birthday"],
+                fields["phone_number"],
+            )
+            widget.setSimulationStatus(queue.status(patient_id))
+            self.patient_widgets.append(widget)
+            # the widget must be in the list before it is filtered, or it
+            # would be shown as a window of its own
+            self.addToListGroup(widget)
+            self.filterPatient(widget)
+        if self.pending_patients:
+            QTimer.singleShot(0, self.addPendingPatients)
+
+    # the patients are added to groups of PATIENT_LIST_GROUP_SIZE items, so
+    # that adding one only lays out its group instead of the whole list
+    def addToListGroup(self, widget):
+        if (
+            self.list_group is None
+            or self.list_group.layout().count() >= PATIENT_LIST_GROUP_SIZE
+        ):
+            self.list_group = QWidget()
+            group_layout = QVBoxLayout()
+            group_layout.setContentsMargins(0, 0, 0, 0)
+            self.list_group.setLayout(group_layout)
+            # above the bottom spacer
+            self.list_layout.insertWidget(self.list_layout.count() - 1, self.list_group)
+        self.list_group.layout().addWidget(widget)
+
+    def stopLoading(self):
+        self.search_timer.stop()
+        self.loader.stop()
+        self.loading_generation = 0
+        self.pending_patients.clear()
+
+    # called at logoff, so that the decrypted rows are not kept in memory
+    def clearPatients(self):
+        self.name_search_bar.clear()
+        self.clearStates()
+        # clearing the search bars started the search timer
+        self.stopLoading()
+        self.patients = []
+        self.patient_widgets.clear()
+        self.displayed_query = None
+        self.showListMessage("")
+
+    # the rows are read off the GUI thread, see patientRowsLoaded
     def updatePatientList(self):
-        conn = self.getDatabaseConnection()
-        username = self.parent().parent().username
+        self.stopLoading()
+        # the loader may still be decrypting the old list, so it is replaced instead of cleared
+        self.patients = []
+        self.patient_widgets.clear()
+        self.displayed_query = None
+        self.clearStates()
+        self.search_timer.stop()
+        self.getQueryExecutor().cancel("patientSearch")
+        self.showListMessage("Loading...")
 
         if self.parent().parent().is_admin_user:
-            res = conn.execute(
-                """SELECT username, full_name
-                FROM oncologists o
-                WHERE o.is_admin='FALSE'
-                """
+            self.getQueryExecutor().submit(
+                "patientList",
+                self.patientRowsLoaded,
+                self.getOncologistRepository().listOncologists,
             )
         else:
-            res = conn.execute(
-                """SELECT name, id, user_id, birthday, phone_number 
-                FROM patients p 
-                INNER JOIN oncologists o ON p.oncologist_id=o.username
-                        AND o.username=?
-                """,
-                (username,),
+            self.getQueryExecutor().submit(
+                "patientList",
+                self.patientRowsLoaded,
+                self.getPatientRepository().listForOncologist,
+                self.parent().parent().username,
             )
 
-        rows = res.fetchall()
-        self.patients.clear()
-        self.patient_widgets.clear()
-        self.clearStates()
+    @pyqtSlot(object, str)
+    def patientRowsLoaded(self, rows, error):
+        if error:
+            self.showListMessage(error)
+            return
         if rows:
             self.patients = rows
         self.displayPatientList()
+
+    # replaces the list with a message, e.g. while it is loaded
+    def showListMessage(self, text):
+        label = QLabel(text)
+        label.setFont(QFont("Avenir", 18))
+        label.setStyleSheet("color: #5a5a5a; background-color: #ffffff")
+        label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.scroll_area.setWidget(label)
@@ -0,0 +1,101 @@
+import logging
+import queue
+import threading
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+# runs the database queries of the pages on a worker thread, one at a time in
+# the order they are submitted, with the worker's own connection (see
+# ConnectionManager). The result is passed to a slot on the GUI thread.
+#
+# Every query has a key naming what it loads, e.g. "selectedPatient". A query
+# replaces the one of the same key that is not finished yet, whose result is
+# dropped (or which is not run at all), so a page never shows the result of a
+# query the user already navigated away from.
+class QueryExecutor(QObject):
+    # key, request number, result, error message that can be shown to the user ("" on success)
+    finished = pyqtSignal(str, int, object, str)
+
+    def __init__(self, database):
+        super().__init__()
+        self.database = database
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.next_request = 0
+        # key -> (request number, slot) of the latest query of every key
+        self.latest = {}
+        self.worker = None
+        self.finished.connect(self.deliver)
+
+    # runs function(*args) on the worker thread, slot(result, error) is called
+    # on the GUI thread unless the query was replaced or cancelled first
+    def submit(self, key, slot, function, *args):
+        with self.lock:
+            self.next_request += 1
+            request = self.next_request
+            self.latest[key] = (request, slot)
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+        self.requests.put((key, request, function, args))
+        return request
+
+    # drops the result of the query of key that is not finished yet
+    def cancel(self, key):
+        with self.lock:
+            self.latest.pop(key, None)
+
+    def cancelAll(self):
+        with self.lock:
+            self.latest.clear()
+
+    def isPending(self, key):
+        with self.lock:
+            return key in self.latest
+
+    def isCurrent(self, key, request):
+        with self.lock:
+            latest = self.latest.get(key)
+        return latest is not None and latest[0] == request
+
+    def run(self):
+        try:
+            while True:
+                item = self.requests.get()
+                if item is None:
+                    break
+                key, request, function, args = item
+                # replaced or cancelled while it was waiting
+                if not self.isCurrent(key, request):
+                    continue
+                try:
+                    result = function(*args)
+                except Exception as e:
+                    logging.error("Query {} failed: {}".format(key, e))
+                    self.finished.emit(
+                        key, request, None, "Could not read from the database"
+                    )
+                else:
+                    self.finished.emit(key, request, result, "")
+                # no reference to the last query is kept, e.g. to a decrypted patient
+                item = args = result = None
+        finally:
+            self.database.closeThreadConnection()
+
+    @pyqtSlot(str, int, object, str)
+    def deliver(self, key, request, result, error):
+        with self.lock:
+            latest = self.latest.get(key)
+            if latest is None or latest[0] != request:
+                return
+            del self.latest[key]
+        latest[1](result, error)
+
+    # stops the worker once the queries already submitted are done
+    def shutdown(self, timeout=None):
+        self.cancelAll()
+        if self.worker is not None:
+            self.requests.put(None)
+            self.worker.join(timeout)
+            self.worker = None
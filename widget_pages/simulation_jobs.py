@@ -0,0 +1,32 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from simulation.jobs import SimulationQueue
+
+# user facing text of each job status
+STATUS_TEXT = {
+    "queued": "Simulation queued",
+    "running": "Simulation running",
+    "done": "Simulation results ready",
+    "cancelled": "",
+    "failed": "Simulation failed",
+}
+
+
+# forwards the notifications of the simulation queue to the GUI thread as Qt signals
+class SimulationJobs(QObject):
+    # patient id, job id, status, message
+    statusChanged = pyqtSignal(int, int, str, str)
+    # patient id, job id, index of the chunk of outputs added to job.chunks
+    progress = pyqtSignal(int, int, int)
+
+    def __init__(self):
+        super().__init__()
+        self.queue = SimulationQueue()
+        self.queue.addListener(self)
+
+    def jobStatusChanged(self, job):
+        self.statusChanged.emit(job.patient_id, job.id, job.status, job.message)
+
+    # the outputs are read from job.chunks by the receiver, they are not copied into the signal
+    def jobProgress(self, job, index, outputs):
+        self.progress.emit(job.patient_id, job.id, index)